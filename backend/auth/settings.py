@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -70,10 +71,16 @@ GOOGLE_CLIENT_ID = config('GOOGLE_CLIENT_ID', default='')
 if not GOOGLE_CLIENT_ID:
     raise ImproperlyConfigured('GOOGLE_CLIENT_ID environment variable is required')
 
+# klucze do weryfikacji tokenów Google (users/google_tokens.py); cache na
+# max-age z odpowiedzi Google, GOOGLE_JWKS_URL=file:///... do pracy offline
+GOOGLE_JWKS_URL = config('GOOGLE_JWKS_URL', default='https://www.googleapis.com/oauth2/v3/certs')
+GOOGLE_JWKS_CACHE = 'default'
+GOOGLE_JWKS_DEFAULT_MAX_AGE = 3600  # gdy odpowiedź nie ma Cache-Control
+GOOGLE_JWKS_MIN_REFRESH_SECONDS = 60  # ponowne pobranie po nieznanym kid najwyżej tak często
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
     'users.auth_backend.EmailAuthBackend',
 ]
 
@@ -97,19 +104,98 @@ TEMPLATES = [
 WSGI_APPLICATION = 'auth.wsgi.application'
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('knox.auth.TokenAuthentication',),
+    'DEFAULT_AUTHENTICATION_CLASSES': ('users.authentication.CachedTokenAuthentication',),
+    'DEFAULT_THROTTLE_RATES': {
+        'check_email': config('CHECK_EMAIL_THROTTLE_RATE', default='60/min'),
+    },
 }
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Profil bazy (docs/database.md):
+# 'sqlite' - plik z WAL, synchronous=NORMAL, mmap i busy timeout (users/database.py),
+#            transakcje BEGIN IMMEDIATE - równoległe zapisy czekają zamiast "database is locked"
+# 'postgresql' - psycopg 3 z pulą połączeń (requirements-postgres.txt) albo, przy
+#            DB_POOL=False, trwałe połączenia CONN_MAX_AGE ze sprawdzaniem przed użyciem
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = config('DB_POOL', default=True, cast=bool)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='audiobooks'),
+            'USER': config('DB_USER', default='audiobooks'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # pula psycopg sama utrzymuje połączenia - Django wymaga wtedy CONN_MAX_AGE=0
+            'CONN_MAX_AGE': 0 if DB_POOL else config('DB_CONN_MAX_AGE', default=600, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+                    'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+                    'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+                },
+            } if DB_POOL else {},
+        }
     }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # sekundy czekania na blokadę zapisu (sqlite3 busy timeout)
+                'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgresql', not {DB_ENGINE!r}")
+
+# PRAGMA ustawiane dla każdego nowego połączenia SQLite (users/database.py);
+# busy timeout ustawia już OPTIONS['timeout']
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'temp_store': 'MEMORY',
+    'cache_size': -64 * 1024,  # KiB (ujemne) - 64 MB
 }
 
 
+# Hashowanie haseł (users/hashers.py). PASSWORD_HASHER wybiera algorytm nowych
+# hashy; pozostałe zostają na liście, więc stare hasła nadal działają i są
+# przeliczane przy najbliższym logowaniu. Czas i CPU logowania: manage.py bench_login
+# 'scrypt' - hashlib, bez dodatkowych pakietów
+# 'argon2' - wymaga argon2-cffi (requirements-argon2.txt)
+# 'pbkdf2' - domyślny hasher Django
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='scrypt')
+PASSWORD_HASHER_CLASSES = {
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+if PASSWORD_HASHER not in PASSWORD_HASHER_CLASSES:
+    raise ImproperlyConfigured(f"PASSWORD_HASHER must be one of {', '.join(PASSWORD_HASHER_CLASSES)}, not {PASSWORD_HASHER!r}")
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+# koszt (domyślnie minima z OWASP Password Storage Cheat Sheet): scrypt n * r * 128 B
+# pamięci, liczone parallelism razy; argon2id memory_cost w KiB
+PASSWORD_SCRYPT_WORK_FACTOR = config('PASSWORD_SCRYPT_WORK_FACTOR', default=2 ** 14, cast=int)
+PASSWORD_SCRYPT_BLOCK_SIZE = config('PASSWORD_SCRYPT_BLOCK_SIZE', default=8, cast=int)
+PASSWORD_SCRYPT_PARALLELISM = config('PASSWORD_SCRYPT_PARALLELISM', default=5, cast=int)
+PASSWORD_ARGON2_TIME_COST = config('PASSWORD_ARGON2_TIME_COST', default=2, cast=int)
+PASSWORD_ARGON2_MEMORY_COST = config('PASSWORD_ARGON2_MEMORY_COST', default=19 * 1024, cast=int)
+PASSWORD_ARGON2_PARALLELISM = config('PASSWORD_ARGON2_PARALLELISM', default=1, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -159,6 +245,30 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Sposób wysyłania plików audio z /chapters/<id>/stream/ (docs/media_delivery.md):
+# 'django' - FileResponse z obsługą Range
+# 'x-accel-redirect' - nginx wysyła plik z lokalizacji internal pod MEDIA_ACCEL_REDIRECT_PREFIX
+# 'x-sendfile' - Apache mod_xsendfile / lighttpd wysyła plik po ścieżce bezwzględnej
+MEDIA_DELIVERY_MODE = config('MEDIA_DELIVERY_MODE', default='django')
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+
+# Podpisane linki do rozdziałów (users/signing.py). Klucz można współdzielić z CDN,
+# żeby weryfikował podpis na brzegu. Wymagany - SECRET_KEY jest w repozytorium.
+MEDIA_SIGNING_KEY = config('MEDIA_SIGNING_KEY', default='')
+if not MEDIA_SIGNING_KEY:
+    raise ImproperlyConfigured('MEDIA_SIGNING_KEY environment variable is required')
+MEDIA_SIGNING_TTL_SECONDS = 6 * 60 * 60
+
+# HLS w kilku bitrate'ach (users/hls.py) - wymaga lokalnego ffmpeg
+HLS_ENABLED = config('HLS_ENABLED', default=False, cast=bool)
+FFMPEG_BINARY = config('FFMPEG_BINARY', default='ffmpeg')
+HLS_BITRATES = [48, 96, 160]  # kbps, AAC
+HLS_SEGMENT_SECONDS = 6
+HLS_WORKERS = 1  # wątki kodujące przy HLS_RUNNER='thread'
+# 'command' - koduje osobny proces `manage.py build_hls --loop` (pending rozdziały)
+# 'thread' - wątki w procesie serwera; tylko przy jednym procesie (dev)
+HLS_RUNNER = config('HLS_RUNNER', default='command')
+
 # Rozmiary plików multimedialnych
 FILE_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 *1024  # 100 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 500 * 1024 * 1024  # 500 MB
@@ -168,6 +278,88 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 500 * 1024 * 1024  # 500 MB
 ALLOWED_AUDIO_EXTENSIONS = ['.mp3', '.wav', '.ogg', '.m4a', '.aac']
 ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
 
+# bufor heartbeatów odtwarzacza (users/heartbeat.py)
+PROGRESS_FLUSH_INTERVAL_SECONDS = 10
+PROGRESS_BUFFER_MAX_PENDING = 1000
+PROGRESS_FLUSH_MAX_ATTEMPTS = 3  # po tylu nieudanych zapisach pozycja z bufora jest odrzucana
+PROGRESS_BACKGROUND_FLUSH = True  # wątek zapisujący bufor co interwał, także bez nowych heartbeatów
+
+# Cache Django. Tokeny Knox, uprawnienia i generacje cache odpowiedzi są
+# unieważniane sygnałami, więc przy kilku workerach cache musi być wspólny:
+# 'locmem' - pamięć procesu; te cache są wtedy wyłączone (users/shared_cache.py),
+#            chyba że CACHE_ALLOW_PROCESS_LOCAL=True przy jednym procesie
+# 'redis' - RedisCache, CACHE_LOCATION=redis://host:6379/0 (requirements-redis.txt)
+# 'memcached' - PyMemcacheCache, CACHE_LOCATION=host:11211 (requirements-memcached.txt)
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHE_BACKEND_CLASSES = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+if CACHE_BACKEND not in CACHE_BACKEND_CLASSES:
+    raise ImproperlyConfigured(f"CACHE_BACKEND must be one of {', '.join(CACHE_BACKEND_CLASSES)}, not {CACHE_BACKEND!r}")
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND_CLASSES[CACHE_BACKEND],
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+CACHE_ALLOW_PROCESS_LOCAL = config('CACHE_ALLOW_PROCESS_LOCAL', default=False, cast=bool)
+
+# cache zakupów i biblioteki użytkownika (users/entitlements.py); ENTITLEMENTS_CACHE
+# musi być współdzielony (CACHE_BACKEND) - przy locmem zostaje tylko cache na czas żądania
+ENTITLEMENTS_CACHE = 'default'
+ENTITLEMENTS_CACHE_TTL_SECONDS = 300
+
+# cache odpowiedzi katalogu dla niezalogowanych (users/response_cache.py);
+# RESPONSE_CACHE musi być współdzielony (CACHE_BACKEND) - przy locmem jest wyłączony
+RESPONSE_CACHE_ENABLED = config('RESPONSE_CACHE_ENABLED', default=True, cast=bool)
+RESPONSE_CACHE = 'default'
+RESPONSE_CACHE_TTL_SECONDS = 600
+RESPONSE_CACHE_LOCAL_SIZE = 256  # wpisów LRU w każdym procesie
+RESPONSE_CACHE_GENERATION_CHECK_SECONDS = 1
+AUDIOBOOK_VERSION_TTL_SECONDS = 24 * 60 * 60  # wersje szczegółów audiobooka (users/conditional.py)
+
+# cache zweryfikowanych tokenów Knox (users/authentication.py); KNOX_CACHE musi
+# być współdzielony, żeby wylogowanie działało od razu - przy locmem jest wyłączony
+KNOX_CACHE = 'default'
+KNOX_CACHE_TTL_SECONDS = 300
+KNOX_REFRESH_FLUSH_SECONDS = 60  # co ile zapisywać przedłużone wygaśnięcia (AUTO_REFRESH)
+KNOX_REFRESH_BACKGROUND_FLUSH = True  # wątek zapisujący bufor co interwał, także bez nowych żądań
+
+# check-email/ przy rejestracji (users/email_check.py): krótki cache wyniku,
+# log 'users.email_check' tylko dla próbki wywołań; limit w REST_FRAMEWORK
+CHECK_EMAIL_CACHE = 'default'
+CHECK_EMAIL_CACHE_TTL_SECONDS = 30
+CHECK_EMAIL_LOG_SAMPLE_RATE = config('CHECK_EMAIL_LOG_SAMPLE_RATE', default=0.01, cast=float)
+
+# pomiary żądań (users/metrics.py): Server-Timing, log 'users.metrics' i /metrics/ (tylko admin)
+REQUEST_METRICS_ENABLED = config('REQUEST_METRICS_ENABLED', default=True, cast=bool)
+REQUEST_METRICS_SAMPLE_RATE = config('REQUEST_METRICS_SAMPLE_RATE', default=0.1, cast=float)
+REQUEST_METRICS_SERVER_TIMING = config('REQUEST_METRICS_SERVER_TIMING', default=True, cast=bool)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'users.metrics': {
+            'handlers': ['console'],
+            'level': config('REQUEST_METRICS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'users.email_check': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -176,4 +368,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
-STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
\ No newline at end of file
+STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
+
+# płatności (users/payments.py, docs/payments.md): webhook kończy zakupy,
+# wywołania API przez async httpx z limitami czasu; STRIPE_API_BASE np.
+# http://localhost:12111 dla stripe-mock
+STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='')
+STRIPE_TIMEOUT_SECONDS = config('STRIPE_TIMEOUT_SECONDS', default=10, cast=float)
+STRIPE_CONNECT_TIMEOUT_SECONDS = config('STRIPE_CONNECT_TIMEOUT_SECONDS', default=3, cast=float)
+STRIPE_MAX_NETWORK_RETRIES = config('STRIPE_MAX_NETWORK_RETRIES', default=2, cast=int)
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -84,6 +85,9 @@ class DisableMigrations:
 
 MIGRATION_MODULES = DisableMigrations()
 
+# Without migrations the search index tables come from the test runner
+TEST_RUNNER = 'tests.runner.SearchTablesTestRunner'
+
 AUTH_PASSWORD_VALIDATORS = []
 
 # Internationalization
@@ -99,25 +103,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles_test')
 # Media files configuration for tests
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media_test')
+MEDIA_SIGNING_KEY = 'media-signing-key-for-testing-only'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.CustomUser'
 
 # Authentication backends
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
     'users.auth_backend.EmailAuthBackend',
 ]
 
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'knox.auth.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
+    'DEFAULT_THROTTLE_RATES': {
+        'check_email': '60/min',
+    },
 }
 
 # Knox settings for testing
@@ -177,6 +184,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Test-specific Stripe settings (fake keys for testing)
 STRIPE_SECRET_KEY = 'sk_test_fake_key_for_testing_only'
 STRIPE_PUBLISHABLE_KEY = 'pk_test_fake_key_for_testing_only'
+STRIPE_WEBHOOK_SECRET = 'whsec_test_fake_secret_for_testing_only'
+STRIPE_MAX_NETWORK_RETRIES = 0
 
 # Test-specific Google OAuth settings
 GOOGLE_CLIENT_ID = 'fake_google_client_id_for_testing_only'
@@ -187,6 +196,12 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+# Tests run in a single process, so signal-invalidated caches may stay process-local
+CACHE_ALLOW_PROCESS_LOCAL = True
+
+# The in-memory test database is per connection; tests call flush_if_due() directly
+PROGRESS_BACKGROUND_FLUSH = False
+KNOX_REFRESH_BACKGROUND_FLUSH = False
 
 # Disable debug toolbar and other development tools in tests
 if 'debug_toolbar' in INSTALLED_APPS:
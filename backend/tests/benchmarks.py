@@ -0,0 +1,244 @@
+"""
+API benchmarks - query count, latency (p50/p95) and peak memory per endpoint
+
+Not part of the default suite (no test_ prefix). Run:
+
+    python tests/run_tests.py bench                    # 1k audiobooks
+    python tests/run_tests.py bench --scale 10k
+    python tests/run_tests.py bench --update-baseline  # write bench_baseline.json
+
+Every request runs with cold caches (entitlements, response cache, audiobook
+versions), so the numbers describe the database path. The run fails when an
+endpoint issues more queries than in the baseline, or when p50 / peak memory
+exceed the baseline by more than BENCH_LATENCY_TOLERANCE / BENCH_MEMORY_TOLERANCE
+(0 disables the check - useful on slower CI machines).
+"""
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from knox.models import AuthToken
+from rest_framework.test import APIClient
+
+from users import heartbeat, response_cache
+from users.models import Audiobook, Chapter, ListeningProgress, Purchase, Rating, UserLibrary, RATING_SCORES
+from users.seeding import SeedOptions, seed_catalog
+
+User = get_user_model()
+
+BASELINE_PATH = Path(__file__).with_name('bench_baseline.json')
+RESULTS_PATH = Path(os.environ.get('BENCH_OUTPUT', Path(__file__).with_name('bench_results.json')))
+
+SCALES = {
+    '1k': SeedOptions(audiobooks=1_000, authors=100, categories=20, users=200, write_audio=False),
+    '10k': SeedOptions(audiobooks=10_000, authors=1_000, categories=40, users=2_000, write_audio=False),
+    '100k': SeedOptions(audiobooks=100_000, authors=10_000, categories=80, users=20_000, write_audio=False),
+}
+
+BENCH_PASSWORD = 'benchpass123'
+SHELF_SIZE = 50
+# stały zapas na szum przy endpointach liczonych w pojedynczych milisekundach
+LATENCY_SLACK_MS = 5
+
+
+def seed_reader(rng):
+    """Benchmark user with full shelves, progress, ratings and purchases."""
+    reader = User.objects.create_user(email='bench@example.com', password=BENCH_PASSWORD)
+    audiobooks = list(Audiobook.objects.only('pk', 'is_premium', 'price').order_by('pk'))
+    picked = rng.sample(audiobooks, SHELF_SIZE * 2)
+    shelf, rated = picked[:SHELF_SIZE], picked[SHELF_SIZE:]
+
+    UserLibrary.objects.bulk_create([
+        UserLibrary(user=reader, audiobook=audiobook, is_favorite=i % 4 == 0) for i, audiobook in enumerate(shelf)
+    ])
+    first_chapters = dict(
+        Chapter.objects.filter(audiobook__in=shelf, chapter_number=1).values_list('audiobook_id', 'pk')
+    )
+    ListeningProgress.objects.bulk_create([
+        ListeningProgress(
+            user=reader, audiobook=audiobook, current_chapter_id=first_chapters[audiobook.pk],
+            current_position_seconds=120, is_completed=i % 5 == 0
+        )
+        for i, audiobook in enumerate(shelf[:SHELF_SIZE // 2])
+    ])
+    for audiobook in rated:
+        # zwykły create - sygnały utrzymują agregaty ocen
+        Rating.objects.create(user=reader, audiobook=audiobook, rating=rng.choice(RATING_SCORES))
+    Purchase.objects.bulk_create([
+        Purchase(
+            user=reader, audiobook=audiobook, price_paid=audiobook.price,
+            payment_status='completed' if i % 4 else 'pending'
+        )
+        for i, audiobook in enumerate(a for a in picked if a.is_premium)
+    ])
+    return reader
+
+
+def endpoints(context):
+    """(name, method, path, query params / body, authenticated) for the router endpoints in users/urls.py."""
+    audiobook, author, category, chapter = context['audiobook'], context['author'], context['category'], context['chapter']
+    return [
+        ('login', 'post', reverse('login-list'), {'email': 'bench@example.com', 'password': BENCH_PASSWORD}, False),
+        ('users-list', 'get', reverse('users-list'), {}, True),
+        ('author-list', 'get', reverse('author-list'), {}, False),
+        ('author-list-search', 'get', reverse('author-list'), {'search': 'author 1'}, False),
+        ('author-detail', 'get', reverse('author-detail', args=[author]), {}, False),
+        ('author-audiobooks', 'get', reverse('author-audiobooks', args=[author]), {}, False),
+        ('category-list', 'get', reverse('category-list'), {}, False),
+        ('category-detail', 'get', reverse('category-detail', args=[category]), {}, False),
+        ('category-audiobooks', 'get', reverse('category-audiobooks', args=[category]), {}, False),
+        ('audiobook-list', 'get', reverse('audiobook-list'), {}, False),
+        ('audiobook-list-authenticated', 'get', reverse('audiobook-list'), {}, True),
+        ('audiobook-list-search', 'get', reverse('audiobook-list'), {'search': 'dragon'}, True),
+        ('audiobook-list-rating', 'get', reverse('audiobook-list'), {'ordering': '-rating', 'min_rating': 3}, True),
+        ('audiobook-detail', 'get', reverse('audiobook-detail', args=[audiobook]), {}, True),
+        ('audiobook-chapters', 'get', reverse('audiobook-chapters', args=[audiobook]), {}, True),
+        ('audiobook-playlists', 'get', reverse('audiobook-playlists', args=[audiobook]), {}, True),
+        ('audiobook-my-purchases', 'get', reverse('audiobook-my-purchases'), {}, True),
+        ('library-list', 'get', reverse('library-list'), {}, True),
+        ('library-favorites', 'get', reverse('library-favorites'), {}, True),
+        ('library-listening', 'get', reverse('library-listening'), {}, True),
+        ('library-completed', 'get', reverse('library-completed'), {}, True),
+        ('progress-list', 'get', reverse('progress-list'), {}, True),
+        ('progress-currently-listening', 'get', reverse('progress-currently-listening'), {}, True),
+        ('progress-heartbeat', 'post', reverse('progress-heartbeat'),
+         {'audiobook_id': audiobook, 'chapter_id': chapter, 'position_seconds': 60}, True),
+        ('ratings-list', 'get', reverse('ratings-list'), {}, True),
+        ('ratings-audiobook-ratings', 'get', reverse('ratings-audiobook-ratings'), {'audiobook_id': audiobook}, True),
+        ('purchases-list', 'get', reverse('purchases-list'), {}, True),
+        ('purchases-completed', 'get', reverse('purchases-completed'), {}, True),
+        ('purchases-pending', 'get', reverse('purchases-pending'), {}, True),
+        ('purchases-total-spent', 'get', reverse('purchases-total-spent'), {}, True),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def load_baseline():
+    if BASELINE_PATH.exists():
+        return json.loads(BASELINE_PATH.read_text())
+    return {}
+
+
+def budget_failures(name, result, expected):
+    failures = []
+    if result['queries'] > expected['queries']:
+        failures.append(f"{name}: {result['queries']} queries (budget {expected['queries']})")
+
+    latency_tolerance = float(os.environ.get('BENCH_LATENCY_TOLERANCE', 2.0))
+    # budżet na p50 - p95 z kilkunastu prób to praktycznie maksimum, zbyt zaszumione
+    latency_budget = expected['p50_ms'] * latency_tolerance + LATENCY_SLACK_MS
+    if latency_tolerance and result['p50_ms'] > latency_budget:
+        failures.append(f"{name}: p50 {result['p50_ms']}ms (budget {latency_budget:.2f}ms)")
+
+    memory_tolerance = float(os.environ.get('BENCH_MEMORY_TOLERANCE', 1.5))
+    if memory_tolerance and result['peak_kb'] > expected['peak_kb'] * memory_tolerance:
+        failures.append(f"{name}: peak {result['peak_kb']}KB (budget {expected['peak_kb'] * memory_tolerance:.0f}KB)")
+    return failures
+
+
+class APIBenchmark(TestCase):
+    scale_name = os.environ.get('BENCH_SCALE', '1k')
+    iterations = int(os.environ.get('BENCH_ITERATIONS', 15))
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(SCALES[cls.scale_name])
+        cls.reader = seed_reader(random.Random(2024))
+        _, cls.token = AuthToken.objects.create(cls.reader)
+
+        # kupiony audiobook premium - rozdziały i playlisty przechodzą pełne sprawdzenie dostępu
+        audiobook = Purchase.objects.filter(
+            user=cls.reader, payment_status='completed'
+        ).select_related('audiobook').order_by('pk').first().audiobook
+        cls.context = {
+            'audiobook': audiobook.pk,
+            'author': audiobook.author_id,
+            'category': audiobook.category_id,
+            'chapter': audiobook.chapters.values_list('pk', flat=True).first(),
+        }
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.authenticated = APIClient()
+        self.authenticated.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def reset_caches(self):
+        cache.clear()
+        response_cache.reset()
+        heartbeat.progress_buffer.reset()
+
+    def request(self, method, path, params, authenticated):
+        client = self.authenticated if authenticated else self.anonymous
+        if method == 'get':
+            return client.get(path, params)
+        return client.post(path, params, format='json')
+
+    def measure(self, method, path, params, authenticated):
+        self.reset_caches()
+        # pierwsze wywołanie rozgrzewa importy/szablony i liczy zapytania
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request(method, path, params, authenticated)
+        self.assertLess(response.status_code, 400, f'{method.upper()} {path}: {response.status_code}')
+        # len() czyta queries_log na żywo, a kolejne żądania go czyszczą
+        query_count = len(queries)
+
+        timings = []
+        for _ in range(self.iterations):
+            self.reset_caches()
+            started = time.perf_counter()
+            self.request(method, path, params, authenticated)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        self.reset_caches()
+        tracemalloc.start()
+        try:
+            self.request(method, path, params, authenticated)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'queries': query_count,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'peak_kb': round(peak / 1024),
+        }
+
+    def test_endpoint_budgets(self):
+        results = {}
+        for name, method, path, params, authenticated in endpoints(self.context):
+            results[name] = self.measure(method, path, params, authenticated)
+
+        print(f"\n{'endpoint':<32}{'queries':>8}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>10}")
+        for name, result in results.items():
+            print(f"{name:<32}{result['queries']:>8}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['peak_kb']:>10}")
+
+        RESULTS_PATH.write_text(json.dumps({self.scale_name: results}, indent=2, sort_keys=True) + '\n')
+
+        baseline = load_baseline()
+        if os.environ.get('BENCH_UPDATE_BASELINE'):
+            baseline[self.scale_name] = results
+            BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+            return
+
+        expected = baseline.get(self.scale_name, {})
+        failures = []
+        for name, result in results.items():
+            if name in expected:
+                failures.extend(budget_failures(name, result, expected[name]))
+        self.assertFalse(failures, 'Budget exceeded:\n' + '\n'.join(failures))
@@ -6,9 +6,13 @@ import argparse
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def run_tests(test_category=None, coverage=False, verbose=False):
+def run_tests(test_category=None, coverage=False, verbose=False, scale=None, update_baseline=False):
 
     os.environ['DJANGO_SETTINGS_MODULE'] = 'auth.test_settings'
+    if scale:
+        os.environ['BENCH_SCALE'] = scale
+    if update_baseline:
+        os.environ['BENCH_UPDATE_BASELINE'] = '1'
 
     cmd = ['python', 'manage.py', 'test']
 
@@ -17,6 +21,7 @@ def run_tests(test_category=None, coverage=False, verbose=False):
             'models': 'tests.test_models',
             'views': 'tests.test_views', 
             'integration': 'tests.test_integration',
+            'bench': 'tests.benchmarks',
             'all': 'tests'
         }
         
@@ -67,7 +72,7 @@ def main():
     parser.add_argument(
         'category', 
         nargs='?', 
-        choices=['models', 'views', 'integration', 'all'],
+        choices=['models', 'views', 'integration', 'bench', 'all'],
         help='Test category to run (default: all)'
     )
     parser.add_argument(
@@ -80,6 +85,16 @@ def main():
         action='store_true',
         help='Verbose output'
     )
+    parser.add_argument(
+        '--scale',
+        choices=['1k', '10k', '100k'],
+        help='Catalog size for bench (default: 1k)'
+    )
+    parser.add_argument(
+        '--update-baseline',
+        action='store_true',
+        help='Write bench results to tests/bench_baseline.json instead of checking budgets'
+    )
     
     args = parser.parse_args()
     
@@ -89,7 +104,9 @@ def main():
     success = run_tests(
         test_category=args.category,
         coverage=args.coverage,
-        verbose=args.verbose
+        verbose=args.verbose,
+        scale=args.scale,
+        update_baseline=args.update_baseline
     )
     
     if not success:
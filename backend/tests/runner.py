@@ -0,0 +1,17 @@
+"""
+Test runner - creates the search index tables that migration 0016 creates in a real database
+"""
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+from users import search
+
+
+class SearchTablesTestRunner(DiscoverRunner):
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        # MIGRATION_MODULES is disabled in tests, so the RunPython step never runs
+        for alias in connections:
+            search.create_search_tables(alias)
+        return old_config
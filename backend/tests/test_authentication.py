@@ -0,0 +1,220 @@
+"""
+Authentication tests - cached Knox tokens, batched refresh, email login backend and rehashing
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import MD5PasswordHasher
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from knox.models import AuthToken
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users import authentication
+
+User = get_user_model()
+
+# drugi proces: ten sam kod i ustawienia, wspólny cache plikowy zamiast Redis
+INVALIDATE_IN_OTHER_PROCESS = """
+import sys
+import django
+django.setup()
+from django.test import override_settings
+from knox.models import AuthToken
+from django.db.models.signals import post_delete
+with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': sys.argv[1]}}):
+    post_delete.send(sender=AuthToken, instance=AuthToken(digest=sys.argv[2]))
+"""
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        authentication.refresh_buffer.reset()
+        self.user = User.objects.create_user(email='reader@example.com', password='testpass123')
+        self.auth_token, token = AuthToken.objects.create(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def get_library(self):
+        return self.client.get(reverse('library-list'))
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_library()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in queries if 'knox_authtoken' in query['sql']]
+
+    def test_second_request_skips_token_lookup(self):
+        self.assertTrue(self.token_queries())
+        self.assertEqual(self.token_queries(), [])
+
+    def test_logout_invalidates_cached_token(self):
+        self.assertEqual(self.get_library().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('knox_logout')).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_library().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_all_invalidates_every_token(self):
+        _, other_token = AuthToken.objects.create(self.user)
+        self.assertEqual(self.get_library().status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.client.get(reverse('library-list'), HTTP_AUTHORIZATION=f'Token {other_token}').status_code,
+            status.HTTP_200_OK
+        )
+
+        self.assertEqual(self.client.post(reverse('knox_logoutall')).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_library().status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(
+            self.client.get(reverse('library-list'), HTTP_AUTHORIZATION=f'Token {other_token}').status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.get_library().status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_library().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_evicted_user_version_does_not_revive_old_entry(self):
+        cache.delete(authentication.user_version_key(self.user.pk))
+        self.assertEqual(self.get_library().status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+
+        # cache wyrzucił klucz wersji, wpis tokenu sprzed dezaktywacji został
+        cache.delete(authentication.user_version_key(self.user.pk))
+        self.assertEqual(self.get_library().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_deleted_in_another_process_is_rejected(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}}
+
+        with override_settings(CACHES=shared):
+            self.assertEqual(self.get_library().status_code, status.HTTP_200_OK)
+            self.assertEqual(self.token_queries(), [])
+
+            # wylogowanie obsłużone przez inny worker: wiersz znika ze wspólnej bazy,
+            # a sygnał post_delete działa tylko w tamtym procesie
+            subprocess.run(
+                [sys.executable, '-c', INVALIDATE_IN_OTHER_PROCESS, directory.name, self.auth_token.digest],
+                check=True, cwd=settings.BASE_DIR, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'auth.test_settings'}
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM knox_authtoken WHERE digest = %s', [self.auth_token.digest])
+
+            self.assertEqual(self.get_library().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_process_local_cache_is_not_used(self):
+        with override_settings(CACHE_ALLOW_PROCESS_LOCAL=False):
+            self.assertTrue(self.token_queries())
+            self.assertTrue(self.token_queries())
+            AuthToken.objects.filter(pk=self.auth_token.pk).delete()
+            self.assertEqual(self.get_library().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_auto_refresh_writes_are_batched(self):
+        knox_settings = authentication.knox_settings
+        expiry = timezone.now() + timedelta(hours=1)
+        AuthToken.objects.filter(pk=self.auth_token.pk).update(expiry=expiry)
+
+        with mock.patch.object(knox_settings, 'AUTO_REFRESH', True), \
+                mock.patch.object(knox_settings, 'TOKEN_TTL', timedelta(hours=10)):
+            self.get_library()
+            with CaptureQueriesContext(connection) as queries:
+                self.get_library()
+                self.get_library()
+            updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "knox_authtoken"')]
+            self.assertEqual(updates, [])
+
+            self.auth_token.refresh_from_db()
+            self.assertEqual(self.auth_token.expiry, expiry)
+            self.assertEqual(authentication.refresh_buffer.flush(), 1)
+
+        self.auth_token.refresh_from_db()
+        self.assertGreater(self.auth_token.expiry, timezone.now() + timedelta(hours=9))
+
+
+    def test_idle_refresh_buffer_is_flushed(self):
+        knox_settings = authentication.knox_settings
+        AuthToken.objects.filter(pk=self.auth_token.pk).update(expiry=timezone.now() + timedelta(hours=1))
+
+        with mock.patch.object(knox_settings, 'AUTO_REFRESH', True), \
+                mock.patch.object(knox_settings, 'TOKEN_TTL', timedelta(hours=10)):
+            self.get_library()
+            self.get_library()
+        self.assertEqual(authentication.refresh_buffer.flush_if_due(), 0)
+
+        # ruch ustał - zapis robi wątek w tle
+        with override_settings(KNOX_REFRESH_FLUSH_SECONDS=0):
+            self.assertEqual(authentication.refresh_buffer.flush_if_due(), 1)
+        self.auth_token.refresh_from_db()
+        self.assertGreater(self.auth_token.expiry, timezone.now() + timedelta(hours=9))
+
+    def test_background_flusher_starts_once(self):
+        with override_settings(KNOX_REFRESH_BACKGROUND_FLUSH=True), \
+                mock.patch.object(authentication.RefreshBuffer, '_flush_periodically') as loop:
+            buffer = authentication.RefreshBuffer()
+            buffer.add(self.auth_token)
+            buffer._flusher.join()
+            buffer._flusher = mock.Mock(is_alive=mock.Mock(return_value=True))
+            buffer.add(self.auth_token)
+        self.assertEqual(loop.call_count, 1)
+
+
+class EmailAuthBackendTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='reader@example.com', password='testpass123')
+
+    def login(self, email, password):
+        return self.client.post(reverse('login-list'), {'email': email, 'password': password})
+
+    def test_failed_login_is_one_lookup_and_one_hash(self):
+        for email, password in (('reader@example.com', 'wrong'), ('nobody@example.com', 'testpass123')):
+            with mock.patch('django.contrib.auth.hashers.MD5PasswordHasher.encode', autospec=True,
+                            side_effect=MD5PasswordHasher.encode) as encode, \
+                    CaptureQueriesContext(connection) as queries:
+                response = self.login(email, password)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(len(queries), 1)
+            self.assertEqual(encode.call_count, 1)
+
+    def test_login_ignores_email_case(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.login(' Reader@EXAMPLE.com', 'testpass123')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['email'], 'reader@example.com')
+        self.assertIn('LOWER("users_customuser"."email")', queries[0]['sql'])
+
+    def test_inactive_user_cannot_log_in(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login('reader@example.com', 'testpass123').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_password_is_rehashed_on_login(self):
+        self.assertTrue(self.user.password.startswith('md5$'))
+
+        scrypt = ['users.hashers.ScryptPasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(PASSWORD_HASHERS=scrypt, PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10, PASSWORD_SCRYPT_PARALLELISM=1):
+            self.assertEqual(self.login('reader@example.com', 'testpass123').status_code, status.HTTP_200_OK)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('scrypt$1024$'))
+
+            # zmiana kosztu też przelicza hash
+            with override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 11):
+                self.assertEqual(self.login('reader@example.com', 'testpass123').status_code, status.HTTP_200_OK)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('scrypt$2048$'))
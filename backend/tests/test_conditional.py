@@ -0,0 +1,137 @@
+"""
+Conditional GET tests - ETag / Last-Modified validators without serialization
+"""
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users import conditional, response_cache
+from users.heartbeat import progress_buffer
+from users.models import Author, Category, Audiobook, Chapter, ListeningProgress, Purchase, Rating, UserLibrary
+
+User = get_user_model()
+
+
+class ConditionalGetTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        progress_buffer.reset()
+        self.addCleanup(cache.clear)
+        self.addCleanup(progress_buffer.reset)
+
+        self.user = User.objects.create_user(email='poller@example.com', password='testpass123')
+        author = Author.objects.create(name="Conditional Author")
+        category = Category.objects.create(name="Conditional Category")
+        self.audiobook = Audiobook.objects.create(
+            title='Conditional Audiobook',
+            description='Test',
+            author=author,
+            category=category,
+            narrator='Narrator',
+            publication_date=date(2023, 1, 1),
+            is_premium=True,
+            price=Decimal('9.99')
+        )
+        self.chapter = Chapter.objects.create(
+            audiobook=self.audiobook, title="One", chapter_number=1,
+            duration_seconds=1000, audio_file="one.mp3"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def assertNotModified(self, url, etag, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_currently_listening(self):
+        ListeningProgress.objects.create(
+            user=self.user, audiobook=self.audiobook,
+            current_chapter=self.chapter, current_position_seconds=10
+        )
+        url = reverse('progress-currently-listening')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        self.assertNotModified(url, etag, queries=1)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # niezapisany heartbeat też zmienia walidator
+        progress_buffer.record(self.user.pk, self.audiobook.pk, self.chapter.pk, 20)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['current_position_seconds'], 20)
+
+    def test_library(self):
+        item = UserLibrary.objects.create(user=self.user, audiobook=self.audiobook)
+        url = reverse('library-list')
+        etag = self.client.get(url)['ETag']
+
+        self.assertNotModified(url, etag, queries=1)
+
+        item.is_favorite = True
+        item.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['results'][0]['is_favorite'])
+
+    def test_audiobook_detail(self):
+        url = reverse('audiobook-detail', kwargs={'pk': self.audiobook.pk})
+        response = self.client.get(url)
+        self.assertTrue(response.data['access_denied'])
+        etag = response['ETag']
+
+        self.assertNotModified(url, etag, queries=1)
+
+        Purchase.objects.create(user=self.user, audiobook=self.audiobook, price_paid=Decimal('9.99'), payment_status='completed')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('access_denied', response.data)
+        etag = response['ETag']
+
+        Rating.objects.create(user=self.user, audiobook=self.audiobook, rating=5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['average_rating'], 5.0)
+
+    def test_anonymous_detail_validator_needs_no_queries(self):
+        self.client.force_authenticate(user=None)
+        url = reverse('audiobook-detail', kwargs={'pk': self.audiobook.pk})
+        etag = self.client.get(url)['ETag']
+
+        self.assertNotModified(url, etag, queries=0)
+
+        self.audiobook.author.name = 'Renamed'
+        self.audiobook.author.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_detail_follows_author_audiobooks_count(self):
+        Purchase.objects.create(user=self.user, audiobook=self.audiobook, price_paid=Decimal('9.99'), payment_status='completed')
+        url = reverse('audiobook-detail', kwargs={'pk': self.audiobook.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.data['author']['audiobooks_count'], 1)
+
+        Audiobook.objects.create(
+            title='Sibling', description='Test', author=self.audiobook.author, category=self.audiobook.category,
+            narrator='Narrator', publication_date=date(2023, 1, 1)
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['author']['audiobooks_count'], 2)
+        self.assertEqual(response.data['category']['audiobooks_count'], 2)
+
+    def test_unknown_audiobook_version_expires(self):
+        self.client.force_authenticate(user=None)
+        with mock.patch.object(response_cache.get_cache(), 'get_or_set', wraps=response_cache.get_cache().get_or_set) as get_or_set:
+            response = self.client.get(reverse('audiobook-detail', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        get_or_set.assert_called_once_with(conditional.audiobook_version_key('999999'), mock.ANY, timeout=conditional.get_version_ttl())
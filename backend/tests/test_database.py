@@ -0,0 +1,47 @@
+"""
+Database profile tests - SQLite PRAGMAs applied on connection_created
+"""
+import os
+import tempfile
+
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, override_settings
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+@override_settings(SQLITE_PRAGMAS=PRAGMAS)
+class SqlitePragmaTest(SimpleTestCase):
+
+    def open(self, name):
+        settings_dict = dict(connection.settings_dict, NAME=name, OPTIONS={'transaction_mode': 'IMMEDIATE'})
+        wrapper = DatabaseWrapper(settings_dict, alias='pragma_test')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_file_database_gets_wal_and_tuning(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = self.open(os.path.join(directory.name, 'profile.sqlite3'))
+
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'mmap_size'), 1024 * 1024)
+        self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)  # MEMORY
+
+    def test_memory_database_keeps_journal_mode(self):
+        wrapper = self.open(':memory:')
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'memory')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
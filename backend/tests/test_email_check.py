@@ -0,0 +1,81 @@
+"""
+Email existence check tests - normalized lookup, short-TTL cache, throttling, sampled logs
+"""
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users.throttles import CheckEmailThrottle
+
+User = get_user_model()
+
+
+class CheckEmailTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(email='taken@example.com', password='testpass123')
+
+    def check(self, email):
+        return self.client.post(reverse('check-email'), {'email': email})
+
+    def test_lookup_ignores_case_and_whitespace(self):
+        self.assertTrue(self.check(' Taken@EXAMPLE.com ').data['exists'])
+        self.assertFalse(self.check('free@example.com').data['exists'])
+
+    def test_results_are_cached(self):
+        self.check('taken@example.com')
+        self.check('free@example.com')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.check('TAKEN@example.com').data['exists'])
+            self.assertFalse(self.check('free@example.com').data['exists'])
+        self.assertEqual(len(queries), 0)
+
+    def test_registration_clears_negative_entry(self):
+        self.assertFalse(self.check('new@example.com').data['exists'])
+        response = self.client.post(reverse('register-list'), {'email': 'new@example.com', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.check('new@example.com').data['exists'])
+
+    def test_check_agrees_with_registration(self):
+        self.assertTrue(self.check('Taken@EXAMPLE.com').data['exists'])
+        response = self.client.post(reverse('register-list'), {'email': 'Taken@EXAMPLE.com', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+
+        response = self.client.post(reverse('register-list'), {'email': 'New.User@Example.com', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'new.user@example.com')
+        self.assertTrue(self.check('new.user@example.com').data['exists'])
+
+    def test_database_rejects_case_variant(self):
+        with self.assertRaises(IntegrityError):
+            User.objects.create(email='TAKEN@example.com')
+
+    def test_missing_email(self):
+        self.assertEqual(self.client.post(reverse('check-email'), {}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requests_are_throttled(self):
+        with mock.patch.object(CheckEmailThrottle, 'THROTTLE_RATES', {'check_email': '3/min'}):
+            statuses = [self.check(f'user{index}@example.com').status_code for index in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    def test_log_is_sampled_and_omits_address(self):
+        with override_settings(CHECK_EMAIL_LOG_SAMPLE_RATE=1.0), \
+                self.assertLogs('users.email_check', level='INFO') as logs:
+            self.check('taken@example.com')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line, {'event': 'check_email', 'domain': 'example.com', 'exists': True, 'cached': False, 'sample_rate': 1.0})
+        self.assertNotIn('taken@', logs.output[0])
+
+        with override_settings(CHECK_EMAIL_LOG_SAMPLE_RATE=0), \
+                self.assertNoLogs('users.email_check', level='INFO'):
+            self.check('taken@example.com')
@@ -0,0 +1,128 @@
+"""
+Entitlement cache tests - purchased / library audiobook IDs per user
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users import entitlements
+from users.models import Author, Category, Audiobook, Chapter, Purchase, UserLibrary
+
+User = get_user_model()
+
+
+class EntitlementCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        self.user = User.objects.create_user(email='entitled@example.com', password='testpass123')
+        author = Author.objects.create(name="Entitlement Author")
+        category = Category.objects.create(name="Entitlement Category")
+        self.premium = Audiobook.objects.create(
+            title='Premium Entitlement',
+            description='Test',
+            author=author,
+            category=category,
+            narrator='Narrator',
+            publication_date=date(2023, 1, 1),
+            is_premium=True,
+            price=Decimal('19.99')
+        )
+        self.free = Audiobook.objects.create(
+            title='Free Entitlement',
+            description='Test',
+            author=author,
+            category=category,
+            narrator='Narrator',
+            publication_date=date(2023, 1, 1)
+        )
+        Chapter.objects.create(
+            audiobook=self.premium, title="One", chapter_number=1,
+            duration_seconds=100, audio_file="one.mp3"
+        )
+
+    def purchase(self, payment_status='completed'):
+        return Purchase.objects.create(
+            user=self.user,
+            audiobook=self.premium,
+            price_paid=Decimal('19.99'),
+            payment_status=payment_status
+        )
+
+    def test_loads_purchases_and_library_in_one_query(self):
+        self.purchase()
+        Purchase.objects.create(user=self.user, audiobook=self.free, price_paid=0, payment_status='pending')
+        UserLibrary.objects.create(user=self.user, audiobook=self.free)
+
+        with self.assertNumQueries(1):
+            loaded = entitlements.load_entitlements(self.user.pk)
+
+        self.assertEqual(loaded.purchased, {self.premium.pk})
+        self.assertEqual(loaded.library, {self.free.pk})
+        self.assertTrue(loaded.can_access(self.free))
+        self.assertFalse(entitlements.ANONYMOUS.can_access(self.premium))
+
+    def test_shared_cache_skips_database(self):
+        self.purchase()
+        entitlements.get_user_entitlements(self.user.pk)
+
+        with self.assertNumQueries(0):
+            cached = entitlements.get_user_entitlements(self.user.pk)
+        self.assertTrue(cached.has_purchased(self.premium.pk))
+
+    def test_process_local_cache_is_not_used(self):
+        self.purchase()
+        with override_settings(CACHE_ALLOW_PROCESS_LOCAL=False):
+            entitlements.get_user_entitlements(self.user.pk)
+            with self.assertNumQueries(1):
+                entitlements.get_user_entitlements(self.user.pk)
+            Purchase.objects.filter(user=self.user).update(payment_status='failed')
+            self.assertFalse(entitlements.get_user_entitlements(self.user.pk).has_purchased(self.premium.pk))
+            # bez wspólnej wersji biblioteka nie dostaje ETag
+            self.assertIsNone(entitlements.get_version(self.user.pk))
+
+    def test_evicted_version_does_not_revive_old_entry(self):
+        self.assertFalse(entitlements.get_user_entitlements(self.user.pk).has_purchased(self.premium.pk))
+        self.purchase()
+        self.assertTrue(entitlements.get_user_entitlements(self.user.pk).has_purchased(self.premium.pk))
+
+        # cache wyrzucił klucz wersji, wpis sprzed zakupu wciąż leży w cache
+        cache.delete(entitlements.version_key(self.user.pk))
+        self.assertTrue(entitlements.get_user_entitlements(self.user.pk).has_purchased(self.premium.pk))
+
+    def test_writes_invalidate_cached_entitlements(self):
+        self.assertFalse(entitlements.get_user_entitlements(self.user.pk).has_purchased(self.premium.pk))
+
+        purchase = self.purchase()
+        self.assertTrue(entitlements.get_user_entitlements(self.user.pk).has_purchased(self.premium.pk))
+
+        library_item = UserLibrary.objects.create(user=self.user, audiobook=self.free)
+        self.assertTrue(entitlements.get_user_entitlements(self.user.pk).in_library(self.free.pk))
+
+        purchase.delete()
+        library_item.delete()
+        current = entitlements.get_user_entitlements(self.user.pk)
+        self.assertFalse(current.has_purchased(self.premium.pk))
+        self.assertFalse(current.in_library(self.free.pk))
+
+    def test_chapter_access_uses_cached_entitlements(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('audiobook-chapters', kwargs={'pk': self.premium.pk})
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.purchase()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        # audiobook + rozdziały, bez zapytania o zakup
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
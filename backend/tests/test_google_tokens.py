@@ -0,0 +1,159 @@
+"""
+Google ID token verification tests - cached JWKS keyset, key rotation, offline file keyset
+"""
+import base64
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from google.auth import crypt, jwt
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users import google_tokens
+
+User = get_user_model()
+
+
+def b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+class FakeKey:
+    """Lokalny klucz RSA podpisujący tokeny tak jak Google."""
+
+    def __init__(self, key_id):
+        self.key_id = key_id
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def jwk(self):
+        numbers = self.private_key.public_key().public_numbers()
+        return {'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': self.key_id, 'n': b64(numbers.n), 'e': b64(numbers.e)}
+
+    def sign(self, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': 'https://accounts.google.com',
+            'aud': settings.GOOGLE_CLIENT_ID,
+            'sub': '1234567890',
+            'email': 'google.user@example.com',
+            'given_name': 'Google',
+            'family_name': 'User',
+            'iat': now,
+            'exp': now + 3600,
+        }
+        payload.update(claims)
+        pem = self.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        return jwt.encode(crypt.RSASigner.from_string(pem, self.key_id), payload).decode('ascii')
+
+
+class GoogleTokenVerificationTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = FakeKey('key-1')
+        cls.rotated_key = FakeKey('key-2')
+
+    def setUp(self):
+        cache.clear()
+        self.keyset = {'keys': [self.key.jwk()]}
+        patcher = mock.patch.object(google_tokens, 'fetch_keyset', side_effect=lambda url: (self.keyset, 600))
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def verify(self, token):
+        return google_tokens.verify_google_token(token, settings.GOOGLE_CLIENT_ID)
+
+    def test_keyset_is_fetched_once(self):
+        self.assertEqual(self.verify(self.key.sign())['sub'], '1234567890')
+        self.verify(self.key.sign(sub='other'))
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_rejects_bad_audience_issuer_and_signature(self):
+        with self.assertRaises(ValueError):
+            self.verify(self.key.sign(aud='someone-else'))
+        with self.assertRaises(ValueError):
+            self.verify(self.key.sign(iss='https://evil.example.com'))
+        with self.assertRaises(ValueError):
+            self.verify(self.key.sign(exp=int(time.time()) - 600))
+
+        forged = FakeKey('key-1').sign()
+        with self.assertRaises(ValueError):
+            self.verify(forged)
+
+    def test_unknown_key_id_refetches_after_min_interval(self):
+        self.verify(self.key.sign())
+        self.keyset = {'keys': [self.key.jwk(), self.rotated_key.jwk()]}
+
+        # świeży zestaw - nieznany kid nie powoduje ponownego pobrania
+        with self.assertRaises(ValueError):
+            self.verify(self.rotated_key.sign())
+        self.assertEqual(self.fetch.call_count, 1)
+
+        with override_settings(GOOGLE_JWKS_MIN_REFRESH_SECONDS=0):
+            self.assertEqual(self.verify(self.rotated_key.sign())['sub'], '1234567890')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_cache_timeout_follows_max_age(self):
+        self.assertEqual(google_tokens.parse_max_age('public, max-age=19774, must-revalidate, no-transform'), 19774)
+        with override_settings(GOOGLE_JWKS_DEFAULT_MAX_AGE=120):
+            self.assertEqual(google_tokens.parse_max_age(None), 120)
+
+        self.fetch.side_effect = lambda url: (self.keyset, 0)
+        self.verify(self.key.sign())
+        self.verify(self.key.sign())
+        self.assertEqual(self.fetch.call_count, 2)
+
+
+class GoogleAuthViewTest(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = FakeKey('offline-key')
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'jwks.json')
+        with open(path, 'w', encoding='utf-8') as handle:
+            json.dump({'keys': [self.key.jwk()]}, handle)
+
+        # zestaw kluczy z pliku - bez sieci
+        jwks_settings = override_settings(GOOGLE_JWKS_URL=f'file://{path}')
+        jwks_settings.enable()
+        self.addCleanup(jwks_settings.disable)
+
+    def test_login_with_offline_keyset(self):
+        response = self.client.post(reverse('google_auth'), {'token': self.key.sign()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['created'])
+        self.assertIn('token', response.data)
+        self.assertTrue(User.objects.filter(email='google.user@example.com', google_id='1234567890').exists())
+
+        response = self.client.post(reverse('google_auth'), {'token': self.key.sign()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['created'])
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.post(reverse('google_auth'), {'token': 'not-a-jwt'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('google_auth'), {'token': self.key.sign(aud='other-app')}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,216 @@
+"""
+Progress heartbeat tests - buffered playback position writes
+"""
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users import heartbeat
+from users.heartbeat import progress_buffer
+from users.models import Author, Category, Audiobook, Chapter, ListeningProgress
+
+User = get_user_model()
+
+
+class ProgressHeartbeatTest(APITestCase):
+
+    def setUp(self):
+        progress_buffer.reset()
+        self.addCleanup(progress_buffer.reset)
+
+        self.user = User.objects.create_user(email='heartbeat@example.com', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        author = Author.objects.create(name="Heartbeat Author")
+        category = Category.objects.create(name="Heartbeat Category")
+        self.audiobook = Audiobook.objects.create(
+            title='Heartbeat Audiobook',
+            description='Test',
+            author=author,
+            category=category,
+            narrator='Narrator',
+            duration_minutes=60,
+            publication_date=date(2023, 1, 1)
+        )
+        self.chapter_one = Chapter.objects.create(
+            audiobook=self.audiobook, title="One", chapter_number=1,
+            duration_seconds=1000, audio_file="one.mp3"
+        )
+        self.chapter_two = Chapter.objects.create(
+            audiobook=self.audiobook, title="Two", chapter_number=2,
+            duration_seconds=1000, audio_file="two.mp3"
+        )
+        self.url = reverse('progress-heartbeat')
+
+    def beat(self, chapter, position):
+        return self.client.post(self.url, {
+            'audiobook_id': self.audiobook.pk,
+            'chapter_id': chapter.pk,
+            'position_seconds': position
+        })
+
+    def test_first_heartbeat_creates_progress(self):
+        response = self.beat(self.chapter_one, 10)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        progress = ListeningProgress.objects.get(user=self.user)
+        self.assertEqual(progress.current_position_seconds, 10)
+
+    def test_heartbeats_are_buffered_and_merged_on_read(self):
+        self.beat(self.chapter_one, 10)
+
+        with self.assertNumQueries(0):
+            self.beat(self.chapter_one, 40)
+
+        self.assertEqual(ListeningProgress.objects.get(user=self.user).current_position_seconds, 10)
+
+        response = self.client.get(reverse('progress-currently-listening'))
+        self.assertEqual(response.data[0]['current_position_seconds'], 40)
+        self.assertEqual(response.data[0]['progress_percentage'], 2.0)
+
+        self.assertEqual(progress_buffer.flush(), 1)
+        self.assertEqual(ListeningProgress.objects.get(user=self.user).current_position_seconds, 40)
+
+    def test_chapter_change_flushes_immediately(self):
+        self.beat(self.chapter_one, 10)
+        self.beat(self.chapter_one, 500)
+        self.beat(self.chapter_two, 5)
+
+        progress = ListeningProgress.objects.get(user=self.user)
+        self.assertEqual(progress.current_chapter, self.chapter_two)
+        self.assertEqual(progress.current_position_seconds, 5)
+
+    def test_chapter_from_other_audiobook_is_rejected(self):
+        other = Audiobook.objects.create(
+            title='Other', description='Other', author=self.audiobook.author,
+            category=self.audiobook.category, narrator='Narrator',
+            duration_minutes=10, publication_date=date(2023, 1, 1)
+        )
+        response = self.client.post(self.url, {
+            'audiobook_id': other.pk,
+            'chapter_id': self.chapter_one.pk,
+            'position_seconds': 1
+        })
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_explicit_update_discards_buffered_position(self):
+        self.beat(self.chapter_one, 10)
+        self.beat(self.chapter_one, 40)
+
+        self.client.post(reverse('progress-update-progress'), {
+            'audiobook_id': self.audiobook.pk,
+            'chapter_id': self.chapter_two.pk,
+            'position_seconds': 7
+        })
+        progress_buffer.flush()
+
+        progress = ListeningProgress.objects.get(user=self.user)
+        self.assertEqual(progress.current_chapter, self.chapter_two)
+        self.assertEqual(progress.current_position_seconds, 7)
+
+    def test_idle_buffer_is_flushed_without_new_heartbeats(self):
+        self.beat(self.chapter_one, 10)
+        self.beat(self.chapter_one, 40)
+        self.assertEqual(progress_buffer.flush_if_due(), 0)
+
+        # słuchacz przestał wysyłać heartbeaty - zapis robi wątek w tle
+        with override_settings(PROGRESS_FLUSH_INTERVAL_SECONDS=0):
+            self.assertEqual(progress_buffer.flush_if_due(), 1)
+        self.assertEqual(ListeningProgress.objects.get(user=self.user).current_position_seconds, 40)
+
+    def test_background_flusher_starts_once(self):
+        with override_settings(PROGRESS_BACKGROUND_FLUSH=True), \
+                mock.patch.object(heartbeat.ProgressBuffer, '_flush_periodically') as loop:
+            buffer = heartbeat.ProgressBuffer()
+            buffer.record(self.user.pk, self.audiobook.pk, self.chapter_one.pk, 1)
+            buffer._flusher.join()
+            buffer._flusher = mock.Mock(is_alive=mock.Mock(return_value=True))
+            buffer.record(self.user.pk, self.audiobook.pk, self.chapter_one.pk, 2)
+        self.assertEqual(loop.call_count, 1)
+
+    def test_chapter_change_writes_only_its_own_entry(self):
+        other_user = User.objects.create_user(email='other-listener@example.com', password='testpass123')
+        progress_buffer.record(other_user.pk, self.audiobook.pk, self.chapter_one.pk, 10)
+        progress_buffer.flush()
+        progress_buffer.record(other_user.pk, self.audiobook.pk, self.chapter_one.pk, 99)
+
+        self.beat(self.chapter_one, 10)
+        self.beat(self.chapter_two, 5)
+        self.assertEqual(ListeningProgress.objects.get(user=self.user).current_position_seconds, 5)
+        self.assertEqual(ListeningProgress.objects.get(user=other_user).current_position_seconds, 10)
+        self.assertEqual(progress_buffer.pending(other_user.pk, self.audiobook.pk).position_seconds, 99)
+
+    def test_evicted_chapter_cache_does_not_flush_everything(self):
+        with override_settings(PROGRESS_BUFFER_MAX_PENDING=1000):
+            for user_id in range(1, 10001):
+                progress_buffer._chapters[(user_id + 10 ** 6, self.audiobook.pk)] = self.chapter_one.pk
+            progress_buffer.record(10 ** 6 + 5, self.audiobook.pk, self.chapter_one.pk, 1)
+            self.assertEqual(len(progress_buffer._chapters), 10000)
+            self.assertEqual(
+                progress_buffer.record(10 ** 6 + 5, self.audiobook.pk, self.chapter_one.pk, 2), heartbeat.FLUSH_NONE
+            )
+
+    def test_deleted_chapter_and_audiobook_leave_the_buffer(self):
+        self.beat(self.chapter_one, 10)
+        self.beat(self.chapter_one, 40)
+        self.chapter_one.delete()
+        self.assertIsNone(progress_buffer.pending(self.user.pk, self.audiobook.pk))
+        self.assertNotIn(self.chapter_one.pk, progress_buffer._chapter_audiobooks)
+
+        self.beat(self.chapter_two, 5)
+        self.beat(self.chapter_two, 50)
+        self.audiobook.delete()
+        self.assertEqual(progress_buffer._pending, {})
+        self.assertEqual(progress_buffer._chapters, {})
+        self.assertEqual(progress_buffer._chapter_audiobooks, {})
+
+    def test_row_inserted_by_another_worker_is_updated(self):
+        progress_buffer.record(self.user.pk, self.audiobook.pk, self.chapter_one.pk, 40)
+        ListeningProgress.objects.create(
+            user=self.user, audiobook=self.audiobook, current_chapter=self.chapter_one, current_position_seconds=10
+        )
+        # bufor nie widzi wiersza, który inny worker dodał między odczytem a zapisem
+        with mock.patch.object(ListeningProgress.objects, 'filter', return_value=ListeningProgress.objects.none()):
+            self.assertEqual(progress_buffer.flush(), 1)
+        self.assertEqual(ListeningProgress.objects.get(user=self.user).current_position_seconds, 40)
+
+
+class ProgressFlushFailureTest(TransactionTestCase):
+    # klucze obce SQLite są sprawdzane przy commicie - potrzebne prawdziwe transakcje
+
+    def setUp(self):
+        progress_buffer.reset()
+        self.addCleanup(progress_buffer.reset)
+
+        self.users = [
+            User.objects.create_user(email=f'listener{index}@example.com', password='testpass123') for index in range(2)
+        ]
+        author = Author.objects.create(name="Flush Author")
+        category = Category.objects.create(name="Flush Category")
+        self.audiobook = Audiobook.objects.create(
+            title='Flush Audiobook', description='Test', author=author, category=category,
+            narrator='Narrator', duration_minutes=60, publication_date=date(2023, 1, 1)
+        )
+        self.chapter = Chapter.objects.create(
+            audiobook=self.audiobook, title="One", chapter_number=1, duration_seconds=1000, audio_file="one.mp3"
+        )
+
+    def test_bad_entry_does_not_block_others_and_is_dropped(self):
+        # audiobook usunięty w innym workerze - sygnał nie wyczyścił tego bufora
+        missing_audiobook = self.audiobook.pk + 1000
+        progress_buffer.record(self.users[0].pk, missing_audiobook, self.chapter.pk, 10)
+        progress_buffer.record(self.users[1].pk, self.audiobook.pk, self.chapter.pk, 20)
+
+        with override_settings(PROGRESS_FLUSH_MAX_ATTEMPTS=2), self.assertLogs('users.heartbeat', level='WARNING'):
+            self.assertEqual(progress_buffer.flush(), 1)
+            self.assertEqual(ListeningProgress.objects.get(user=self.users[1]).current_position_seconds, 20)
+            self.assertEqual(progress_buffer.pending(self.users[0].pk, missing_audiobook).attempts, 1)
+
+            self.assertEqual(progress_buffer.flush(), 0)
+        self.assertEqual(progress_buffer._pending, {})
+        self.assertEqual(ListeningProgress.objects.count(), 1)
@@ -53,7 +53,7 @@ class CompleteUserJourneyTest(APITestCase):
         browse_url = reverse('audiobook-list')
         response = self.client.get(browse_url)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
         library_url = reverse('library-add-audiobook')
         response = self.client.post(library_url, {'audiobook_id': audiobook.pk})
@@ -78,7 +78,7 @@ class CompleteUserJourneyTest(APITestCase):
         library_list_url = reverse('library-list')
         response = self.client.get(library_list_url)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
 
 class PremiumContentWorkflowTest(APITestCase):
@@ -0,0 +1,87 @@
+"""
+Request metrics tests - Server-Timing, structured log lines and /metrics/
+"""
+import json
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import serializers, status
+from rest_framework.test import APITestCase
+
+from users import metrics
+from users.models import Author, Category, Audiobook
+
+User = get_user_model()
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0, RESPONSE_CACHE_ENABLED=False)
+class RequestMetricsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+        author = Author.objects.create(name="Metrics Author")
+        category = Category.objects.create(name="Metrics Category")
+        Audiobook.objects.create(
+            title='Measured Audiobook',
+            description='Test',
+            author=author,
+            category=category,
+            narrator='Narrator',
+            publication_date=date(2023, 1, 1)
+        )
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('users.metrics', level='INFO') as logs:
+            response = self.client.get(reverse('audiobook-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('serializer;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['view'], 'audiobook-list')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['db_queries'], 2)
+        self.assertIn(f'desc="{line["db_queries"]} queries"', timing)
+        self.assertEqual(line['response_bytes'], len(response.content))
+        self.assertGreater(line['serializer_ms'], 0)
+
+    def test_serializers_are_not_patched(self):
+        """Timing lives in the views; DRF classes keep their own .data."""
+        self.assertIs(serializers.Serializer.data, vars(serializers.Serializer)['data'])
+        self.assertEqual(serializers.Serializer.data.fget.__module__, 'rest_framework.serializers')
+        self.assertEqual(serializers.ListSerializer.data.fget.__module__, 'rest_framework.serializers')
+
+    def test_sampling_can_skip_requests(self):
+        with override_settings(REQUEST_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(reverse('audiobook-list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(metrics.registry.snapshot(), {})
+
+    def test_prometheus_endpoint_is_admin_only(self):
+        self.client.get(reverse('audiobook-list'))
+        self.client.get(reverse('audiobook-list'))
+        url = reverse('request-metrics')
+
+        self.client.force_authenticate(user=User.objects.create_user(email='reader@example.com', password='testpass123'))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=User.objects.create_superuser(email='admin@example.com', password='testpass123'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+        body = response.content.decode()
+        labels = 'view="audiobook-list",method="GET",status="200"'
+        self.assertIn(f'audiobooks_http_requests_total{{{labels}}} 2', body)
+        self.assertIn(f'audiobooks_db_queries_total{{{labels}}} 4', body)
+        self.assertIn(f'audiobooks_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn('# TYPE audiobooks_http_request_duration_seconds histogram', body)
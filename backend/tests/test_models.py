@@ -1,7 +1,14 @@
 """
 Model tests - organized and clean
 """
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+import wave
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
@@ -143,6 +150,47 @@ class UserInteractionModelTest(TestCase):
         )
         self.assertEqual(progress.current_position_seconds, 600)
         self.assertFalse(progress.is_completed)
+
+    def test_chapter_offsets_follow_chapter_changes(self):
+        second = Chapter.objects.create(
+            audiobook=self.audiobook,
+            title="Second Chapter",
+            chapter_number=2,
+            duration_seconds=1200,
+            audio_file="test_audio_2.mp3"
+        )
+        self.audiobook.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(self.audiobook.total_duration_seconds, 3000)
+        self.assertEqual(second.start_offset_seconds, 1800)
+
+        self.chapter.delete()
+        self.audiobook.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(self.audiobook.total_duration_seconds, 1200)
+        self.assertEqual(second.start_offset_seconds, 0)
+
+    def test_progress_percentage_matches_annotation(self):
+        second = Chapter.objects.create(
+            audiobook=self.audiobook,
+            title="Second Chapter",
+            chapter_number=2,
+            duration_seconds=1200,
+            audio_file="test_audio_2.mp3"
+        )
+        ListeningProgress.objects.create(
+            user=self.user,
+            audiobook=self.audiobook,
+            current_chapter=second,
+            current_position_seconds=600
+        )
+
+        progress = ListeningProgress.objects.select_related('audiobook', 'current_chapter').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(progress.progress_percentage, 80.0)
+
+        annotated = ListeningProgress.objects.with_progress().get()
+        self.assertEqual(annotated.progress_percentage, 80.0)
     
     def test_rating_system(self):
         rating = Rating.objects.create(
@@ -164,3 +212,222 @@ class UserInteractionModelTest(TestCase):
         self.assertEqual(purchase.price_paid, Decimal('19.99'))
         self.assertEqual(purchase.payment_status, 'completed')
 
+
+
+class RatingStatsTest(TestCase):
+
+    def setUp(self):
+        self.audiobook = Audiobook.objects.create(
+            title='Rated Audiobook',
+            description='Test description',
+            author=Author.objects.create(name="Rated Author"),
+            category=Category.objects.create(name="Rated Category"),
+            narrator='Test Narrator',
+            publication_date=date(2023, 1, 1)
+        )
+        self.users = [
+            User.objects.create_user(email=f'rater{i}@example.com', password='testpass123')
+            for i in range(3)
+        ]
+
+    def test_stats_follow_rating_changes(self):
+        ratings = [
+            Rating.objects.create(user=user, audiobook=self.audiobook, rating=score)
+            for user, score in zip(self.users, [5, 4, 4])
+        ]
+        self.audiobook.refresh_from_db()
+        self.assertEqual((self.audiobook.rating_sum, self.audiobook.rating_count), (13, 3))
+        self.assertEqual(self.audiobook.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 2, 5: 1})
+
+        ratings[1].rating = 1
+        ratings[1].save()
+        ratings[2].review = 'Bez zmiany oceny'
+        ratings[2].save()
+        self.audiobook.refresh_from_db()
+        self.assertEqual((self.audiobook.rating_sum, self.audiobook.rating_count), (10, 3))
+        self.assertEqual(self.audiobook.rating_histogram, {1: 1, 2: 0, 3: 0, 4: 1, 5: 1})
+
+        ratings[0].delete()
+        self.audiobook.refresh_from_db()
+        self.assertEqual(self.audiobook.average_rating, 2.5)
+        self.assertEqual(self.audiobook.rating_count_5, 0)
+
+    def test_rebuild_command_repairs_drift(self):
+        Rating.objects.create(user=self.users[0], audiobook=self.audiobook, rating=3)
+        Audiobook.objects.filter(pk=self.audiobook.pk).update(rating_sum=99, rating_count=7, rating_count_2=4)
+
+        call_command('rebuild_rating_stats', stdout=io.StringIO())
+
+        self.audiobook.refresh_from_db()
+        self.assertEqual((self.audiobook.rating_sum, self.audiobook.rating_count), (3, 1))
+        self.assertEqual(self.audiobook.rating_histogram, {1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+
+
+
+class AudiobooksCountTest(TestCase):
+
+    def setUp(self):
+        self.authors = [Author.objects.create(name=f"Counted Author {i}") for i in range(2)]
+        self.categories = [Category.objects.create(name=f"Counted Category {i}") for i in range(2)]
+
+    def create_audiobook(self, author, category):
+        return Audiobook.objects.create(
+            title='Counted Audiobook',
+            description='Test description',
+            author=author,
+            category=category,
+            narrator='Test Narrator',
+            publication_date=date(2023, 1, 1)
+        )
+
+    def counts(self):
+        return (
+            [author.audiobooks_count for author in Author.objects.order_by('pk')],
+            [category.audiobooks_count for category in Category.objects.order_by('pk')],
+        )
+
+    def test_counts_follow_audiobook_changes(self):
+        first = self.create_audiobook(self.authors[0], self.categories[0])
+        self.create_audiobook(self.authors[0], self.categories[1])
+        self.assertEqual(self.counts(), ([2, 0], [1, 1]))
+
+        # nieaktualna instancja autora nie nadpisuje licznika
+        self.authors[0].bio = 'Stale'
+        self.authors[0].save()
+
+        first.author = self.authors[1]
+        first.save()
+        first.title = 'Renamed'
+        first.save()
+        self.assertEqual(self.counts(), ([1, 1], [1, 1]))
+
+        first.delete()
+        self.assertEqual(self.counts(), ([1, 0], [0, 1]))
+
+    def test_repair_command_fixes_drift(self):
+        self.create_audiobook(self.authors[0], self.categories[0])
+        Author.objects.update(audiobooks_count=5)
+
+        output = io.StringIO()
+        call_command('repair_audiobook_counts', '--check', stdout=output)
+        self.assertIn('Rozbieżnych liczników: 2', output.getvalue())
+        self.assertEqual(self.counts(), ([5, 5], [1, 0]))
+
+        call_command('repair_audiobook_counts', stdout=io.StringIO())
+        self.assertEqual(self.counts(), ([1, 0], [1, 0]))
+
+
+
+class SeedCatalogTest(TestCase):
+
+    def seed(self, **options):
+        arguments = ['--audiobooks', '30', '--authors', '4', '--categories', '3', '--users', '12', '--batch-size', '7', '--no-audio']
+        for name, value in options.items():
+            arguments += [f'--{name}', str(value)]
+        call_command('seed_catalog', *arguments, stdout=io.StringIO())
+
+    def test_generates_consistent_catalog(self):
+        self.seed()
+
+        self.assertEqual(Audiobook.objects.count(), 30)
+        self.assertEqual(Chapter.objects.count(), 150)
+        self.assertEqual(Rating.objects.count(), 90)
+        self.assertEqual(UserLibrary.objects.count(), 120)
+
+        # dane pochodne takie, jakie dałyby sygnały
+        output = io.StringIO()
+        call_command('repair_audiobook_counts', '--check', stdout=output)
+        self.assertIn('Rozbieżnych liczników: 0', output.getvalue())
+
+        stored = list(Audiobook.objects.order_by('pk').values_list('rating_sum', 'rating_count', 'rating_count_5'))
+        call_command('rebuild_rating_stats', stdout=io.StringIO())
+        self.assertEqual(list(Audiobook.objects.order_by('pk').values_list('rating_sum', 'rating_count', 'rating_count_5')), stored)
+
+        audiobook = Audiobook.objects.first()
+        offsets = list(audiobook.chapters.values_list('start_offset_seconds', flat=True))
+        audiobook.update_chapter_offsets()
+        self.assertEqual(list(audiobook.chapters.values_list('start_offset_seconds', flat=True)), offsets)
+        self.assertEqual(audiobook.total_duration_seconds, sum(audiobook.chapters.values_list('duration_seconds', flat=True)))
+
+    def test_same_seed_gives_same_data(self):
+        self.seed(prefix='first')
+        first = list(Audiobook.objects.order_by('pk').values_list('title', 'is_premium', 'rating_sum'))
+        self.seed(prefix='second')
+        second = list(Audiobook.objects.order_by('pk').values_list('title', 'is_premium', 'rating_sum'))[30:]
+        self.assertEqual(first, second)
+
+    def test_refuses_to_reuse_prefix(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+def make_wav(seconds, sample_rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b'\x00\x00' * sample_rate * seconds)
+    return buffer.getvalue()
+
+
+class AudioMetadataTest(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.audiobook = Audiobook.objects.create(
+            title='Probe Audiobook',
+            description='Test description',
+            author=Author.objects.create(name="Probe Author"),
+            category=Category.objects.create(name="Probe Category"),
+            narrator='Test Narrator',
+            publication_date=date(2023, 1, 1)
+        )
+
+    def create_chapter(self, number, content, name='chapter.wav', **extra):
+        return Chapter.objects.create(
+            audiobook=self.audiobook,
+            title=f"Chapter {number}",
+            chapter_number=number,
+            audio_file=SimpleUploadedFile(name, content, content_type='audio/wav'),
+            **extra
+        )
+
+    def test_upload_fills_metadata_from_headers(self):
+        content = make_wav(90)
+        chapter = self.create_chapter(1, content)
+        chapter.refresh_from_db()
+
+        self.assertEqual(chapter.duration_seconds, 90)
+        self.assertEqual(chapter.codec, 'wave')
+        self.assertEqual(chapter.sample_rate, 8000)
+        self.assertEqual(chapter.bitrate_kbps, 128)
+        self.assertEqual(chapter.file_size, len(content))
+        # plik zapisany w całości mimo wcześniejszego odczytu nagłówków
+        with chapter.audio_file.open('rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_audiobook_duration_rolls_up_from_chapters(self):
+        self.create_chapter(1, make_wav(90))
+        second = self.create_chapter(2, make_wav(60))
+        self.audiobook.refresh_from_db()
+        self.assertEqual(self.audiobook.total_duration_seconds, 150)
+        self.assertEqual(self.audiobook.duration_minutes, 2)
+
+        second.delete()
+        self.audiobook.refresh_from_db()
+        self.assertEqual(self.audiobook.duration_minutes, 2)
+        self.assertEqual(self.audiobook.total_duration_seconds, 90)
+
+    def test_unreadable_file_keeps_entered_duration(self):
+        chapter = self.create_chapter(1, b'not really audio', name='chapter.mp3', duration_seconds=42)
+        chapter.refresh_from_db()
+
+        self.assertEqual(chapter.duration_seconds, 42)
+        self.assertEqual(chapter.codec, '')
@@ -0,0 +1,292 @@
+"""
+Stripe payment tests - webhook finalization, idempotency, async client against a local Stripe stand-in
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from knox.models import AuthToken
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users.models import Audiobook, Author, Category, Purchase, StripeEvent, UserLibrary
+
+User = get_user_model()
+
+
+class StripeStandIn(ThreadingHTTPServer):
+    """Lokalny zamiennik API Stripe: tworzenie i odczyt PaymentIntent."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StripeStandInHandler)
+        self.intents = {}
+        self.requests = []
+        self.delay = 0
+        self.ids = itertools.count(1)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def succeed(self, intent_id):
+        intent = self.intents[intent_id]
+        intent.update(status='succeeded', amount_received=intent['amount'])
+        return intent
+
+
+class StripeStandInHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        self.server.requests.append(('POST', self.path, self.headers.get('Authorization')))
+        if self.path != '/v1/payment_intents':
+            return self.reply(404, {'error': {'type': 'invalid_request_error', 'message': 'Unrecognized request URL'}})
+
+        params = dict(parse_qsl(body))
+        intent_id = f'pi_standin_{next(self.server.ids)}'
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': int(params['amount']),
+            'amount_received': 0,
+            'currency': params['currency'],
+            'status': 'requires_payment_method',
+            'client_secret': f'{intent_id}_secret_standin',
+            'metadata': {key[len('metadata['):-1]: value for key, value in params.items() if key.startswith('metadata[')},
+        }
+        self.server.intents[intent_id] = intent
+        self.reply(200, intent)
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path, self.headers.get('Authorization')))
+        intent = self.server.intents.get(self.path.rpartition('/')[2])
+        if intent is None:
+            return self.reply(404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}})
+        self.reply(200, intent)
+
+    def reply(self, status_code, data):
+        time.sleep(self.server.delay)
+        body = json.dumps(data).encode()
+        try:
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def signature_header(payload, secret=None, timestamp=None):
+    timestamp = timestamp or int(time.time())
+    secret = secret or settings.STRIPE_WEBHOOK_SECRET
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+class StripePaymentTest(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = StripeStandIn()
+        thread = threading.Thread(target=cls.stripe.serve_forever, daemon=True)
+        thread.start()
+        cls.addClassCleanup(cls.stripe.server_close)
+        cls.addClassCleanup(cls.stripe.shutdown)
+
+    def setUp(self):
+        cache.clear()
+        self.stripe.requests.clear()
+        self.stripe.delay = 0
+
+        stripe_settings = override_settings(STRIPE_API_BASE=self.stripe.url)
+        stripe_settings.enable()
+        self.addCleanup(stripe_settings.disable)
+
+        author = Author.objects.create(name="Payment Author")
+        category = Category.objects.create(name="Payment Category")
+        self.audiobook = Audiobook.objects.create(
+            title='Paid Audiobook',
+            description='Test',
+            author=author,
+            category=category,
+            narrator='Narrator',
+            publication_date=date(2023, 1, 1),
+            is_premium=True,
+            price=Decimal('29.99')
+        )
+        self.user = User.objects.create_user(email='buyer@example.com', password='testpass123')
+        _, token = AuthToken.objects.create(self.user)
+        self.authorization = f'Token {token}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.authorization)
+
+    def create_intent(self):
+        return self.client.post(reverse('create-payment-intent'), {'audiobook_id': self.audiobook.id})
+
+    def send_webhook(self, intent, event_id='evt_1', event_type='payment_intent.succeeded', **signing):
+        payload = json.dumps({'id': event_id, 'object': 'event', 'type': event_type, 'data': {'object': intent}})
+        return self.client.generic(
+            'POST', reverse('stripe-webhook'), payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature_header(payload, **signing)
+        )
+
+    def test_create_intent_records_pending_purchase(self):
+        response = self.create_intent()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        intent_id = response.json()['client_secret'].split('_secret_')[0]
+        intent = self.stripe.intents[intent_id]
+        self.assertEqual(intent['amount'], 2999)
+        self.assertEqual(intent['metadata'], {'audiobook_id': str(self.audiobook.id), 'user_id': str(self.user.id)})
+        self.assertEqual(self.stripe.requests[0][2], f'Bearer {settings.STRIPE_SECRET_KEY}')
+
+        purchase = Purchase.objects.get(user=self.user, audiobook=self.audiobook)
+        self.assertEqual((purchase.payment_status, purchase.payment_id), ('pending', intent_id))
+
+    def test_webhook_finalizes_purchase_once(self):
+        self.create_intent()
+        intent = self.stripe.succeed(Purchase.objects.get().payment_id)
+
+        response = self.send_webhook(intent)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['duplicate'])
+        purchase = Purchase.objects.get()
+        self.assertEqual((purchase.payment_status, purchase.price_paid), ('completed', Decimal('29.99')))
+        self.assertTrue(UserLibrary.objects.filter(user=self.user, audiobook=self.audiobook).exists())
+
+        # ponowione dostarczenie tego samego zdarzenia
+        response = self.send_webhook(intent)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertEqual(Purchase.objects.count(), 1)
+        self.assertEqual(UserLibrary.objects.count(), 1)
+
+    def test_webhook_rejects_bad_signature(self):
+        self.create_intent()
+        intent = self.stripe.succeed(Purchase.objects.get().payment_id)
+
+        response = self.send_webhook(intent, secret='whsec_someone_else')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # poprawny podpis, ale starszy niż tolerancja Stripe (5 min) - powtórzone stare żądanie
+        response = self.send_webhook(intent, timestamp=int(time.time()) - 3600)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(Purchase.objects.get().payment_status, 'pending')
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_free_or_unpriced_audiobook_is_rejected(self):
+        for is_premium, price in ((False, None), (True, None), (False, Decimal('9.99'))):
+            Audiobook.objects.filter(pk=self.audiobook.pk).update(is_premium=is_premium, price=price)
+            self.assertEqual(self.create_intent().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.stripe.requests, [])
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_webhook_for_deleted_audiobook_is_acknowledged(self):
+        self.create_intent()
+        intent = self.stripe.succeed(Purchase.objects.get().payment_id)
+        self.audiobook.delete()
+
+        with self.assertLogs('users.payments', level='ERROR'):
+            response = self.send_webhook(intent)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(StripeEvent.objects.filter(event_id='evt_1').exists())
+        self.assertFalse(UserLibrary.objects.exists())
+        self.assertTrue(self.send_webhook(intent).data['duplicate'])
+
+        bad_metadata = dict(intent, metadata={'user_id': str(self.user.id), 'audiobook_id': 'abc'})
+        self.assertEqual(self.send_webhook(bad_metadata, event_id='evt_2').status_code, status.HTTP_200_OK)
+        self.assertTrue(StripeEvent.objects.filter(event_id='evt_2').exists())
+
+    def test_failed_payment_marks_purchase(self):
+        self.create_intent()
+        intent = dict(self.stripe.intents[Purchase.objects.get().payment_id], status='requires_payment_method')
+        self.send_webhook(intent, event_type='payment_intent.payment_failed')
+        self.assertEqual(Purchase.objects.get().payment_status, 'failed')
+
+    def test_confirm_after_webhook_skips_stripe(self):
+        self.create_intent()
+        intent = self.stripe.succeed(Purchase.objects.get().payment_id)
+        self.send_webhook(intent)
+
+        self.stripe.requests.clear()
+        response = self.client.post(reverse('confirm-payment'), {'payment_intent_id': intent['id']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['message'], 'Zakupiono Paid Audiobook!')
+        self.assertEqual(self.stripe.requests, [])
+
+    def test_confirm_before_webhook_asks_stripe(self):
+        self.create_intent()
+        intent_id = Purchase.objects.get().payment_id
+
+        response = self.client.post(reverse('confirm-payment'), {'payment_intent_id': intent_id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.stripe.succeed(intent_id)
+        response = self.client.post(reverse('confirm-payment'), {'payment_intent_id': intent_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Purchase.objects.get().payment_status, 'completed')
+        self.assertTrue(UserLibrary.objects.filter(user=self.user, audiobook=self.audiobook).exists())
+
+        # webhook przychodzi później i niczego już nie zmienia
+        self.assertFalse(self.send_webhook(self.stripe.intents[intent_id]).data['duplicate'])
+        self.assertEqual(UserLibrary.objects.count(), 1)
+        self.assertEqual(self.create_intent().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_confirm_rejects_someone_elses_intent(self):
+        self.create_intent()
+        intent_id = Purchase.objects.get().payment_id
+        self.stripe.succeed(intent_id)
+
+        other = User.objects.create_user(email='other@example.com', password='testpass123')
+        _, token = AuthToken.objects.create(other)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        response = self.client.post(reverse('confirm-payment'), {'payment_intent_id': intent_id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Purchase.objects.get().payment_status, 'pending')
+
+    def test_stripe_timeout_is_bounded(self):
+        self.stripe.delay = 1
+        with override_settings(STRIPE_TIMEOUT_SECONDS=0.2):
+            started = time.monotonic()
+            response = self.create_intent()
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_requires_token(self):
+        self.client.credentials()
+        self.assertEqual(self.create_intent().status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('confirm-payment'), {'payment_intent_id': 'pi_x'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.stripe.requests, [])
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    async def test_async_view_under_asgi(self):
+        # pełny stos ASGI: RequestMetricsMiddleware w trybie async, widok bez wątku roboczego
+        response = await self.async_client.post(
+            reverse('create-payment-intent'), {'audiobook_id': self.audiobook.id},
+            content_type='application/json', headers={'Authorization': self.authorization}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertTrue(await Purchase.objects.filter(payment_status='pending').aexists())
+        # token, audiobook, sprawdzenie zakupu, update i get_or_create - z wątków sync_to_async
+        self.assertRegex(response['Server-Timing'], r'desc="([5-9]|\d{2,}) queries"')
@@ -0,0 +1,159 @@
+"""
+Catalog response cache tests - anonymous list endpoints, ETag / 304
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from users import response_cache
+from users.models import Author, Category, Audiobook, Rating
+
+User = get_user_model()
+
+# drugi proces z tym samym kodem i wspólnym cache plikowym zamiast Redis
+INVALIDATE_IN_OTHER_PROCESS = """
+import sys
+import django
+django.setup()
+from django.test import override_settings
+from users import response_cache
+with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': sys.argv[1]}}):
+    response_cache.invalidate()
+"""
+
+
+class CatalogResponseCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        response_cache.reset()
+        self.addCleanup(cache.clear)
+        self.addCleanup(response_cache.reset)
+
+        self.author = Author.objects.create(name="Cache Author")
+        self.category = Category.objects.create(name="Cache Category")
+        self.audiobook = self.create_audiobook('Cached Dragon')
+        self.url = reverse('audiobook-list')
+
+    def create_audiobook(self, title):
+        return Audiobook.objects.create(
+            title=title,
+            description='Cache test',
+            author=self.author,
+            category=self.category,
+            narrator='Narrator',
+            publication_date=date(2023, 1, 1)
+        )
+
+    def titles(self, response):
+        return [book['title'] for book in response.data['results']]
+
+    def test_repeated_anonymous_request_skips_database(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertTrue(first.has_header('ETag'))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        # drugi poziom: pusty LRU procesu, odpowiedź ze współdzielonego cache
+        response_cache.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).content, first.content)
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_catalog_writes_bump_generation(self):
+        self.client.get(self.url)
+        self.create_audiobook('Fresh Title')
+        self.assertIn('Fresh Title', self.titles(self.client.get(self.url)))
+
+        self.client.get(self.url)
+        Rating.objects.create(
+            user=User.objects.create_user(email='rater@example.com', password='testpass123'),
+            audiobook=self.audiobook,
+            rating=5
+        )
+        results = self.client.get(self.url).data['results']
+        self.assertEqual({book['title']: book['average_rating'] for book in results}['Cached Dragon'], 5.0)
+
+        self.author.name = 'Renamed Author'
+        self.author.save()
+        response = self.client.get(reverse('author-audiobooks', kwargs={'pk': self.author.pk}))
+        self.assertEqual(response.data['results'][0]['author_name'], 'Renamed Author')
+
+    @override_settings(RESPONSE_CACHE_GENERATION_CHECK_SECONDS=0)
+    def test_evicted_generation_does_not_revive_old_entries(self):
+        cache.delete(response_cache.GENERATION_KEY)
+        self.client.get(self.url)
+        self.create_audiobook('Fresh Title')
+        self.assertIn('Fresh Title', self.titles(self.client.get(self.url)))
+
+        # cache wyrzucił klucz generacji, odpowiedź sprzed zapisu wciąż w nim leży
+        cache.delete(response_cache.GENERATION_KEY)
+        self.assertIn('Fresh Title', self.titles(self.client.get(self.url)))
+
+    def test_normalized_search_shares_cache_entry(self):
+        self.client.get(self.url, {'search': 'Dragon'})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'search': '  dragon '})
+        self.assertEqual(self.titles(response), ['Cached Dragon'])
+
+    def test_authenticated_and_unknown_params_bypass_cache(self):
+        self.client.get(self.url)
+
+        response = self.client.get(self.url, {'utm_source': 'newsletter'})
+        self.assertFalse(response.has_header('ETag'))
+
+        self.client.force_authenticate(user=User.objects.create_user(email='member@example.com', password='testpass123'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_cache_can_be_disabled(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('Cached Dragon', self.titles(response))
+
+    def test_generation_bumped_in_another_process_is_seen(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}}
+
+        with override_settings(CACHES=shared, RESPONSE_CACHE_GENERATION_CHECK_SECONDS=0):
+            response_cache.reset()
+            self.client.get(self.url)
+            Audiobook.objects.filter(pk=self.audiobook.pk).update(title='Renamed Elsewhere')
+            subprocess.run(
+                [sys.executable, '-c', INVALIDATE_IN_OTHER_PROCESS, directory.name],
+                check=True, cwd=settings.BASE_DIR, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'auth.test_settings'}
+            )
+            self.assertEqual(self.titles(self.client.get(self.url)), ['Renamed Elsewhere'])
+
+    @override_settings(CACHE_ALLOW_PROCESS_LOCAL=False)
+    def test_process_local_cache_is_not_used(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIsNone(response_cache.get_generation())
+        self.create_audiobook('Fresh Title')
+        self.assertIn('Fresh Title', self.titles(self.client.get(self.url)))
@@ -0,0 +1,383 @@
+"""
+Chapter audio streaming tests - HTTP Range / conditional requests
+"""
+import io
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from unittest import mock
+
+from users.models import Author, Category, Audiobook, Chapter, Purchase
+from users import hls
+from users.signing import signed_media_path, hls_token, verify_hls_token, media_signature, verify_media_signature
+
+User = get_user_model()
+
+# zastępuje ffmpeg: zapisuje playlistę w katalogu wyjściowym z ostatniego argumentu
+FAKE_FFMPEG = f"""#!{sys.executable}
+import os, sys
+output_dir = os.path.dirname(os.path.dirname(sys.argv[-1]))
+with open(os.path.join(output_dir, 'master.m3u8'), 'w') as f:
+    f.write('#EXTM3U\\n')
+"""
+
+AUDIO_BYTES = bytes(range(256)) * 4
+
+
+class StreamingTestBase(APITestCase):
+
+    def setUp(self):
+        # ID użytkowników i audiobooków powtarzają się między testami - bez starych uprawnień w cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(email='stream@example.com', password='testpass123')
+        self.author = Author.objects.create(name="Stream Author")
+        self.category = Category.objects.create(name="Stream Category")
+        self.free_chapter = self.create_chapter('Free Stream', is_premium=False)
+        self.premium_chapter = self.create_chapter('Premium Stream', is_premium=True)
+
+    def create_chapter(self, title, is_premium):
+        audiobook = Audiobook.objects.create(
+            title=title,
+            description='Streaming test',
+            author=self.author,
+            category=self.category,
+            narrator='Narrator',
+            duration_minutes=1,
+            publication_date=date(2023, 1, 1),
+            is_premium=is_premium,
+            price=Decimal('9.99') if is_premium else None
+        )
+        return Chapter.objects.create(
+            audiobook=audiobook,
+            title='Chapter 1',
+            chapter_number=1,
+            duration_seconds=60,
+            audio_file=SimpleUploadedFile('chapter.mp3', AUDIO_BYTES, content_type='audio/mpeg')
+        )
+
+    def get_stream(self, chapter, **headers):
+        response = self.client.get(reverse('chapter-stream', kwargs={'pk': chapter.pk}), **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+
+class ChapterStreamingTest(StreamingTestBase):
+
+    def test_full_download(self):
+        response = self.get_stream(self.free_chapter)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(self.body(response), AUDIO_BYTES)
+
+    def test_range_request_returns_partial_content(self):
+        response = self.get_stream(self.free_chapter, HTTP_RANGE='bytes=100-199')
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(AUDIO_BYTES)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(self.body(response), AUDIO_BYTES[100:200])
+
+    def test_suffix_and_open_ended_ranges(self):
+        response = self.get_stream(self.free_chapter, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.body(response), AUDIO_BYTES[-10:])
+
+        response = self.get_stream(self.free_chapter, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(self.body(response), AUDIO_BYTES[1000:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get_stream(self.free_chapter, HTTP_RANGE=f'bytes={len(AUDIO_BYTES)}-')
+
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(AUDIO_BYTES)}')
+
+    def test_conditional_requests(self):
+        etag = self.get_stream(self.free_chapter)['ETag']
+
+        response = self.get_stream(self.free_chapter, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.get_stream(self.free_chapter, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.get_stream(self.free_chapter, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    def test_premium_chapter_requires_purchase(self):
+        response = self.get_stream(self.premium_chapter, HTTP_ACCEPT='audio/mpeg')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn(b'error', response.content)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.get_stream(self.premium_chapter)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        Purchase.objects.create(
+            user=self.user,
+            audiobook=self.premium_chapter.audiobook,
+            price_paid=Decimal('9.99'),
+            payment_status='completed'
+        )
+        response = self.get_stream(self.premium_chapter, HTTP_RANGE='bytes=0-0')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Cache-Control'], 'private')
+
+
+class InternalRedirectDeliveryTest(StreamingTestBase):
+
+    @override_settings(MEDIA_DELIVERY_MODE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_x_accel_redirect_header_contract(self):
+        response = self.get_stream(self.free_chapter, HTTP_RANGE='bytes=0-9')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/' + self.free_chapter.audio_file.name
+        )
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_DELIVERY_MODE='x-sendfile')
+    def test_x_sendfile_header_contract(self):
+        response = self.get_stream(self.free_chapter)
+
+        self.assertEqual(response['X-Sendfile'], self.free_chapter.audio_file.path)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_DELIVERY_MODE='x-accel-redirect')
+    def test_denied_request_does_not_leak_redirect(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.get_stream(self.premium_chapter)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+    def test_stand_in_serves_redirected_file(self):
+        middleware = ['users.middleware.InternalRedirectMiddleware'] + list(settings.MIDDLEWARE)
+        for mode in ('x-accel-redirect', 'x-sendfile'):
+            with self.subTest(mode=mode), override_settings(MEDIA_DELIVERY_MODE=mode, MIDDLEWARE=middleware):
+                response = self.get_stream(self.free_chapter, HTTP_RANGE='bytes=10-19')
+
+                self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+                self.assertEqual(self.body(response), AUDIO_BYTES[10:20])
+                self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+
+class SignedMediaUrlTest(StreamingTestBase):
+
+    def audio_url(self, chapter):
+        response = self.client.get(reverse('audiobook-chapters', kwargs={'pk': chapter.audiobook.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data[0]['audio_file']
+
+    def test_signed_url_streams_without_token_or_queries(self):
+        self.client.force_authenticate(user=self.user)
+        Purchase.objects.create(
+            user=self.user,
+            audiobook=self.premium_chapter.audiobook,
+            price_paid=Decimal('9.99'),
+            payment_status='completed'
+        )
+        url = self.audio_url(self.premium_chapter)
+        self.assertIn(f'u={self.user.pk}', url)
+
+        self.client.force_authenticate(user=None)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_RANGE='bytes=0-9')
+        self.addCleanup(response.close)
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(self.body(response), AUDIO_BYTES[:10])
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+    def test_tampered_or_expired_url_is_rejected(self):
+        url = self.audio_url(self.free_chapter)
+
+        response = self.client.get(url.replace('u=0', f'u={self.user.pk}'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        expired = signed_media_path(self.free_chapter.audio_file.name, self.free_chapter.pk, 0, expires=1)
+        response = self.client.get(expired)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_premium_chapters_are_not_signed_for_anonymous_users(self):
+        response = self.client.get(reverse('audiobook-detail', kwargs={'pk': self.premium_chapter.audiobook.pk}))
+        self.assertIsNone(response.data['chapters'][0]['audio_file'])
+
+
+class HlsPackagingTest(StreamingTestBase):
+
+    def write_hls_files(self, chapter):
+        chapter_dir = os.path.join(settings.MEDIA_ROOT, hls.chapter_hls_dir(chapter.pk))
+        os.makedirs(os.path.join(chapter_dir, 'v0'))
+        with open(os.path.join(chapter_dir, hls.MASTER_PLAYLIST), 'w') as f:
+            f.write('#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=48000\nv0/index.m3u8\n')
+        with open(os.path.join(chapter_dir, 'v0', 'seg_00000.m4s'), 'wb') as f:
+            f.write(AUDIO_BYTES)
+        Chapter.objects.filter(pk=chapter.pk).update(hls_status=hls.HLS_STATUS_READY)
+
+    def test_ffmpeg_command_maps_each_bitrate_to_a_variant(self):
+        command = hls.build_ffmpeg_command('in.mp3', '/out', bitrates=[48, 96], segment_seconds=4)
+
+        self.assertEqual(command.count('-map'), 2)
+        self.assertIn('48k', command)
+        self.assertIn('96k', command)
+        self.assertEqual(command[command.index('-var_stream_map') + 1], 'a:0 a:1')
+        self.assertEqual(command[command.index('-hls_time') + 1], '4')
+        self.assertEqual(command[-1], os.path.join('/out', 'v%v', 'index.m3u8'))
+
+    def test_token_is_bound_to_chapter_and_expiry(self):
+        token = hls_token(self.free_chapter.pk, 0)
+        chapter_id, user_id, expires = verify_hls_token(token)
+        self.assertEqual((chapter_id, user_id), (self.free_chapter.pk, 0))
+
+        self.assertIsNone(verify_hls_token(token.replace(f'{self.free_chapter.pk}-', f'{self.premium_chapter.pk}-', 1)))
+        self.assertIsNone(verify_hls_token(hls_token(self.free_chapter.pk, 0, expires=1)))
+        self.assertIsNone(verify_hls_token('garbage'))
+
+    def test_stream_and_hls_signatures_are_not_interchangeable(self):
+        chapter_id = self.free_chapter.pk
+        token = hls_token(chapter_id, 0)
+        _, _, expires, signature = token.split('-')
+        self.assertFalse(verify_media_signature(f'hls/chapter_{chapter_id}', chapter_id, 0, expires, signature))
+
+        stream_signature = media_signature(f'hls/chapter_{chapter_id}', chapter_id, 0, expires)
+        self.assertIsNone(verify_hls_token(f'{chapter_id}-0-{expires}-{stream_signature}'))
+
+    def test_signing_requires_media_key(self):
+        with override_settings(MEDIA_SIGNING_KEY=''):
+            with self.assertRaises(ImproperlyConfigured):
+                hls_token(self.free_chapter.pk, 0)
+
+    def test_playlist_and_segments_are_served_by_token(self):
+        self.write_hls_files(self.free_chapter)
+
+        response = self.client.get(reverse('audiobook-playlists', kwargs={'pk': self.free_chapter.audiobook.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        playlist_url = response.data[0]['playlist_url']
+        self.assertTrue(playlist_url.endswith('/master.m3u8'))
+
+        with self.assertNumQueries(0):
+            playlist = self.client.get(playlist_url)
+        self.addCleanup(playlist.close)
+        self.assertEqual(playlist.status_code, status.HTTP_200_OK)
+        self.assertEqual(playlist['Content-Type'], 'application/vnd.apple.mpegurl')
+        self.assertIn(b'v0/index.m3u8', self.body(playlist))
+
+        segment = self.client.get(playlist_url.replace(hls.MASTER_PLAYLIST, 'v0/seg_00000.m4s'), HTTP_RANGE='bytes=0-9')
+        self.addCleanup(segment.close)
+        self.assertEqual(segment.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(self.body(segment), AUDIO_BYTES[:10])
+
+    def test_token_does_not_open_other_chapters(self):
+        self.write_hls_files(self.premium_chapter)
+        token = hls_token(self.free_chapter.pk, 0)
+
+        response = self.client.get(reverse('hls-media', kwargs={
+            'token': token,
+            'name': f'../chapter_{self.premium_chapter.pk}/{hls.MASTER_PLAYLIST}',
+        }))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_premium_playlists_require_purchase(self):
+        self.write_hls_files(self.premium_chapter)
+        url = reverse('audiobook-playlists', kwargs={'pk': self.premium_chapter.audiobook.pk})
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def use_fake_ffmpeg(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'fake-ffmpeg')
+        with open(path, 'w') as f:
+            f.write(FAKE_FFMPEG)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        ffmpeg_settings = override_settings(FFMPEG_BINARY=path)
+        ffmpeg_settings.enable()
+        self.addCleanup(ffmpeg_settings.disable)
+
+    def test_packaging_replaces_output_and_removes_abandoned_work(self):
+        self.use_fake_ffmpeg()
+        self.write_hls_files(self.free_chapter)
+        chapter_dir = os.path.join(settings.MEDIA_ROOT, hls.chapter_hls_dir(self.free_chapter.pk))
+        # katalog roboczy zadania przerwanego restartem procesu
+        abandoned = os.path.join(os.path.dirname(chapter_dir), f'.chapter_{self.free_chapter.pk}_abandoned')
+        os.makedirs(abandoned)
+
+        self.assertTrue(hls.package_chapter(self.free_chapter.pk))
+        self.assertFalse(os.path.exists(abandoned))
+        self.assertFalse(os.path.exists(os.path.join(chapter_dir, 'v0', 'seg_00000.m4s')))
+        with open(os.path.join(chapter_dir, hls.MASTER_PLAYLIST)) as f:
+            self.assertEqual(f.read(), '#EXTM3U\n')
+        self.assertEqual(
+            [name for name in os.listdir(os.path.dirname(chapter_dir)) if not name.endswith('.lock')],
+            [os.path.basename(chapter_dir)]
+        )
+
+    def test_chapter_locked_elsewhere_is_skipped(self):
+        self.use_fake_ffmpeg()
+        # flock wiąże blokadę z otwartym plikiem - drugi open() zachowuje się jak inny proces
+        with hls.chapter_lock(self.free_chapter.pk) as acquired, mock.patch('subprocess.run') as run:
+            self.assertTrue(acquired)
+            self.assertIsNone(hls.package_chapter(self.free_chapter.pk))
+        run.assert_not_called()
+        self.assertTrue(hls.package_chapter(self.free_chapter.pk))
+
+    def test_pending_chapters_are_left_for_build_hls(self):
+        self.use_fake_ffmpeg()
+        with override_settings(HLS_ENABLED=True), mock.patch.object(hls, 'enqueue_chapter') as enqueue:
+            self.free_chapter.audio_file = self.free_chapter.audio_file.name
+            self.free_chapter.save()
+        enqueue.assert_not_called()
+        self.free_chapter.refresh_from_db()
+        self.assertEqual(self.free_chapter.hls_status, hls.HLS_STATUS_PENDING)
+
+        call_command('build_hls', stdout=io.StringIO())
+        self.free_chapter.refresh_from_db()
+        self.assertEqual(self.free_chapter.hls_status, hls.HLS_STATUS_READY)
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def test_package_chapter_with_ffmpeg(self):
+        # prawdziwe kodowanie - 1 s ciszy wygenerowanej przez ffmpeg
+        import subprocess
+        source = os.path.join(settings.MEDIA_ROOT, 'silence.wav')
+        subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=mono', '-t', '1', source],
+            check=True
+        )
+        Chapter.objects.filter(pk=self.free_chapter.pk).update(audio_file='silence.wav')
+
+        self.assertTrue(hls.package_chapter(self.free_chapter.pk))
+        self.free_chapter.refresh_from_db()
+        self.assertEqual(self.free_chapter.hls_status, hls.HLS_STATUS_READY)
+        self.assertTrue(os.path.isfile(os.path.join(
+            settings.MEDIA_ROOT, hls.chapter_hls_dir(self.free_chapter.pk), hls.MASTER_PLAYLIST
+        )))
@@ -3,8 +3,10 @@ from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from users.models import Author, Category, Audiobook, UserLibrary
+from users.models import Author, Category, Audiobook, Chapter, UserLibrary, ListeningProgress, Rating, Purchase
 from decimal import Decimal
+from unittest import mock
+from users import search
 
 User = get_user_model()
 
@@ -85,26 +87,91 @@ class AudiobookAPITest(APITestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
     
     def test_audiobook_search(self):
         url = reverse('audiobook-list')
         response = self.client.get(url, {'search': 'Free'})
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], 'Free API Audiobook')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['title'], 'Free API Audiobook')
     
     def test_audiobook_filtering(self):
         url = reverse('audiobook-list')
         
         response = self.client.get(url, {'free_only': 'true'})
-        self.assertEqual(len(response.data), 1)
-        self.assertFalse(response.data[0]['is_premium'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertFalse(response.data['results'][0]['is_premium'])
         
         response = self.client.get(url, {'premium_only': 'true'})
-        self.assertEqual(len(response.data), 1)
-        self.assertTrue(response.data[0]['is_premium'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertTrue(response.data['results'][0]['is_premium'])
+
+    def test_audiobook_list_annotated_state(self):
+        other_user = User.objects.create_user(email='rater@example.com', password='testpass123')
+        Rating.objects.create(user=self.user, audiobook=self.free_audiobook, rating=5)
+        Rating.objects.create(user=other_user, audiobook=self.free_audiobook, rating=2)
+        UserLibrary.objects.create(user=self.user, audiobook=self.free_audiobook)
+        Purchase.objects.create(
+            user=self.user,
+            audiobook=self.premium_audiobook,
+            price_paid=self.premium_audiobook.price,
+            payment_status='completed'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('audiobook-list'), {'ordering': 'title'})
+
+        free, premium = response.data['results']
+        self.assertEqual(free['average_rating'], 3.5)
+        self.assertTrue(free['is_in_library'])
+        self.assertFalse(free['is_purchased'])
+        self.assertIsNone(premium['average_rating'])
+        self.assertFalse(premium['is_in_library'])
+        self.assertTrue(premium['is_purchased'])
+
+    def test_audiobook_list_query_count_is_constant(self):
+        for i in range(10):
+            audiobook = Audiobook.objects.create(
+                title=f'Bulk Audiobook {i}',
+                description='Bulk',
+                author=self.author,
+                category=self.category,
+                narrator='Bulk Narrator',
+                duration_minutes=60,
+                publication_date='2023-01-01'
+            )
+            Rating.objects.create(user=self.user, audiobook=audiobook, rating=4)
+        self.client.force_authenticate(user=self.user)
+
+        # audiobooki z adnotacjami + prefetch rozdziałów
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('audiobook-list'))
+        self.assertEqual(len(response.data['results']), 12)
+
+
+    def test_author_and_category_lists_read_counters(self):
+        for i in range(5):
+            Author.objects.create(name=f'Empty Author {i}')
+            Category.objects.create(name=f'Empty Category {i}')
+        self.client.force_authenticate(user=self.user)
+
+        # jedno zapytanie na stronę, bez COUNT dla każdego wiersza
+        with self.assertNumQueries(1):
+            authors = self.client.get(reverse('author-list')).data['results']
+        with self.assertNumQueries(1):
+            categories = self.client.get(reverse('category-list')).data['results']
+
+        counts = {author['name']: author['audiobooks_count'] for author in authors}
+        self.assertEqual(counts['API Author'], 2)
+        self.assertEqual(counts['Empty Author 0'], 0)
+        counts = {category['name']: category['audiobooks_count'] for category in categories}
+        self.assertEqual(counts['API Category'], 2)
+
+        response = self.client.get(reverse('audiobook-detail', kwargs={'pk': self.free_audiobook.pk}))
+        self.assertEqual(response.data['author']['audiobooks_count'], 2)
+        self.assertEqual(response.data['category']['audiobooks_count'], 2)
 
 
 class UserLibraryAPITest(APITestCase):
@@ -161,5 +228,275 @@ class UserLibraryAPITest(APITestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertTrue(response.data[0]['is_favorite'])
\ No newline at end of file
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertTrue(response.data['results'][0]['is_favorite'])
+
+    def create_shelves(self):
+        # 3 pozycje: nierozpoczęta, w trakcie, ukończona
+        items = {}
+        for state in UserLibrary.STATES:
+            audiobook = Audiobook.objects.create(
+                title=f'Shelf {state}',
+                description='Shelf test',
+                author=self.author,
+                category=self.category,
+                narrator='Library Narrator',
+                publication_date='2023-01-01'
+            )
+            chapter = Chapter.objects.create(
+                audiobook=audiobook,
+                title='Chapter 1',
+                chapter_number=1,
+                duration_seconds=1000,
+                audio_file='shelf.mp3'
+            )
+            Rating.objects.create(user=self.user, audiobook=audiobook, rating=4)
+            if state != UserLibrary.STATE_NOT_STARTED:
+                ListeningProgress.objects.create(
+                    user=self.user,
+                    audiobook=audiobook,
+                    current_chapter=chapter,
+                    current_position_seconds=250,
+                    is_completed=state == UserLibrary.STATE_COMPLETED
+                )
+            items[state] = UserLibrary.objects.create(user=self.user, audiobook=audiobook)
+        return items
+
+    def test_library_shelves_in_one_query(self):
+        self.client.force_authenticate(user=self.user)
+        items = self.create_shelves()
+
+        # walidator ETag (conditional.py) + strona biblioteki
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('library-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        by_id = {item['id']: item for item in response.data['results']}
+        for state, library_item in items.items():
+            self.assertEqual(by_id[library_item.pk]['progress_state'], state)
+            self.assertEqual(by_id[library_item.pk]['audiobook']['average_rating'], 4.0)
+            self.assertTrue(by_id[library_item.pk]['audiobook']['is_in_library'])
+        self.assertEqual(by_id[items['listening'].pk]['progress_percentage'], 25.0)
+        self.assertEqual(by_id[items['not_started'].pk]['progress_percentage'], 0)
+
+    def test_state_filter_and_shelf_actions(self):
+        self.client.force_authenticate(user=self.user)
+        items = self.create_shelves()
+
+        response = self.client.get(reverse('library-list'), {'state': 'listening,completed'})
+        self.assertEqual(
+            {item['id'] for item in response.data['results']},
+            {items['listening'].pk, items['completed'].pk}
+        )
+
+        response = self.client.get(reverse('library-list'), {'state': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('library-listening'))
+        self.assertEqual([item['id'] for item in response.data['results']], [items['listening'].pk])
+
+        response = self.client.get(reverse('library-completed'))
+        self.assertEqual([item['id'] for item in response.data['results']], [items['completed'].pk])
+
+class CatalogPaginationTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = Author.objects.create(name="Page Author")
+        self.category = Category.objects.create(name="Page Category")
+        for i in range(5):
+            Audiobook.objects.create(
+                title=f'Paged Audiobook {i}',
+                description='Paged',
+                author=self.author,
+                category=self.category,
+                narrator='Page Narrator',
+                duration_minutes=60,
+                publication_date='2023-01-01',
+                is_premium=i % 2 == 1,
+                price=Decimal('10.00') if i % 2 == 1 else None
+            )
+
+    def collect_pages(self, params):
+        titles = []
+        response = self.client.get(reverse('audiobook-list'), params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), params['page_size'])
+            titles.extend(book['title'] for book in response.data['results'])
+            if not response.data['next']:
+                return titles
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_cover_catalog_once(self):
+        titles = self.collect_pages({'ordering': 'title', 'page_size': 2})
+        self.assertEqual(titles, [f'Paged Audiobook {i}' for i in range(5)])
+
+    def test_cursor_price_ordering_keeps_free_audiobooks(self):
+        titles = self.collect_pages({'ordering': '-price', 'page_size': 2})
+        self.assertEqual(len(titles), 5)
+        self.assertEqual(set(titles[:2]), {'Paged Audiobook 1', 'Paged Audiobook 3'})
+
+    def test_rating_ordering_and_filter(self):
+        user = User.objects.create_user(email='pagerater@example.com', password='testpass123')
+        for title, score in [('Paged Audiobook 2', 5), ('Paged Audiobook 4', 2)]:
+            Rating.objects.create(user=user, audiobook=Audiobook.objects.get(title=title), rating=score)
+
+        titles = self.collect_pages({'ordering': '-rating', 'page_size': 2})
+        self.assertEqual(len(titles), 5)
+        self.assertEqual(titles[:2], ['Paged Audiobook 2', 'Paged Audiobook 4'])
+
+        response = self.client.get(reverse('audiobook-list'), {'min_rating': 4})
+        self.assertEqual([book['title'] for book in response.data['results']], ['Paged Audiobook 2'])
+
+    def test_cursor_pages_through_more_ties_than_offset_cutoff(self):
+        # ponad 1000 audiobooków z tą samą datą - remisy rozstrzyga id w kursorze, nie offset
+        Audiobook.objects.bulk_create(
+            Audiobook(
+                title=f'Tied Audiobook {i}', description='Tied', author=self.author, category=self.category,
+                narrator='Tied Narrator', duration_minutes=60, publication_date='2023-01-01'
+            )
+            for i in range(1100)
+        )
+        expected = sorted(Audiobook.objects.values_list('id', flat=True))
+
+        ids = []
+        response = self.client.get(reverse('audiobook-list'), {'ordering': 'publication_date', 'page_size': 100})
+        while True:
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                break
+            last_page = response
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, expected)
+
+        # link wstecz z ostatniej strony wraca do przedostatniej
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [book['id'] for book in response.data['results']],
+            [book['id'] for book in last_page.data['results']]
+        )
+
+    def test_rating_ordering_pages_through_unrated_ties(self):
+        # nieocenione audiobooki mają sort_rating = 0.0 - jeden wielki remis
+        Audiobook.objects.bulk_create(
+            Audiobook(
+                title=f'Unrated Audiobook {i}', description='Unrated', author=self.author, category=self.category,
+                narrator='Unrated Narrator', duration_minutes=60, publication_date='2023-01-01'
+            )
+            for i in range(1050)
+        )
+        user = User.objects.create_user(email='tierater@example.com', password='testpass123')
+        rated = Audiobook.objects.get(title='Paged Audiobook 3')
+        Rating.objects.create(user=user, audiobook=rated, rating=4)
+
+        ids = []
+        response = self.client.get(reverse('audiobook-list'), {'ordering': '-rating', 'page_size': 100})
+        while True:
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids[0], rated.id)
+        self.assertEqual(ids[1:], sorted(Audiobook.objects.exclude(pk=rated.pk).values_list('id', flat=True), reverse=True))
+
+    def test_unknown_ordering_falls_back_to_default(self):
+        titles = self.collect_pages({'ordering': 'description', 'page_size': 10})
+        self.assertEqual(titles, [f'Paged Audiobook {i}' for i in reversed(range(5))])
+
+
+class FullTextSearchTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = Author.objects.create(name="Joanna Rowling", bio="Brytyjska pisarka")
+        self.category = Category.objects.create(name="Fantasy")
+        self.in_title = self.create_audiobook('Dragon Rider', 'A story about friendship')
+        self.in_description = self.create_audiobook('Night Flight', 'A dragon appears at night')
+
+    def create_audiobook(self, title, description, author=None):
+        return Audiobook.objects.create(
+            title=title,
+            description=description,
+            author=author or self.author,
+            category=self.category,
+            narrator='Search Narrator',
+            duration_minutes=60,
+            publication_date='2023-01-01'
+        )
+
+    def search_titles(self, query):
+        response = self.client.get(reverse('audiobook-list'), {'search': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['title'] for book in response.data['results']]
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search_titles('dragon'), ['Dragon Rider', 'Night Flight'])
+
+    def test_search_matches_prefixes(self):
+        self.assertEqual(self.search_titles('drag rid'), ['Dragon Rider'])
+
+    def test_search_follows_author_rename_and_delete(self):
+        self.author.name = 'Robert Galbraith'
+        self.author.save()
+        self.assertEqual(len(self.search_titles('galbraith')), 2)
+
+        self.in_title.delete()
+        self.assertEqual(self.search_titles('galbraith'), ['Night Flight'])
+
+    def test_search_filters_and_pages_every_match(self):
+        # 250 mocnych trafień w tytule zajmuje całą czołówkę rankingu;
+        # słabsze trafienia z innej kategorii muszą i tak przejść filtr
+        other = Category.objects.create(name="Other")
+        Audiobook.objects.bulk_create(
+            Audiobook(
+                title=f'Dragon Dragon {i}', description='Dragon', author=self.author, category=self.category,
+                narrator='Search Narrator', duration_minutes=60, publication_date='2023-01-01'
+            )
+            for i in range(250)
+        )
+        search.rebuild_search_index()
+        weak = [self.create_audiobook(f'Weak {i}', 'One dragon in the description', author=None) for i in range(3)]
+        Audiobook.objects.filter(pk__in=[book.pk for book in weak]).update(category=other)
+
+        response = self.client.get(reverse('audiobook-list'), {'search': 'dragon', 'category': other.pk})
+        self.assertEqual({book['title'] for book in response.data['results']}, {'Weak 0', 'Weak 1', 'Weak 2'})
+
+        ids = []
+        response = self.client.get(reverse('audiobook-list'), {'search': 'dragon', 'page_size': 100})
+        while True:
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(ids), 255)
+        self.assertEqual(set(ids), set(Audiobook.objects.values_list('id', flat=True)))
+
+    def test_postgresql_search_uses_tsvector_index(self):
+        self.assertEqual(search.build_tsquery('Harry  pot'), "'harry':* & 'pot':*")
+        with mock.patch('users.search.get_vendor', return_value='postgresql'):
+            sql = str(search.search_audiobooks(Audiobook.objects.all(), 'harry').query)
+        self.assertIn('WHERE document @@ to_tsquery', sql)
+        self.assertIn('-ts_rank(document', sql)
+
+    def test_search_without_fts_falls_back_to_icontains(self):
+        with mock.patch('users.search.is_supported', return_value=False):
+            self.assertEqual(set(self.search_titles('dragon')), {'Dragon Rider', 'Night Flight'})
+            self.assertEqual(self.search_titles('ROWLING'), ['Dragon Rider', 'Night Flight'])
+            response = self.client.get(reverse('audiobook-list'), {'search': 'dragon', 'free_only': 'true', 'page_size': 1})
+            self.assertEqual(len(response.data['results']), 1)
+            self.assertEqual(
+                [book['title'] for book in self.client.get(response.data['next']).data['results']], ['Night Flight']
+            )
+
+            response = self.client.get(reverse('author-list'), {'search': 'pisarka'})
+            self.assertEqual([author['name'] for author in response.data['results']], ['Joanna Rowling'])
+
+    def test_author_search(self):
+        Author.objects.create(name="Andrzej Sapkowski", bio="Autor sagi o wiedźminie")
+        response = self.client.get(reverse('author-list'), {'search': 'wiedzmin'})
+
+        self.assertEqual([a['name'] for a in response.data['results']], ['Andrzej Sapkowski'])
@@ -2,6 +2,8 @@ from django.contrib import admin
 from .models import *
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from .utils import get_file_size_display
 
 admin.site.register(CustomUser)
@@ -11,40 +13,46 @@ class AuthorAdmin(admin.ModelAdmin):
     list_display = ['name', 'audiobooks_count']
     search_fields = ['name']
     ordering = ['name']
-    
-    def audiobooks_count(self, obj):
-        return obj.audiobooks.count()
-    audiobooks_count.short_description = 'Liczba audiobooków'
+    readonly_fields = ['audiobooks_count']
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'audiobooks_count']
     search_fields = ['name']
-    
-    def audiobooks_count(self, obj):
-        return obj.audiobooks.count()
-    audiobooks_count.short_description = 'Liczba audiobooków'
+    readonly_fields = ['audiobooks_count']
 
 class ChapterInline(admin.TabularInline):
     model = Chapter
     extra = 1
-    fields = ['chapter_number', 'title', 'audio_file', 'file_size_display', 'duration_seconds']
-    readonly_fields = ['file_size_display']
+    fields = ['chapter_number', 'title', 'audio_file', 'file_size_display', 'audio_format', 'duration_seconds']
+    readonly_fields = ['file_size_display', 'audio_format']
     ordering = ['chapter_number']
     
     def file_size_display(self, obj):
+        # rozmiar zapisany przy wgraniu - bez odpytywania storage
         if obj.audio_file:
-            return get_file_size_display(obj.audio_file.size)
+            return get_file_size_display(obj.file_size)
         return "Brak pliku"
     file_size_display.short_description = 'Rozmiar pliku'
 
+    def audio_format(self, obj):
+        if not obj.codec:
+            return "-"
+        details = [obj.codec]
+        if obj.bitrate_kbps:
+            details.append(f"{obj.bitrate_kbps} kbps")
+        if obj.sample_rate:
+            details.append(f"{obj.sample_rate / 1000:g} kHz")
+        return ", ".join(details)
+    audio_format.short_description = 'Format'
+
 @admin.register(Audiobook)
 class AudiobookAdmin(admin.ModelAdmin):
     list_display = ['title', 'author', 'category', 'cover_preview', 'chapters_count', 
                    'total_file_size', 'is_premium', 'price', 'is_featured', 'created_at']
     list_filter = ['category', 'author', 'is_premium', 'is_featured', 'publication_date']
     search_fields = ['title', 'author__name', 'narrator']
-    readonly_fields = ['cover_preview', 'total_file_size', 'created_at']
+    readonly_fields = ['cover_preview', 'duration_minutes', 'total_file_size', 'created_at']
     list_editable = ['is_premium', 'price', 'is_featured']
     
     fieldsets = (
@@ -67,6 +75,11 @@ class AudiobookAdmin(admin.ModelAdmin):
     )
     
     inlines = [ChapterInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            audio_file_size=Coalesce(Sum('chapters__file_size'), 0)
+        )
     
     def cover_preview(self, obj):
         if obj.cover_image:
@@ -82,27 +95,25 @@ class AudiobookAdmin(admin.ModelAdmin):
     chapters_count.short_description = 'Rozdziały'
     
     def total_file_size(self, obj):
-        total_size = 0
-        if obj.cover_image:
-            total_size += obj.cover_image.size
-        
-        for chapter in obj.chapters.all():
-            if chapter.audio_file:
-                total_size += chapter.audio_file.size
-        
+        # suma Chapter.file_size z adnotacji - bez odpytywania storage o każdy plik
+        total_size = getattr(obj, 'audio_file_size', None)
+        if total_size is None:
+            total_size = obj.chapters.aggregate(total=Coalesce(Sum('file_size'), 0))['total']
         return get_file_size_display(total_size)
-    total_file_size.short_description = 'Całkowity rozmiar plików'
+    total_file_size.short_description = 'Rozmiar plików audio'
+    total_file_size.admin_order_field = 'audio_file_size'
 
 @admin.register(Chapter)
 class ChapterAdmin(admin.ModelAdmin):
     list_display = ['audiobook', 'chapter_number', 'title', 'audio_file_info', 'duration_formatted']
+    list_select_related = ['audiobook']
     list_filter = ['audiobook']
     search_fields = ['title', 'audiobook__title']
     readonly_fields = ['audio_file_info']
     
     def audio_file_info(self, obj):
         if obj.audio_file:
-            size = get_file_size_display(obj.audio_file.size)
+            size = get_file_size_display(obj.file_size)
             return format_html(
                 '<a href="{}" target="_blank">Audio: {}</a><br/><small>Rozmiar: {}</small>',
                 obj.audio_file.url,
@@ -137,6 +148,12 @@ class ListeningProgressAdmin(admin.ModelAdmin):
     def progress_percentage(self, obj):
         return f"{obj.progress_percentage}%"
     progress_percentage.short_description = 'Postęp'
+    progress_percentage.admin_order_field = 'progress_value'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'user', 'audiobook', 'current_chapter'
+        ).with_progress()
 
 @admin.register(Rating)
 class RatingAdmin(admin.ModelAdmin):
@@ -194,6 +211,13 @@ class PurchaseAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user', 'audiobook', 'audiobook__author')
 
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'received_at']
+    list_filter = ['type', 'received_at']
+    search_fields = ['event_id']
+    readonly_fields = ['event_id', 'type', 'received_at']
+
 admin.site.site_header = "Panel Administracyjny - Audiobooki"
 admin.site.site_title = "Audiobooki Admin"
 admin.site.index_title = "Zarządzanie Audiobookami"
\ No newline at end of file
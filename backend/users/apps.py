@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .database import configure_sqlite
+        from .metrics import install_query_counter
+        connection_created.connect(configure_sqlite, dispatch_uid='users.configure_sqlite')
+        connection_created.connect(install_query_counter, dispatch_uid='users.install_query_counter')
@@ -0,0 +1,49 @@
+# audio_metadata.py - Odczyt parametrów pliku audio z nagłówków
+#
+# mutagen czyta tylko nagłówki kontenera (ramka Xing/VBRI w MP3, atom moov
+# w M4A, chunk fmt w WAV) i przeskakuje dane audio przez seek(), więc nawet
+# plik 500MB sprawdzamy w ułamku sekundy, bez dekodowania. Wynik trafia do
+# pól rozdziału w Chapter.save() przy każdym nowym pliku.
+import logging
+from dataclasses import dataclass
+
+import mutagen
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AudioMetadata:
+    duration_seconds: int
+    bitrate_kbps: int | None
+    codec: str
+    sample_rate: int | None
+    file_size: int
+
+
+def probe_audio(file):
+    """Zwraca AudioMetadata dla pliku (File/UploadedFile/FieldFile) albo None, gdy formatu nie da się odczytać."""
+    position = file.tell() if hasattr(file, 'tell') else None
+    try:
+        file.seek(0)
+        audio = mutagen.File(file)
+    except (mutagen.MutagenError, OSError, ValueError) as e:
+        logger.warning(f"Could not probe audio file {getattr(file, 'name', '')}: {e}")
+        return None
+    finally:
+        if position is not None:
+            file.seek(position)
+
+    if audio is None or getattr(audio.info, 'length', 0) <= 0:
+        return None
+
+    info = audio.info
+    bitrate = getattr(info, 'bitrate', 0)
+    return AudioMetadata(
+        duration_seconds=int(round(info.length)),
+        bitrate_kbps=round(bitrate / 1000) if bitrate else None,
+        # MP4 podaje kodek (mp4a.40.2, alac), dla reszty wystarcza kontener
+        codec=(getattr(info, 'codec', None) or type(audio).__name__).lower()[:20],
+        sample_rate=getattr(info, 'sample_rate', None) or None,
+        file_size=file.size,
+    )
@@ -1,20 +1,29 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
 User = get_user_model()
 
 
-class EmailAuthBackend:
-    def authenticate(self, request, email=None, password=None):
+class EmailAuthBackend(ModelBackend):
+    # Jedyny backend logowania: jedno zapytanie po unikalnym indeksie
+    # Lower('email') (ta sama normalizacja co rejestracja i check-email)
+    # i dokładnie jedno liczenie hasha na próbę - także dla nieznanego
+    # adresu, żeby czas odpowiedzi nie zdradzał, czy konto istnieje.
+    # Uprawnienia (admin) dziedziczone z ModelBackend.
 
-        try:
-            user = User.objects.get(email=email)
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None:
+            email = kwargs.get('username', kwargs.get(User.USERNAME_FIELD))
+        if email is None or password is None:
             return None
-    
-    def get_user(self, user_id):
 
         try:
-            return User.objects.get(pk=user_id)
+            user = User._default_manager.get_by_email(email)
         except User.DoesNotExist:
-            return None
\ No newline at end of file
+            # pusty hash tym samym (preferowanym) hasherem co prawdziwe konto
+            User().set_password(password)
+            return None
+
+        # check_password przelicza hash, gdy zmienił się hasher albo jego koszt
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,244 @@
+# authentication.py - Uwierzytelnianie tokenem Knox z cache
+#
+# knox.auth.TokenAuthentication przy każdym żądaniu szuka tokenu po
+# prefiksie, porównuje SHA-512, pobiera użytkownika i (przy AUTO_REFRESH)
+# zapisuje nowe wygaśnięcie. CachedTokenAuthentication po pierwszej
+# udanej weryfikacji trzyma AuthToken razem z użytkownikiem w cache
+# (KNOX_CACHE) pod kluczem z digestu tokenu, na KNOX_CACHE_TTL_SECONDS -
+# kolejne żądania z tym tokenem to dwa odczyty z cache (wpis i wersja
+# użytkownika), bez bazy.
+#
+# Unieważnianie (signals.py):
+#   - usunięcie AuthToken (LogoutView, LogoutAllView, wygaśnięcie) kasuje wpis,
+#   - zapis/usunięcie użytkownika (np. is_active=False) ustawia nową wersję
+#     (znacznik czasu, więc i wersja odtworzona po wyrzuceniu klucza z cache
+#     jest nowa), przez co wszystkie jego wpisy przestają pasować.
+# KNOX_CACHE musi być współdzielony (Redis/Memcached), inaczej wylogowanie
+# dotarłoby do innych procesów dopiero po TTL - przy LocMemCache cache
+# tokenów jest wyłączony i każde żądanie weryfikuje token w bazie
+# (shared_cache.py).
+#
+# Przedłużanie ważności (AUTO_REFRESH) nie zapisuje tokenu od razu: nowe
+# wygaśnięcie trafia do wpisu w cache i do bufora, który co
+# KNOX_REFRESH_FLUSH_SECONDS zapisuje wszystkie tokeny jednym bulk_update.
+# Wątek w tle (KNOX_REFRESH_BACKGROUND_FLUSH) zapisuje bufor także wtedy,
+# gdy ruch ustał, a atexit przy zamknięciu workera - inaczej Knox usunąłby
+# później używany token z nieprzedłużonym wygaśnięciem.
+import atexit
+import binascii
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.models import get_token_model
+from knox.settings import knox_settings
+from rest_framework import exceptions
+
+from .shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache():
+    """Współdzielony cache tokenów albo None, gdy jest wyłączony."""
+    return shared_cache(getattr(settings, 'KNOX_CACHE', 'default'))
+
+
+def get_cache_ttl():
+    return getattr(settings, 'KNOX_CACHE_TTL_SECONDS', 300)
+
+
+def token_key(digest):
+    return f'knox:token:{digest}'
+
+
+def user_version_key(user_id):
+    return f'knox:user:{user_id}'
+
+
+def get_user_version(user_id):
+    return get_cache().get_or_set(user_version_key(user_id), time.time_ns(), timeout=None)
+
+
+def invalidate_token(digest):
+    cache = get_cache()
+    if cache is not None:
+        cache.delete(token_key(digest))
+    refresh_buffer.discard(digest)
+
+
+def invalidate_user(user_id):
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.set(user_version_key(user_id), time.time_ns(), timeout=None)
+
+
+class RefreshBuffer:
+    """Nowe daty wygaśnięcia tokenów czekające na zbiorczy zapis; bezpieczny dla wątków."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._flusher_pid = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'KNOX_REFRESH_FLUSH_SECONDS', 60)
+
+    def add(self, auth_token):
+        self.start_flusher()
+        with self._lock:
+            self._pending[auth_token.digest] = auth_token.expiry
+            due = self._due()
+        if due:
+            self.flush()
+
+    def _due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush_if_due(self):
+        """Zapisuje bufor, jeśli minął interwał - wywoływane przez wątek w tle."""
+        with self._lock:
+            due = bool(self._pending) and self._due()
+        return self.flush() if due else 0
+
+    def start_flusher(self):
+        if not getattr(settings, 'KNOX_REFRESH_BACKGROUND_FLUSH', True):
+            return
+        # po fork() (np. gunicorn --preload) wątek rodzica nie istnieje w dziecku
+        if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name='knox-refresh-flush', daemon=True)
+            self._flusher_pid = os.getpid()
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(max(self.flush_interval / 2, 0.1))
+            try:
+                self.flush_if_due()
+            except Exception:
+                logger.exception("Periodic token refresh flush failed")
+            finally:
+                # wątek ma własne połączenie - nie trzymamy go otwartego między zapisami
+                connection.close()
+
+    def discard(self, digest):
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        AuthToken = get_token_model()
+        # tokeny usunięte w międzyczasie po prostu nie trafią do zapisu
+        tokens = list(AuthToken.objects.filter(digest__in=list(pending)).only('digest', 'expiry'))
+        for auth_token in tokens:
+            auth_token.expiry = pending[auth_token.digest]
+        AuthToken.objects.bulk_update(tokens, ['expiry'])
+        return len(tokens)
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+
+
+refresh_buffer = RefreshBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        refresh_buffer.flush()
+    except Exception:
+        logger.exception("Token refresh flush on exit failed")
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, token):
+        if get_cache() is None:
+            return super().authenticate_credentials(token)
+
+        try:
+            digest = hash_token(token.decode('utf-8'))
+        except (TypeError, UnicodeDecodeError, binascii.Error):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        auth_token = self.cached_token(digest)
+        if auth_token is not None:
+            if knox_settings.AUTO_REFRESH and auth_token.expiry and self.renew(auth_token):
+                self.store(auth_token)
+            return auth_token.user, auth_token
+
+        # weryfikacja, sprzątanie wygasłych tokenów i odświeżenie jak w Knox
+        user, auth_token = super().authenticate_credentials(token)
+        self.store(auth_token)
+        return user, auth_token
+
+    def cached_token(self, digest):
+        cache = get_cache()
+        entry = cache.get(token_key(digest))
+        if entry is None:
+            return None
+
+        auth_token, user_version = entry
+        if user_version != get_user_version(auth_token.user_id):
+            return None
+        if auth_token.expiry is not None and auth_token.expiry < timezone.now():
+            # wygasły - Knox usunie go z bazy przy weryfikacji
+            cache.delete(token_key(digest))
+            return None
+        return auth_token
+
+    def store(self, auth_token, timeout=None):
+        timeout = timeout or get_cache_ttl()
+        if auth_token.expiry is not None:
+            remaining = (auth_token.expiry - timezone.now()).total_seconds()
+            timeout = max(1, min(timeout, int(remaining)))
+        get_cache().set(
+            token_key(auth_token.digest),
+            (auth_token, get_user_version(auth_token.user_id)),
+            timeout
+        )
+
+    def renew(self, auth_token):
+        """Przesuwa wygaśnięcie jak Knox, ale zapis idzie do bufora; zwraca True, gdy się zmieniło."""
+        new_expiry = timezone.now() + knox_settings.TOKEN_TTL
+        if knox_settings.AUTO_REFRESH_MAX_TTL is not None:
+            new_expiry = min(new_expiry, auth_token.created + knox_settings.AUTO_REFRESH_MAX_TTL)
+
+        # jak w Knox: zapis tylko, gdy przesunięcie przekracza MIN_REFRESH_INTERVAL
+        if (new_expiry - auth_token.expiry).total_seconds() <= knox_settings.MIN_REFRESH_INTERVAL:
+            return False
+        auth_token.expiry = new_expiry
+        refresh_buffer.add(auth_token)
+        return True
+
+    def renew_token(self, auth_token):
+        # wywoływane przez Knox po weryfikacji w bazie
+        self.renew(auth_token)
+
+
+async def aauthenticate(request):
+    """(user, auth_token) albo None dla zwykłego HttpRequest - dla widoków async poza DRF."""
+    return await sync_to_async(CachedTokenAuthentication().authenticate)(request)
@@ -0,0 +1,142 @@
+# conditional.py - Walidatory ETag / Last-Modified dla często odpytywanych widoków
+#
+# Odtwarzacz i biblioteka co chwilę pobierają te same dane. Zamiast liczyć
+# hash gotowej odpowiedzi (co wymaga zapytań i serializacji), walidator
+# składamy z tanich wartości: max(last_listened), max(added_at), liczby
+# wierszy, wersji uprawnień użytkownika (entitlements.py), generacji
+# katalogu (response_cache.py) i wersji pojedynczego audiobooka. Gdy
+# If-None-Match / If-Modified-Since pasuje, widok zwraca 304 bez
+# uruchamiania serializerów. Bez współdzielonego cache (shared_cache.py)
+# wersji nie ma skąd wziąć - walidator jest wtedy None i widok zwraca
+# zwykłą odpowiedź.
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from . import entitlements, response_cache
+from .heartbeat import progress_buffer
+from .models import ListeningProgress, UserLibrary
+from .signing import expiry_for
+
+
+def audiobook_version_key(audiobook_id):
+    return f'catalog:audiobook:{audiobook_id}:version'
+
+
+def get_version_ttl():
+    # wersja jest tworzona dla każdego pk z adresu, także nieistniejącego -
+    # skończony TTL; po wygaśnięciu powstaje nowa, czyli jedna pełna odpowiedź
+    return getattr(settings, 'AUDIOBOOK_VERSION_TTL_SECONDS', 24 * 60 * 60)
+
+
+def get_audiobook_version(audiobook_id):
+    cache = response_cache.get_cache()
+    if cache is None:
+        return None
+    return cache.get_or_set(audiobook_version_key(audiobook_id), time.time_ns(), timeout=get_version_ttl())
+
+
+def bump_audiobook_versions(audiobook_ids):
+    cache = response_cache.get_cache()
+    if cache is None:
+        return
+    # znacznik czasu zamiast licznika - wersja po wyrzuceniu klucza z cache i tak będzie nowa
+    version = time.time_ns()
+    cache.set_many(
+        {audiobook_version_key(audiobook_id): version for audiobook_id in audiobook_ids},
+        timeout=get_version_ttl()
+    )
+
+
+def make_etag(*parts):
+    # słaby ETag - wskazuje stan danych, nie konkretne bajty odpowiedzi
+    return f'W/"{hashlib.sha1(repr(parts).encode()).hexdigest()}"'
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def progress_validator(user):
+    generation = response_cache.get_generation()
+    if generation is None:
+        return None
+
+    # jedno zapytanie; bufor heartbeatów nakłada niezapisane pozycje na odpowiedź
+    state = ListeningProgress.objects.filter(user=user).aggregate(latest=Max('last_listened'), count=Count('id'))
+    last_modified = _latest(state['latest'], progress_buffer.latest_pending(user.pk))
+    etag = make_etag('progress', user.pk, last_modified, state['count'], generation)
+    return etag, last_modified
+
+
+def _user_aggregate(model, aggregate):
+    return Subquery(
+        model.objects.filter(user=OuterRef('pk')).order_by().values('user').annotate(value=aggregate).values('value')
+    )
+
+
+def library_validator(user):
+    entitlements_version = entitlements.get_version(user.pk)
+    generation = response_cache.get_generation()
+    if entitlements_version is None or generation is None:
+        return None
+
+    # biblioteka i postęp w jednym zapytaniu
+    latest_added, count, latest_listened = get_user_model().objects.filter(pk=user.pk).values_list(
+        _user_aggregate(UserLibrary, Max('added_at')),
+        _user_aggregate(UserLibrary, Count('id')),
+        _user_aggregate(ListeningProgress, Max('last_listened')),
+    ).get()
+    etag = make_etag(
+        'library', user.pk,
+        latest_added, count,
+        # is_favorite zmienia się bez zmiany added_at - wersja uprawnień rośnie przy każdym zapisie UserLibrary
+        entitlements_version,
+        _latest(latest_listened, progress_buffer.latest_pending(user.pk)),
+        generation,
+    )
+    return etag, None
+
+
+def audiobook_validator(user, audiobook_id):
+    version = get_audiobook_version(audiobook_id)
+    if version is None:
+        return None
+
+    parts = ['audiobook', audiobook_id, version, expiry_for()]
+    if user.is_authenticated:
+        entitlements_version = entitlements.get_version(user.pk)
+        if entitlements_version is None:
+            return None
+        listened = ListeningProgress.objects.filter(
+            user=user, audiobook_id=audiobook_id
+        ).values_list('last_listened', flat=True).first()
+        pending = progress_buffer.pending(user.pk, audiobook_id)
+        parts += [user.pk, entitlements_version, listened, pending and pending.updated_at]
+    return make_etag(*parts), None
+
+
+def conditional_response(request, validator, build_response):
+    """Zwraca 304 dla pasującego walidatora, inaczej wynik build_response() z nagłówkami walidatora."""
+    if validator is None:
+        return build_response()
+
+    etag, last_modified = validator
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build_response()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Authorization',))
+    return response
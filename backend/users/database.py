@@ -0,0 +1,38 @@
+# database.py - Ustawienia połączeń z bazą
+#
+# SQLite domyślnie pisze w trybie rollback journal z pełnym fsync, więc
+# każdy zapis blokuje czytelników, a równoległe zapisy (update_progress,
+# heartbeat) kończą się "database is locked". Dla każdego nowego połączenia
+# ustawiamy PRAGMA z settings.SQLITE_PRAGMAS:
+#   - journal_mode=WAL - czytelnicy nie czekają na zapis (trwałe w pliku),
+#   - synchronous=NORMAL - fsync tylko przy checkpoincie WAL; po awarii
+#     zasilania można stracić ostatnie transakcje, ale baza pozostaje spójna,
+#   - mmap_size, cache_size, temp_store - mniej wywołań read() i I/O.
+# Baza w pamięci (testy) nie obsługuje WAL, więc journal_mode jest pomijany.
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def is_memory_database(connection):
+    name = str(connection.settings_dict.get('NAME') or '')
+    return name == ':memory:' or 'mode=memory' in name
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Odbiornik connection_created - podłączany w UsersConfig.ready()."""
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if name == 'journal_mode' and is_memory_database(connection):
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+            if name == 'journal_mode':
+                mode = cursor.fetchone()[0]
+                if mode.lower() != str(value).lower():
+                    logger.warning(f'SQLite journal_mode is {mode}, not {value}')
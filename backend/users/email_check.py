@@ -0,0 +1,72 @@
+# email_check.py - Sprawdzanie, czy adres email jest zajęty (rejestracja)
+#
+# Register.jsx pyta check-email/ przy wpisywaniu adresu, więc te same
+# adresy wracają wiele razy w ciągu kilku sekund. Wynik (także "wolny")
+# jest trzymany w cache przez CHECK_EMAIL_CACHE_TTL_SECONDS pod kluczem
+# z SHA-256 znormalizowanego adresu - bez adresu w nazwie klucza. Nowe
+# konto (signals.py) kasuje wpis, więc "wolny" nie przeżyje rejestracji.
+#
+# Normalizacja to ta sama CustomUserManager.normalize_email co przy
+# rejestracji i logowaniu (małe litery, obcięte spacje); zapytanie idzie
+# po unikalnym indeksie Lower('email') (users_email_lower_uniq), więc
+# Jan@X.pl i jan@x.pl to ten sam, zajęty adres - i ten sam przy zapisie.
+#
+# Log 'users.email_check' dostaje linię JSON tylko dla części wywołań
+# (CHECK_EMAIL_LOG_SAMPLE_RATE) i bez samego adresu.
+import hashlib
+import json
+import logging
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.functions import Lower
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache():
+    return caches[getattr(settings, 'CHECK_EMAIL_CACHE', 'default')]
+
+
+def get_cache_ttl():
+    return getattr(settings, 'CHECK_EMAIL_CACHE_TTL_SECONDS', 30)
+
+
+def normalize(email):
+    return get_user_model().objects.normalize_email(email)
+
+
+def cache_key(email):
+    return 'check-email:' + hashlib.sha256(normalize(email).encode()).hexdigest()
+
+
+def email_exists(email):
+    """Zwraca (exists, cached)."""
+    key = cache_key(email)
+    exists = get_cache().get(key)
+    if exists is not None:
+        return exists, True
+
+    User = get_user_model()
+    exists = User.objects.alias(email_lower=Lower('email')).filter(email_lower=normalize(email)).exists()
+    get_cache().set(key, exists, get_cache_ttl())
+    return exists, False
+
+
+def invalidate(email):
+    get_cache().delete(cache_key(email))
+
+
+def log_check(email, exists, cached):
+    rate = getattr(settings, 'CHECK_EMAIL_LOG_SAMPLE_RATE', 0.01)
+    if rate < 1 and random.random() >= rate:
+        return
+    logger.info(json.dumps({
+        'event': 'check_email',
+        'domain': normalize(email).rpartition('@')[2],
+        'exists': exists,
+        'cached': cached,
+        'sample_rate': rate,
+    }))
@@ -0,0 +1,137 @@
+# entitlements.py - Zakupione audiobooki i biblioteka użytkownika w pamięci
+#
+# Sprawdzenie dostępu do audiobooka premium było osobnym zapytaniem
+# Purchase...exists() w każdym widoku i serializerze. Tutaj ID zakupionych
+# audiobooków i pozycji w bibliotece są ładowane raz (jedno zapytanie UNION)
+# do frozensetów, więc każde sprawdzenie to test przynależności do zbioru.
+#
+# Dwa poziomy cache:
+#   - na czas żądania (atrybut HttpRequest),
+#   - współdzielony cache Django pod kluczem z wersją użytkownika; przy
+#     cache lokalnym dla procesu (shared_cache.py) tylko pierwszy poziom,
+#     bo podbicie wersji w jednym workerze nie dotarłoby do pozostałych.
+# Zapis/usunięcie Purchase lub UserLibrary (signals.py) ustawia nową wersję,
+# więc stare wpisy po prostu przestają być czytane i wygasają po TTL.
+# Wersja to znacznik czasu, nie licznik - po wyrzuceniu klucza wersji z
+# cache nowa wartość nie trafi na stary wpis z tą samą liczbą. Masowe
+# queryset.update() omija sygnały - po nim trzeba wywołać invalidate().
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Value
+
+from .models import Purchase, UserLibrary
+from .shared_cache import shared_cache
+
+REQUEST_ATTRIBUTE = '_entitlements'
+
+KIND_PURCHASED = 'p'
+KIND_LIBRARY = 'l'
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    purchased: frozenset = frozenset()
+    library: frozenset = frozenset()
+
+    def has_purchased(self, audiobook_id):
+        return audiobook_id in self.purchased
+
+    def in_library(self, audiobook_id):
+        return audiobook_id in self.library
+
+    def can_access(self, audiobook):
+        return not audiobook.is_premium or audiobook.pk in self.purchased
+
+
+ANONYMOUS = Entitlements()
+
+
+def get_cache():
+    return shared_cache(getattr(settings, 'ENTITLEMENTS_CACHE', 'default'))
+
+
+def get_cache_ttl():
+    return getattr(settings, 'ENTITLEMENTS_CACHE_TTL_SECONDS', 300)
+
+
+def version_key(user_id):
+    return f'entitlements:version:{user_id}'
+
+
+def data_key(user_id, version):
+    return f'entitlements:{user_id}:{version}'
+
+
+def load_entitlements(user_id):
+    rows = Purchase.objects.filter(
+        user_id=user_id,
+        payment_status='completed'
+    ).order_by().values_list('audiobook_id', Value(KIND_PURCHASED, output_field=models.CharField())).union(
+        UserLibrary.objects.filter(user_id=user_id).order_by().values_list(
+            'audiobook_id', Value(KIND_LIBRARY, output_field=models.CharField())
+        ),
+        all=True
+    )
+
+    purchased, library = set(), set()
+    for audiobook_id, kind in rows:
+        (purchased if kind == KIND_PURCHASED else library).add(audiobook_id)
+    return Entitlements(frozenset(purchased), frozenset(library))
+
+
+def get_version(user_id):
+    # zmienia się przy każdym zapisie Purchase/UserLibrary użytkownika;
+    # None bez współdzielonego cache - wtedy nie ma wspólnej wersji
+    cache = get_cache()
+    if cache is None:
+        return None
+    return cache.get_or_set(version_key(user_id), time.time_ns(), timeout=None)
+
+
+def get_user_entitlements(user_id):
+    cache = get_cache()
+    if cache is None:
+        return load_entitlements(user_id)
+
+    key = data_key(user_id, get_version(user_id))
+
+    cached = cache.get(key)
+    if cached is not None:
+        purchased, library = cached
+        return Entitlements(frozenset(purchased), frozenset(library))
+
+    entitlements = load_entitlements(user_id)
+    # w cache zwykłe posortowane listy - mniejsze po serializacji niż zbiory
+    cache.set(key, (sorted(entitlements.purchased), sorted(entitlements.library)), get_cache_ttl())
+    return entitlements
+
+
+def get_entitlements(request):
+    """Uprawnienia użytkownika z żądania (DRF Request albo HttpRequest), liczone raz na żądanie."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS
+
+    http_request = getattr(request, '_request', request)
+    entitlements = getattr(http_request, REQUEST_ATTRIBUTE, None)
+    if entitlements is None:
+        entitlements = get_user_entitlements(user.pk)
+        setattr(http_request, REQUEST_ATTRIBUTE, entitlements)
+    return entitlements
+
+
+def _bump_version(user_id):
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.set(version_key(user_id), time.time_ns(), timeout=None)
+
+
+def invalidate(user_id):
+    _bump_version(user_id)
+    # drugie podbicie po commicie - równoległe żądanie mogło w międzyczasie
+    # zapisać w cache stan sprzed zatwierdzenia transakcji
+    transaction.on_commit(lambda: _bump_version(user_id))
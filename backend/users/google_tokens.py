@@ -0,0 +1,116 @@
+# google_tokens.py - Weryfikacja tokenów Google ID z cache kluczy (JWKS)
+#
+# id_token.verify_oauth2_token przy każdym logowaniu pobiera certyfikaty
+# Google, co dokłada do logowania setki milisekund sieci. Tutaj zestaw
+# kluczy (GOOGLE_JWKS_URL) jest pobierany raz, zamieniany na klucze
+# publiczne PEM i trzymany w cache (GOOGLE_JWKS_CACHE) tak długo, jak
+# pozwala max-age z Cache-Control odpowiedzi - przy współdzielonym cache
+# jeden worker pobiera klucze dla wszystkich. Podpis, aud, iss i exp są
+# sprawdzane lokalnie przez google.auth.jwt.
+#
+# Token z nieznanym kid (Google właśnie zrotował klucze) wymusza ponowne
+# pobranie, ale nie częściej niż co GOOGLE_JWKS_MIN_REFRESH_SECONDS, żeby
+# śmieciowe tokeny nie zamieniły się w ruch do Google.
+#
+# GOOGLE_JWKS_URL może wskazywać plik (file:///...), np. z fałszywym
+# zestawem kluczy do pracy offline i testów obciążeniowych.
+import base64
+import json
+import re
+import time
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.core.cache import caches
+from google.auth import exceptions, jwt
+from google.auth.transport import requests
+
+GOOGLE_JWKS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+CACHE_KEY = 'google:jwks'
+
+MAX_AGE_RE = re.compile(r'(?:^|,)\s*max-age\s*=\s*(\d+)', re.IGNORECASE)
+
+
+def get_cache():
+    return caches[getattr(settings, 'GOOGLE_JWKS_CACHE', 'default')]
+
+
+def get_jwks_url():
+    return getattr(settings, 'GOOGLE_JWKS_URL', GOOGLE_JWKS_URL)
+
+
+def parse_max_age(cache_control):
+    match = MAX_AGE_RE.search(cache_control or '')
+    if match:
+        return int(match.group(1))
+    return getattr(settings, 'GOOGLE_JWKS_DEFAULT_MAX_AGE', 3600)
+
+
+def b64_to_int(value):
+    return int.from_bytes(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)), 'big')
+
+
+def jwk_to_pem(jwk):
+    public_key = rsa.RSAPublicNumbers(b64_to_int(jwk['e']), b64_to_int(jwk['n'])).public_key()
+    return public_key.public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('ascii')
+
+
+def fetch_keyset(url):
+    """Pobiera JWKS; zwraca (dane, max_age w sekundach)."""
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        with open(url2pathname(parsed.path), encoding='utf-8') as handle:
+            return json.load(handle), parse_max_age(None)
+
+    response = requests.Request()(url, method='GET', timeout=5)
+    if response.status != 200:
+        raise exceptions.TransportError(f'Nie udało się pobrać kluczy Google ({response.status})')
+    return json.loads(response.data), parse_max_age(response.headers.get('Cache-Control'))
+
+
+def refresh_keys():
+    jwks, max_age = fetch_keyset(get_jwks_url())
+    keys = {jwk['kid']: jwk_to_pem(jwk) for jwk in jwks.get('keys', []) if jwk.get('kty') == 'RSA'}
+    if max_age > 0:
+        get_cache().set(CACHE_KEY, {'keys': keys, 'fetched_at': time.time()}, max_age)
+    return keys
+
+
+def get_keys(key_id=None):
+    """Klucze PEM po kid - z cache albo świeżo pobrane, gdy brakuje wpisu lub klucza key_id."""
+    entry = get_cache().get(CACHE_KEY)
+    if entry is None:
+        return refresh_keys()
+
+    min_refresh = getattr(settings, 'GOOGLE_JWKS_MIN_REFRESH_SECONDS', 60)
+    if key_id and key_id not in entry['keys'] and time.time() - entry['fetched_at'] >= min_refresh:
+        return refresh_keys()
+    return entry['keys']
+
+
+def token_key_id(token):
+    try:
+        header = token.split('.', 1)[0]
+        return json.loads(base64.urlsafe_b64decode(header + '=' * (-len(header) % 4))).get('kid')
+    except (AttributeError, ValueError):
+        raise exceptions.MalformedError('Nieprawidłowy nagłówek tokenu')
+
+
+def verify_google_token(token, audience, clock_skew_in_seconds=60):
+    """
+    Odpowiednik id_token.verify_oauth2_token bez pobierania certyfikatów przy
+    każdym wywołaniu. Błędy jak w google-auth: ValueError (zły token) albo
+    GoogleAuthError (np. nieudane pobranie kluczy).
+    """
+    certs = get_keys(token_key_id(token))
+    idinfo = jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=clock_skew_in_seconds)
+    if idinfo.get('iss') not in GOOGLE_ISSUERS:
+        raise exceptions.InvalidValue(f"Nieprawidłowy wystawca tokenu: {idinfo.get('iss')}")
+    return idinfo
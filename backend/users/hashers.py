@@ -0,0 +1,46 @@
+# hashers.py - Hashery haseł z kosztem z ustawień
+#
+# Te same algorytmy co w django.contrib.auth.hashers, ale parametry kosztu
+# czytane z settings (PASSWORD_SCRYPT_*, PASSWORD_ARGON2_*), żeby czas i
+# CPU logowania dało się dostroić bez migracji. must_update porównuje
+# parametry zapisane w hashu z bieżącymi, więc po zmianie ustawień albo
+# PASSWORD_HASHER hasło jest przeliczane przy najbliższym udanym logowaniu
+# (User.check_password). Pomiar: manage.py bench_login.
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_BLOCK_SIZE', hashers.ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_PARALLELISM', hashers.ScryptPasswordHasher.parallelism)
+
+    @property
+    def maxmem(self):
+        # scrypt potrzebuje ~128 * n * r bajtów; domyślny limit OpenSSL to 32 MB
+        return 256 * self.work_factor * self.block_size
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Wymaga argon2-cffi (requirements-argon2.txt)."""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', hashers.Argon2PasswordHasher.parallelism)
@@ -0,0 +1,277 @@
+# heartbeat.py - Buforowanie pozycji odtwarzania przed zapisem do bazy
+#
+# Odtwarzacz wysyła pozycję co kilka sekund. Zamiast zapisywać każdy
+# heartbeat, trzymamy w pamięci procesu tylko ostatnią pozycję dla pary
+# (użytkownik, audiobook) i zapisujemy wszystko naraz (bulk_update /
+# bulk_create) co PROGRESS_FLUSH_INTERVAL_SECONDS albo gdy oczekujących
+# wpisów jest więcej niż PROGRESS_BUFFER_MAX_PENDING. Pierwszy heartbeat
+# pary i zmiana rozdziału zapisują od razu tylko ten jeden wpis.
+#
+# Odczyty w tym procesie nakładają niezapisaną pozycję na dane z bazy
+# (merge()); inne workery widzą bazę, czyli pozycję sprzed najwyżej
+# PROGRESS_FLUSH_INTERVAL_SECONDS. Wątek w tle (PROGRESS_BACKGROUND_FLUSH)
+# zapisuje bufor co interwał także wtedy, gdy heartbeaty przestały
+# przychodzić - bez niego ostatnia pozycja czekałaby do zamknięcia procesu.
+# Zabicie procesu (SIGKILL) traci co najwyżej jeden interwał.
+#
+# Nieudany zapis zbiorczy jest powtarzany wpis po wpisie; wpis, który nie
+# zapisze się PROGRESS_FLUSH_MAX_ATTEMPTS razy (np. rozdział usunięty w innym
+# workerze), jest odrzucany z logiem. Usunięcie rozdziału albo audiobooka w
+# tym procesie czyści bufor od razu (signals.py).
+import atexit
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Chapter, ListeningProgress
+
+logger = logging.getLogger(__name__)
+
+# co zapisać po record()
+FLUSH_NONE = 'none'
+FLUSH_ENTRY = 'entry'  # tylko wpis z tego heartbeatu
+FLUSH_ALL = 'all'
+
+
+@dataclass
+class PendingPosition:
+    chapter_id: int
+    position_seconds: int
+    updated_at: datetime
+    attempts: int = 0  # nieudane zapisy tego wpisu
+
+
+class ProgressBuffer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        # ostatni znany rozdział dla (user_id, audiobook_id) - wykrywa zmianę rozdziału
+        self._chapters = {}
+        # chapter_id -> audiobook_id, żeby heartbeat nie odpytywał bazy o rozdział
+        self._chapter_audiobooks = {}
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._flusher_pid = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'PROGRESS_FLUSH_INTERVAL_SECONDS', 10)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'PROGRESS_BUFFER_MAX_PENDING', 1000)
+
+    @property
+    def max_attempts(self):
+        return getattr(settings, 'PROGRESS_FLUSH_MAX_ATTEMPTS', 3)
+
+    def chapter_belongs_to(self, chapter_id, audiobook_id):
+        audiobook_for_chapter = self._chapter_audiobooks.get(chapter_id)
+        if audiobook_for_chapter is None:
+            audiobook_for_chapter = Chapter.objects.filter(pk=chapter_id).values_list(
+                'audiobook_id', flat=True
+            ).first()
+            if audiobook_for_chapter is None:
+                return False
+            if len(self._chapter_audiobooks) >= self.max_pending * 10:
+                self._chapter_audiobooks.clear()
+            self._chapter_audiobooks[chapter_id] = audiobook_for_chapter
+        return audiobook_for_chapter == audiobook_id
+
+    def record(self, user_id, audiobook_id, chapter_id, position_seconds):
+        """Zapamiętuje pozycję; zwraca FLUSH_NONE, FLUSH_ENTRY albo FLUSH_ALL."""
+        self.start_flusher()
+        key = (user_id, audiobook_id)
+        with self._lock:
+            previous_chapter = self._chapters.pop(key, None)
+            if len(self._chapters) >= self.max_pending * 10:
+                # najstarszy wpis - jego następny heartbeat zapisze tylko siebie
+                self._chapters.pop(next(iter(self._chapters)))
+            self._chapters[key] = chapter_id
+            self._pending[key] = PendingPosition(chapter_id, position_seconds, timezone.now())
+
+            if len(self._pending) >= self.max_pending or self._due():
+                return FLUSH_ALL
+            if previous_chapter != chapter_id:
+                return FLUSH_ENTRY
+            return FLUSH_NONE
+
+    def _due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush_if_due(self):
+        """Zapisuje bufor, jeśli minął interwał - wywoływane przez wątek w tle."""
+        with self._lock:
+            due = bool(self._pending) and self._due()
+        return self.flush() if due else 0
+
+    def start_flusher(self):
+        if not getattr(settings, 'PROGRESS_BACKGROUND_FLUSH', True):
+            return
+        # po fork() (np. gunicorn --preload) wątek rodzica nie istnieje w dziecku
+        if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name='progress-flush', daemon=True)
+            self._flusher_pid = os.getpid()
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(max(self.flush_interval / 2, 0.1))
+            try:
+                self.flush_if_due()
+            except Exception:
+                logger.exception("Periodic progress buffer flush failed")
+            finally:
+                # wątek ma własne połączenie - nie trzymamy go otwartego między zapisami
+                connection.close()
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._chapters.clear()
+            self._chapter_audiobooks.clear()
+            self._last_flush = time.monotonic()
+
+    def discard(self, user_id, audiobook_id):
+        # bezpośredni zapis (update_progress) ma pierwszeństwo przed buforem
+        with self._lock:
+            self._pending.pop((user_id, audiobook_id), None)
+            self._chapters.pop((user_id, audiobook_id), None)
+
+    def pending(self, user_id, audiobook_id):
+        return self._pending.get((user_id, audiobook_id))
+
+    def latest_pending(self, user_id):
+        """Czas najnowszej niezapisanej pozycji użytkownika (do walidatorów ETag) albo None."""
+        with self._lock:
+            return max(
+                (entry.updated_at for (pending_user, _), entry in self._pending.items() if pending_user == user_id),
+                default=None
+            )
+
+    def merge(self, progress):
+        """Nakłada niezapisaną pozycję na obiekt ListeningProgress z bazy."""
+        entry = self.pending(progress.user_id, progress.audiobook_id)
+        if entry is None or entry.chapter_id != progress.current_chapter_id:
+            return progress
+
+        progress.current_position_seconds = entry.position_seconds
+        progress.last_listened = entry.updated_at
+        # adnotacja with_progress() jest już nieaktualna
+        progress.__dict__.pop('progress_value', None)
+        return progress
+
+    def flush(self, keys=None):
+        """Zapisuje cały bufor albo tylko wpisy `keys`; zwraca liczbę zapisanych wpisów."""
+        with self._lock:
+            if keys is None:
+                pending, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            else:
+                pending = {key: self._pending.pop(key) for key in keys if key in self._pending}
+        if not pending:
+            return 0
+
+        try:
+            self._write(pending)
+        except Exception:
+            # jeden zły wpis (np. rozdział usunięty w innym workerze) nie może
+            # blokować reszty - zapisujemy po jednym i odkładamy tylko błędne
+            logger.exception("Progress buffer flush failed, retrying %d entries one by one", len(pending))
+            written = 0
+            for key, entry in pending.items():
+                try:
+                    self._write({key: entry})
+                    written += 1
+                except Exception:
+                    self._requeue(key, entry)
+            return written
+
+        return len(pending)
+
+    def _write(self, pending):
+        existing = {
+            (progress.user_id, progress.audiobook_id): progress
+            for progress in ListeningProgress.objects.filter(
+                user_id__in={user_id for user_id, _ in pending},
+                audiobook_id__in={audiobook_id for _, audiobook_id in pending},
+            )
+        }
+
+        to_update = []
+        to_create = []
+        for (user_id, audiobook_id), entry in pending.items():
+            progress = existing.get((user_id, audiobook_id))
+            if progress is None:
+                to_create.append(ListeningProgress(
+                    user_id=user_id,
+                    audiobook_id=audiobook_id,
+                    current_chapter_id=entry.chapter_id,
+                    current_position_seconds=entry.position_seconds,
+                ))
+                continue
+
+            progress.current_chapter_id = entry.chapter_id
+            progress.current_position_seconds = entry.position_seconds
+            progress.last_listened = entry.updated_at
+            to_update.append(progress)
+
+        fields = ['current_chapter', 'current_position_seconds', 'last_listened']
+        with transaction.atomic():
+            ListeningProgress.objects.bulk_update(to_update, fields, batch_size=500)
+            # wiersz mógł właśnie dodać inny worker - nadpisujemy go buforowaną pozycją
+            ListeningProgress.objects.bulk_create(
+                to_create, batch_size=500,
+                update_conflicts=True, unique_fields=['user', 'audiobook'], update_fields=fields
+            )
+
+    def _requeue(self, key, entry):
+        entry.attempts += 1
+        if entry.attempts >= self.max_attempts:
+            logger.exception("Dropping buffered progress %s after %d failed writes", key, entry.attempts)
+            return
+        logger.warning("Buffered progress %s not written (attempt %d), re-queueing", key, entry.attempts, exc_info=True)
+        with self._lock:
+            # nowszy heartbeat tej pary ma pierwszeństwo
+            self._pending.setdefault(key, entry)
+
+    def forget_chapter(self, chapter_id):
+        """Usuwa z bufora wszystko, co wskazuje na usunięty rozdział."""
+        with self._lock:
+            self._chapter_audiobooks.pop(chapter_id, None)
+            for key in [key for key, entry in self._pending.items() if entry.chapter_id == chapter_id]:
+                del self._pending[key]
+            for key in [key for key, known in self._chapters.items() if known == chapter_id]:
+                del self._chapters[key]
+
+    def forget_audiobook(self, audiobook_id):
+        """Usuwa z bufora wszystko, co wskazuje na usunięty audiobook."""
+        with self._lock:
+            for chapter_id in [chapter_id for chapter_id, owner in self._chapter_audiobooks.items() if owner == audiobook_id]:
+                del self._chapter_audiobooks[chapter_id]
+            for entries in (self._pending, self._chapters):
+                for key in [key for key in entries if key[1] == audiobook_id]:
+                    del entries[key]
+
+
+progress_buffer = ProgressBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        progress_buffer.flush()
+    except Exception:
+        logger.exception("Progress buffer flush on exit failed")
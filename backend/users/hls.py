@@ -0,0 +1,186 @@
+# hls.py - Pakowanie rozdziałów do HLS w kilku bitrate'ach
+#
+# Po zapisaniu rozdziału z nowym plikiem audio (sygnał w signals.py) rozdział
+# dostaje hls_status='pending'. Przy HLS_RUNNER='command' (domyślnie) koduje
+# go osobny proces `manage.py build_hls --loop`, a nie worker obsługujący
+# żądania; 'thread' zostawia kolejkę wątków w procesie (jeden proces, dev).
+# Lokalny ffmpeg koduje rozdział do AAC w każdym z HLS_BITRATES i tnie na
+# segmenty fMP4 z playlistą główną:
+#
+#   MEDIA_ROOT/hls/chapter_<id>/master.m3u8
+#   MEDIA_ROOT/hls/chapter_<id>/v0/index.m3u8, v0/init.mp4, v0/seg_00000.m4s ...
+#
+# Kodowanie jednego rozdziału trzyma blokadę flock na pliku
+# MEDIA_ROOT/hls/.chapter_<id>.lock - drugi proces (inny worker, druga kopia
+# komendy) pomija rozdział. Jądro zwalnia blokadę, gdy proces zginie, więc
+# przerwane zadanie podejmie następne uruchomienie (rozdział zostaje
+# 'pending'). Wynik powstaje w katalogu tymczasowym i jest podmieniany
+# rename()-em, więc klient nigdy nie widzi połowy playlisty.
+#
+# Klient pobiera master.m3u8 przez /hls/<token>/master.m3u8 (signing.py) i sam
+# wybiera wariant pasujący do łącza. Adresy w playlistach są względne, więc
+# wszystkie segmenty dziedziczą token z adresu playlisty.
+import fcntl
+import glob
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+HLS_STATUS_NONE = 'none'
+HLS_STATUS_PENDING = 'pending'
+HLS_STATUS_READY = 'ready'
+HLS_STATUS_FAILED = 'failed'
+
+MASTER_PLAYLIST = 'master.m3u8'
+
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('audio/mp4', '.m4s')
+
+_executor = None
+
+
+def is_enabled():
+    return getattr(settings, 'HLS_ENABLED', False)
+
+
+def get_runner():
+    return getattr(settings, 'HLS_RUNNER', 'command')
+
+
+def get_bitrates():
+    return getattr(settings, 'HLS_BITRATES', [48, 96, 160])
+
+
+def chapter_hls_dir(chapter_id):
+    return f'hls/chapter_{chapter_id}'
+
+
+def build_ffmpeg_command(source, output_dir, bitrates=None, segment_seconds=None):
+    bitrates = bitrates or get_bitrates()
+    segment_seconds = segment_seconds or getattr(settings, 'HLS_SEGMENT_SECONDS', 6)
+
+    command = [getattr(settings, 'FFMPEG_BINARY', 'ffmpeg'), '-y', '-nostdin', '-loglevel', 'error', '-i', source]
+    for _ in bitrates:
+        command += ['-map', '0:a:0']
+    command += ['-c:a', 'aac']
+    for index, bitrate in enumerate(bitrates):
+        command += [f'-b:a:{index}', f'{bitrate}k']
+    command += [
+        '-f', 'hls',
+        '-hls_time', str(segment_seconds),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', os.path.join(output_dir, 'v%v', 'seg_%05d.m4s'),
+        '-master_pl_name', MASTER_PLAYLIST,
+        '-var_stream_map', ' '.join(f'a:{index}' for index in range(len(bitrates))),
+        os.path.join(output_dir, 'v%v', 'index.m3u8'),
+    ]
+    return command
+
+
+@contextmanager
+def chapter_lock(chapter_id):
+    """Blokada kodowania rozdziału między procesami; zwraca False, gdy trzyma ją ktoś inny."""
+    hls_root = default_storage.path('hls')
+    os.makedirs(hls_root, exist_ok=True)
+    with open(os.path.join(hls_root, f'.chapter_{chapter_id}.lock'), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def package_chapter(chapter_id):
+    """
+    Koduje rozdział do HLS. Wywoływane z komendy build_hls albo w wątku roboczym.
+    Zwraca True/False (wynik) albo None, gdy rozdział koduje właśnie inny proces.
+    """
+    try:
+        with chapter_lock(chapter_id) as acquired:
+            if not acquired:
+                logger.info(f"HLS packaging of chapter {chapter_id} is already running elsewhere")
+                return None
+            return _package_locked(chapter_id)
+    finally:
+        close_old_connections()
+
+
+def _package_locked(chapter_id):
+    from .models import Chapter
+
+    chapter = Chapter.objects.filter(pk=chapter_id).first()
+    if chapter is None or not chapter.audio_file:
+        return False
+
+    source_name = chapter.audio_file.name
+    bitrates = get_bitrates()
+    target_dir = default_storage.path(chapter_hls_dir(chapter_id))
+    parent_dir = os.path.dirname(target_dir)
+    # katalogi robocze przerwanych zadań (zabity proces) - pod blokadą nikt ich już nie używa
+    for stale_dir in glob.glob(os.path.join(parent_dir, f'.chapter_{chapter_id}_*')):
+        shutil.rmtree(stale_dir, ignore_errors=True)
+    # katalog roboczy obok docelowego - podmiana to zwykły rename
+    work_dir = tempfile.mkdtemp(prefix=f'.chapter_{chapter_id}_', dir=parent_dir)
+    try:
+        for index in range(len(bitrates)):
+            os.makedirs(os.path.join(work_dir, f'v{index}'))
+        subprocess.run(
+            build_ffmpeg_command(chapter.audio_file.path, work_dir, bitrates),
+            check=True,
+            capture_output=True,
+            timeout=getattr(settings, 'HLS_TRANSCODE_TIMEOUT_SECONDS', 3600),
+        )
+        # podmiana dopiero po udanym kodowaniu; stary katalog najpierw odsuwamy
+        # rename()-em, więc docelowa ścieżka nie jest pusta dłużej niż dwa rename
+        old_dir = f'{work_dir}.old'
+        if os.path.isdir(target_dir):
+            os.rename(target_dir, old_dir)
+        os.rename(work_dir, target_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        stderr = getattr(e, 'stderr', b'') or b''
+        logger.error(f"HLS packaging failed for chapter {chapter_id}: {e} {stderr.decode(errors='replace')}")
+        Chapter.objects.filter(pk=chapter_id).update(hls_status=HLS_STATUS_FAILED)
+        return False
+
+    # plik mógł zostać podmieniony w trakcie kodowania - wtedy zadanie z nowym plikiem nadpisze wynik
+    Chapter.objects.filter(pk=chapter_id, audio_file=source_name).update(
+        hls_status=HLS_STATUS_READY,
+        hls_source=source_name
+    )
+    return True
+
+
+def enqueue_chapter(chapter_id):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'HLS_WORKERS', 1),
+            thread_name_prefix='hls'
+        )
+    return _executor.submit(package_chapter, chapter_id)
+
+
+def remove_chapter_hls(chapter_id):
+    try:
+        shutil.rmtree(default_storage.path(chapter_hls_dir(chapter_id)), ignore_errors=True)
+    except NotImplementedError:
+        pass
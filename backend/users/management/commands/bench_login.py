@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from users.views import LoginViewset
+
+User = get_user_model()
+
+EMAIL = 'bench.login@example.com'
+PASSWORD = 'bench-login-password-1'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mierzy czas (p50/p95) i CPU logowania przez LoginViewset: poprawne hasło, złe hasło '
+        'i nieznany adres. Konto testowe jest tworzone w transakcji wycofywanej na końcu'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--hasher', choices=sorted(getattr(settings, 'PASSWORD_HASHER_CLASSES', {})),
+            help='Hasher nowych haseł zamiast PASSWORD_HASHER z ustawień'
+        )
+
+    def handle(self, *args, **options):
+        hashers = list(settings.PASSWORD_HASHERS)
+        if options['hasher']:
+            preferred = settings.PASSWORD_HASHER_CLASSES[options['hasher']]
+            hashers = [preferred] + [hasher for hasher in hashers if hasher != preferred]
+
+        with override_settings(PASSWORD_HASHERS=hashers):
+            self.stdout.write(f"{hashers[0]}, {options['iterations']} logowań na scenariusz")
+            with transaction.atomic():
+                if User.objects.filter(email=EMAIL).exists():
+                    raise CommandError(f'Konto {EMAIL} już istnieje')
+                User.objects.create_user(email=EMAIL, password=PASSWORD)
+                try:
+                    for name, email, password, expected in (
+                        ('poprawne hasło', EMAIL, PASSWORD, 200),
+                        ('złe hasło', EMAIL, 'wrong-password', 400),
+                        ('nieznany adres', 'nobody.bench@example.com', PASSWORD, 400),
+                    ):
+                        self.measure(name, email, password, expected, options['iterations'])
+                finally:
+                    transaction.set_rollback(True)
+
+    def measure(self, name, email, password, expected, iterations):
+        factory = APIRequestFactory()
+        view = LoginViewset.as_view({'post': 'create'})
+        latencies = []
+        cpu_started = time.process_time()
+        for _ in range(iterations):
+            request = factory.post('/login/', {'email': email, 'password': password}, format='json')
+            started = time.perf_counter()
+            response = view(request)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != expected:
+                raise CommandError(f'{name}: status {response.status_code}, oczekiwano {expected}')
+        cpu = (time.process_time() - cpu_started) / iterations
+
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, round(0.95 * (len(latencies) - 1)))]
+        self.stdout.write(
+            f'{name:<16} p50 {statistics.median(latencies) * 1000:7.1f}ms  '
+            f'p95 {p95 * 1000:7.1f}ms  CPU {cpu * 1000:7.1f}ms/logowanie'
+        )
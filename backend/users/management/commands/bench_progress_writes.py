@@ -0,0 +1,90 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from users.models import Chapter, ListeningProgress, UserLibrary
+
+
+class Command(BaseCommand):
+    help = (
+        'Mierzy przepustowość równoległych zapisów postępu (jak update_progress) dla bieżącej bazy. '
+        'Wymaga danych z manage.py seed_catalog'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--users', type=int, default=200, help='Ilu użytkowników zapisuje postęp')
+
+    def handle(self, *args, **options):
+        targets = self.load_targets(options['users'])
+        if not targets:
+            raise CommandError('Brak wpisów w bibliotekach - najpierw uruchom manage.py seed_catalog')
+
+        self.stdout.write(
+            f"{connection.vendor} ({connection.settings_dict['NAME']}), "
+            f"{options['threads']} wątków, {options['seconds']}s, {len(targets)} par użytkownik/rozdział"
+        )
+
+        deadline = time.monotonic() + options['seconds']
+        results = []
+        workers = [
+            threading.Thread(target=self.worker, args=(targets[index::options['threads']] or targets, deadline, results))
+            for index in range(options['threads'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        writes = sum(result['writes'] for result in results)
+        errors = sum(result['errors'] for result in results)
+        latencies = sorted(latency for result in results for latency in result['latencies'])
+        if not latencies:
+            raise CommandError(f'Żaden zapis się nie udał ({errors} błędów)')
+
+        p95 = latencies[min(len(latencies) - 1, round(0.95 * (len(latencies) - 1)))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{writes / options["seconds"]:.0f} zapisów/s, błędy blokady: {errors}, '
+            f'p50 {statistics.median(latencies) * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms'
+        ))
+
+    def load_targets(self, users):
+        first_chapters = dict(Chapter.objects.filter(chapter_number=1).values_list('audiobook_id', 'pk'))
+        targets = []
+        seen_users = set()
+        for user_id, audiobook_id in UserLibrary.objects.order_by('user_id').values_list('user_id', 'audiobook_id'):
+            if user_id not in seen_users and len(seen_users) >= users:
+                break
+            seen_users.add(user_id)
+            if audiobook_id in first_chapters:
+                targets.append((user_id, audiobook_id, first_chapters[audiobook_id]))
+        return targets
+
+    def worker(self, targets, deadline, results):
+        result = {'writes': 0, 'errors': 0, 'latencies': []}
+        position = 0
+        try:
+            while time.monotonic() < deadline:
+                user_id, audiobook_id, chapter_id = targets[position % len(targets)]
+                position += 1
+                started = time.perf_counter()
+                try:
+                    # to samo co ListeningProgressViewSet.update_progress
+                    with transaction.atomic():
+                        ListeningProgress.objects.update_or_create(
+                            user_id=user_id,
+                            audiobook_id=audiobook_id,
+                            defaults={'current_chapter_id': chapter_id, 'current_position_seconds': position}
+                        )
+                except OperationalError:
+                    result['errors'] += 1
+                    continue
+                result['latencies'].append(time.perf_counter() - started)
+                result['writes'] += 1
+        finally:
+            results.append(result)
+            connection.close()
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import hls
+from users.models import Chapter
+
+
+class Command(BaseCommand):
+    help = 'Pakuje rozdziały do HLS (ffmpeg); z --loop działa jako stały worker kolejki'
+
+    def add_arguments(self, parser):
+        parser.add_argument('chapter_ids', nargs='*', type=int, help='Domyślnie rozdziały bez aktualnego HLS')
+        parser.add_argument('--force', action='store_true', help='Przekoduj także gotowe rozdziały')
+        parser.add_argument('--loop', action='store_true', help='Co --interval sekund koduj rozdziały ze statusem pending')
+        parser.add_argument('--interval', type=float, default=5.0, help='Przerwa między przebiegami --loop (s)')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            while True:
+                counts = self.build(Chapter.objects.exclude(audio_file='').filter(hls_status=hls.HLS_STATUS_PENDING))
+                if any(counts):
+                    self.report(*counts)
+                time.sleep(options['interval'])
+
+        chapters = Chapter.objects.exclude(audio_file='')
+        if options['chapter_ids']:
+            chapters = chapters.filter(pk__in=options['chapter_ids'])
+        elif not options['force']:
+            chapters = chapters.exclude(hls_status='ready')
+        self.report(*self.build(chapters))
+
+    def report(self, done, failed, skipped):
+        self.stdout.write(self.style.SUCCESS(f'HLS gotowe: {done}, błędy: {failed}, pominięte: {skipped}'))
+
+    def build(self, chapters):
+        done = failed = skipped = 0
+        for chapter_id in chapters.values_list('pk', flat=True).iterator():
+            result = hls.package_chapter(chapter_id)
+            if result is None:
+                # koduje go inny proces
+                skipped += 1
+            elif result:
+                done += 1
+            else:
+                failed += 1
+        return done, failed, skipped
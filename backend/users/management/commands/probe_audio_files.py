@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Chapter
+
+
+class Command(BaseCommand):
+    help = 'Odczytuje czas trwania i parametry plików audio rozdziałów wgranych przed automatycznym odczytem'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Sprawdź także rozdziały, które mają już odczytane parametry')
+
+    def handle(self, *args, **options):
+        chapters = Chapter.objects.exclude(audio_file='').order_by('audiobook_id', 'chapter_number')
+        if not options['all']:
+            chapters = chapters.filter(file_size=0)
+
+        updated = failed = 0
+        for chapter in chapters.iterator():
+            try:
+                with chapter.audio_file.open('rb'):
+                    probed = chapter.apply_audio_metadata()
+            except OSError as e:
+                self.stderr.write(f'{chapter}: {e}')
+                probed = False
+
+            if not probed:
+                failed += 1
+                continue
+            # post_save przelicza offsety rozdziałów i czas audiobooka
+            chapter.save(update_fields=['duration_seconds', 'bitrate_kbps', 'codec', 'sample_rate', 'file_size'])
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Zaktualizowano rozdziałów: {updated}, nieodczytanych: {failed}'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from users.models import Audiobook, Rating, RATING_SCORES
+
+
+class Command(BaseCommand):
+    help = 'Przelicza od nowa sumę, liczbę i histogram ocen audiobooków'
+
+    def handle(self, *args, **options):
+        empty = {'rating_sum': 0, 'rating_count': 0}
+        empty.update({f'rating_count_{score}': 0 for score in RATING_SCORES})
+
+        with transaction.atomic():
+            stats = {}
+            grouped = Rating.objects.order_by().values_list('audiobook_id', 'rating').annotate(count=Count('id'))
+            for audiobook_id, score, count in grouped:
+                entry = stats.setdefault(audiobook_id, dict(empty))
+                entry['rating_sum'] += score * count
+                entry['rating_count'] += count
+                if score in RATING_SCORES:
+                    entry[f'rating_count_{score}'] = count
+
+            Audiobook.objects.exclude(pk__in=stats).update(**empty)
+            for audiobook_id, entry in stats.items():
+                Audiobook.objects.filter(pk=audiobook_id).update(**entry)
+
+        self.stdout.write(self.style.SUCCESS(f'Przeliczono oceny {len(stats)} audiobooków'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from users import search
+
+
+class Command(BaseCommand):
+    help = 'Przebudowuje indeks pełnotekstowy audiobooków i autorów (FTS5 / tsvector)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.is_supported(using):
+            self.stdout.write(self.style.WARNING('Baza bez indeksu pełnotekstowego - wyszukiwanie używa icontains'))
+            return
+
+        search.rebuild_search_index(using)
+        self.stdout.write(self.style.SUCCESS('Indeks wyszukiwania przebudowany'))
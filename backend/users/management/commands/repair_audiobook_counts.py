@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from users.models import Author, Category
+
+
+class Command(BaseCommand):
+    help = 'Sprawdza i naprawia liczniki audiobooków autorów i kategorii'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Tylko wypisz rozbieżności, bez zapisu')
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            for model in (Author, Category):
+                drifted = list(model.objects.annotate(
+                    actual=Count('audiobooks')
+                ).exclude(audiobooks_count=F('actual')).values_list('pk', 'audiobooks_count', 'actual'))
+
+                for pk, stored, actual in drifted:
+                    total += 1
+                    self.stdout.write(f'{model.__name__} {pk}: {stored} -> {actual}')
+                    if not options['check']:
+                        model.objects.filter(pk=pk).update(audiobooks_count=actual)
+
+        if options['check']:
+            self.stdout.write(f'Rozbieżnych liczników: {total}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Naprawiono liczników: {total}'))
@@ -0,0 +1,46 @@
+from dataclasses import fields
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from users.seeding import SeedOptions, seed_catalog
+
+
+class Command(BaseCommand):
+    help = 'Generuje syntetyczny katalog (bulk_create) do testów obciążeniowych i benchmarków'
+
+    def add_arguments(self, parser):
+        defaults = SeedOptions()
+        parser.add_argument('--audiobooks', type=int, default=defaults.audiobooks)
+        parser.add_argument('--authors', type=int, default=defaults.authors)
+        parser.add_argument('--categories', type=int, default=defaults.categories)
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--chapters-per-audiobook', type=int, default=defaults.chapters_per_audiobook)
+        parser.add_argument('--ratings-per-audiobook', type=int, default=defaults.ratings_per_audiobook)
+        parser.add_argument('--library-per-user', type=int, default=defaults.library_per_user)
+        parser.add_argument('--purchases-per-user', type=int, default=defaults.purchases_per_user)
+        parser.add_argument('--progress-per-user', type=int, default=defaults.progress_per_user)
+        parser.add_argument('--premium-ratio', type=float, default=defaults.premium_ratio)
+        parser.add_argument('--batch-size', type=int, default=defaults.batch_size)
+        parser.add_argument('--seed', type=int, default=defaults.seed, help='Ten sam seed daje te same dane')
+        parser.add_argument('--prefix', default=defaults.prefix, help='Prefiks e-maili i nazw (seed0@example.com)')
+        parser.add_argument('--password', default=defaults.password, help='Hasło wszystkich wygenerowanych użytkowników')
+        parser.add_argument('--no-audio', action='store_true', help='Nie zapisuj pliku placeholder w MEDIA_ROOT')
+
+    def handle(self, *args, **options):
+        seed_options = SeedOptions(**{
+            option.name: options[option.name] for option in fields(SeedOptions) if option.name in options
+        })
+        seed_options.write_audio = not options['no_audio']
+
+        if min(seed_options.authors, seed_options.categories) < 1 and seed_options.audiobooks:
+            raise CommandError('Audiobooki wymagają co najmniej jednego autora i jednej kategorii')
+        if seed_options.batch_size < 1:
+            raise CommandError('--batch-size musi być dodatni')
+        if get_user_model().objects.filter(email=f'{seed_options.prefix}0@example.com').exists():
+            raise CommandError(f'Dane z prefiksem "{seed_options.prefix}" już istnieją - użyj innego --prefix')
+
+        result = seed_catalog(seed_options, log=self.stdout.write)
+
+        summary = ', '.join(f'{name}: {count}' for name, count in sorted(result.counts.items()))
+        self.stdout.write(self.style.SUCCESS(f'Wygenerowano w {result.seconds:.1f}s - {summary}'))
@@ -0,0 +1,234 @@
+# metrics.py - Pomiary żądań: zapytania SQL, czasy, rozmiar odpowiedzi
+#
+# RequestMetricsMiddleware (middleware.py) dla wylosowanej części żądań
+# (REQUEST_METRICS_SAMPLE_RATE) zbiera:
+#   - liczbę i łączny czas zapytań SQL - count_query jest na stałe na liście
+#     execute_wrappers każdego połączenia (sygnał connection_created) i
+#     liczy do pomiaru z ContextVar, więc widzi też zapytania z wątków
+#     sync_to_async w widokach async,
+#   - czas serializerów - widoki pobierają dane przez serializer_data()
+#     (SerializerMetricsMixin dla list/retrieve); zagnieżdżone serializery
+#     i zapytania wykonane leniwie w trakcie liczą się do niego,
+#   - czas całego żądania, rozmiar odpowiedzi i nazwę widoku.
+# Wynik trafia do nagłówka Server-Timing, do logu 'users.metrics' (jedna
+# linia JSON na żądanie) i do liczników w pamięci procesu, które
+# /metrics/ wystawia w formacie tekstowym Prometheusa. Liczniki są
+# narastające od startu procesu; rate() i sumowanie po workerach robi
+# Prometheus. Niewylosowane żądania nie są w ogóle mierzone.
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+@dataclass
+class RequestMetrics:
+    started: float = field(default_factory=time.perf_counter)
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    serializer_seconds: float = 0.0
+    serializer_depth: int = 0
+    total_seconds: float = 0.0
+    response_bytes: int | None = None
+    view: str = 'unresolved'
+    # zapytania mogą przyjść z kilku wątków (sync_to_async)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record_query(self, seconds):
+        with self._lock:
+            self.db_seconds += seconds
+            self.db_queries += 1
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f'serializer;dur={self.serializer_seconds * 1000:.1f}',
+            f'total;dur={self.total_seconds * 1000:.1f}',
+        ])
+
+
+def get_sample_rate():
+    return getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0)
+
+
+def is_enabled():
+    return getattr(settings, 'REQUEST_METRICS_ENABLED', True)
+
+
+def should_sample():
+    rate = get_sample_rate()
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def start():
+    """Zaczyna pomiar żądania; zwraca (metrics, stack) - stack.close() kończy pomiar."""
+    metrics = RequestMetrics()
+    stack = ExitStack()
+    token = _current.set(metrics)
+    stack.callback(_current.reset, token)
+    return metrics, stack
+
+
+def count_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(time.perf_counter() - started)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Odbiornik connection_created - podłączany w UsersConfig.ready().
+
+    Połączenia są osobne dla każdego wątku, więc wrapper trafia do każdego z nich.
+    """
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@contextmanager
+def measure_serializer():
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        if metrics.serializer_depth == 0:
+            metrics.serializer_seconds += time.perf_counter() - started
+
+
+def serializer_data(serializer):
+    """serializer.data z czasem doliczonym do pomiaru żądania."""
+    with measure_serializer():
+        return serializer.data
+
+
+class SerializerMetricsMixin:
+    """list/retrieve jak w DRF, ale dane serializera idą przez serializer_data()."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer_data(self.get_serializer(page, many=True)))
+        return Response(serializer_data(self.get_serializer(queryset, many=True)))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(serializer_data(self.get_serializer(self.get_object())))
+
+
+def log_request(request, response, metrics):
+    logger.info(json.dumps({
+        'event': 'request',
+        'method': request.method,
+        'path': request.path,
+        'view': metrics.view,
+        'status': response.status_code,
+        'duration_ms': round(metrics.total_seconds * 1000, 2),
+        'db_queries': metrics.db_queries,
+        'db_ms': round(metrics.db_seconds * 1000, 2),
+        'serializer_ms': round(metrics.serializer_seconds * 1000, 2),
+        'response_bytes': metrics.response_bytes,
+    }))
+
+
+class MetricsRegistry:
+    """Narastające liczniki per (widok, metoda, status); bezpieczne dla wątków."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = defaultdict(lambda: {
+                'requests': 0,
+                'duration': 0.0,
+                'buckets': [0] * len(DURATION_BUCKETS),
+                'db_queries': 0,
+                'db_seconds': 0.0,
+                'serializer_seconds': 0.0,
+                'response_bytes': 0,
+            })
+
+    def record(self, method, status_code, metrics):
+        with self._lock:
+            series = self._series[(metrics.view, method, str(status_code))]
+            series['requests'] += 1
+            series['duration'] += metrics.total_seconds
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if metrics.total_seconds <= bound:
+                    series['buckets'][index] += 1
+            series['db_queries'] += metrics.db_queries
+            series['db_seconds'] += metrics.db_seconds
+            series['serializer_seconds'] += metrics.serializer_seconds
+            series['response_bytes'] += metrics.response_bytes or 0
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(value, buckets=list(value['buckets'])) for key, value in self._series.items()}
+
+    def render_prometheus(self):
+        series = sorted(self.snapshot().items())
+        lines = [
+            '# HELP audiobooks_request_metrics_sample_rate Fraction of requests that are measured.',
+            '# TYPE audiobooks_request_metrics_sample_rate gauge',
+            f'audiobooks_request_metrics_sample_rate {get_sample_rate()}',
+        ]
+
+        def counter(name, help_text, key):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (view, method, status_code), values in series:
+                lines.append(f'{name}{{{labels(view, method, status_code)}}} {values[key]}')
+
+        counter('audiobooks_http_requests_total', 'Sampled HTTP requests.', 'requests')
+        counter('audiobooks_db_queries_total', 'SQL queries in sampled requests.', 'db_queries')
+        counter('audiobooks_db_duration_seconds_total', 'SQL time in sampled requests.', 'db_seconds')
+        counter('audiobooks_serializer_duration_seconds_total', 'Serializer time in sampled requests.', 'serializer_seconds')
+        counter('audiobooks_response_bytes_total', 'Response body bytes in sampled requests.', 'response_bytes')
+
+        name = 'audiobooks_http_request_duration_seconds'
+        lines.append(f'# HELP {name} Duration of sampled HTTP requests.')
+        lines.append(f'# TYPE {name} histogram')
+        for (view, method, status_code), values in series:
+            base = labels(view, method, status_code)
+            for bound, count in zip(DURATION_BUCKETS, values['buckets']):
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{base},le="+Inf"}} {values["requests"]}')
+            lines.append(f'{name}_sum{{{base}}} {values["duration"]}')
+            lines.append(f'{name}_count{{{base}}} {values["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(view, method, status_code):
+    return f'view="{escape_label(view)}",method="{escape_label(method)}",status="{escape_label(status_code)}"'
+
+
+registry = MetricsRegistry()
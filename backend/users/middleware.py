@@ -0,0 +1,104 @@
+# middleware.py
+import os
+import time
+from urllib.parse import unquote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404
+
+from . import metrics
+from .streaming import serve_file
+
+
+class InternalRedirectMiddleware:
+    """
+    Lokalny zamiennik nginx/Apache dla MEDIA_DELIVERY_MODE różnego od
+    'django': odpowiedź z X-Accel-Redirect albo X-Sendfile jest zamieniana
+    na właściwy plik (z obsługą Range), tak jak zrobiłby to serwer przed
+    aplikacją. Tylko do developmentu i testów - na produkcji bajty wysyła
+    serwer WWW.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.has_header('X-Accel-Redirect'):
+            path = self.accel_redirect_path(response['X-Accel-Redirect'])
+        elif response.has_header('X-Sendfile'):
+            path = response['X-Sendfile']
+        else:
+            return response
+
+        if not os.path.isfile(path):
+            raise Http404
+        return serve_file(request, path, cache_control=response.get('Cache-Control', 'private'))
+
+    def accel_redirect_path(self, location):
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/').rstrip('/') + '/'
+        if not location.startswith(prefix):
+            raise Http404
+
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        path = os.path.realpath(os.path.join(media_root, unquote(location[len(prefix):])))
+        if os.path.commonpath([media_root, path]) != media_root:
+            raise Http404
+        return path
+
+
+class RequestMetricsMiddleware:
+    """
+    Pomiar wylosowanych żądań (users/metrics.py): zapytania SQL, czas
+    serializerów i całego żądania, rozmiar odpowiedzi. Wynik idzie do
+    nagłówka Server-Timing, logu 'users.metrics' i liczników /metrics/.
+    Powinien być pierwszy na liście MIDDLEWARE, żeby mierzyć całe żądanie.
+    Obsługuje też widoki async (płatności) - pod ASGI nie blokuje wątku.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not metrics.is_enabled() or not metrics.should_sample():
+            return self.get_response(request)
+
+        request_metrics, stack = metrics.start()
+        with stack:
+            response = self.get_response(request)
+        return self.finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        if not metrics.is_enabled() or not metrics.should_sample():
+            return await self.get_response(request)
+
+        request_metrics, stack = metrics.start()
+        with stack:
+            response = await self.get_response(request)
+        return self.finish(request, response, request_metrics)
+
+    def finish(self, request, response, request_metrics):
+        request_metrics.total_seconds = time.perf_counter() - request_metrics.started
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            request_metrics.view = match.view_name
+        if response.streaming:
+            length = response.get('Content-Length')
+            request_metrics.response_bytes = int(length) if length and length.isdigit() else None
+        else:
+            request_metrics.response_bytes = len(response.content)
+
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = request_metrics.server_timing()
+        metrics.log_request(request, response, request_metrics)
+        metrics.registry.record(request.method, response.status_code, request_metrics)
+        return response
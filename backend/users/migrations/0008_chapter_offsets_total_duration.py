@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+def fill_chapter_offsets(apps, schema_editor):
+    Audiobook = apps.get_model('users', 'Audiobook')
+    Chapter = apps.get_model('users', 'Chapter')
+
+    for audiobook in Audiobook.objects.all():
+        offset = 0
+        chapters = list(Chapter.objects.filter(audiobook=audiobook).order_by('chapter_number'))
+        for chapter in chapters:
+            chapter.start_offset_seconds = offset
+            offset += chapter.duration_seconds
+        Chapter.objects.bulk_update(chapters, ['start_offset_seconds'])
+        Audiobook.objects.filter(pk=audiobook.pk).update(total_duration_seconds=offset)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_customuser_google_id_customuser_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiobook',
+            name='total_duration_seconds',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='start_offset_seconds',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_chapter_offsets, migrations.RunPython.noop),
+    ]
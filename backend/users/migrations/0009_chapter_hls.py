@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_chapter_offsets_total_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='hls_source',
+            field=models.CharField(blank=True, editable=False, help_text='Plik, z którego powstało HLS', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='hls_status',
+            field=models.CharField(choices=[('none', 'Brak'), ('pending', 'W kolejce'), ('ready', 'Gotowe'), ('failed', 'Błąd')], default='none', editable=False, max_length=10),
+        ),
+    ]
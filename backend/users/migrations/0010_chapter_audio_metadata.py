@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_chapter_hls'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='bitrate_kbps',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='codec',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='file_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='sample_rate',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='audiobook',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(blank=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='chapter',
+            name='duration_seconds',
+            field=models.PositiveIntegerField(blank=True, default=0, help_text='Uzupełniane automatycznie z nagłówków pliku audio'),
+        ),
+    ]
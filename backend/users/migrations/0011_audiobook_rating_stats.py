@@ -0,0 +1,65 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:04
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_rating_stats(apps, schema_editor):
+    Audiobook = apps.get_model('users', 'Audiobook')
+    Rating = apps.get_model('users', 'Rating')
+
+    stats = {}
+    for audiobook_id, score, count in Rating.objects.order_by().values_list('audiobook_id', 'rating').annotate(count=Count('id')):
+        entry = stats.setdefault(audiobook_id, {'rating_sum': 0, 'rating_count': 0})
+        entry['rating_sum'] += score * count
+        entry['rating_count'] += count
+        if 1 <= score <= 5:
+            entry[f'rating_count_{score}'] = count
+    for audiobook_id, entry in stats.items():
+        Audiobook.objects.filter(pk=audiobook_id).update(**entry)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_chapter_audio_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiobook',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='rating_count_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='rating_count_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='rating_count_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='rating_count_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='rating_count_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
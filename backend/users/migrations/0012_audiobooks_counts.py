@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_audiobooks_counts(apps, schema_editor):
+    Audiobook = apps.get_model('users', 'Audiobook')
+    for model_name, field in (('Author', 'author_id'), ('Category', 'category_id')):
+        model = apps.get_model('users', model_name)
+        for owner_id, count in Audiobook.objects.order_by().values_list(field).annotate(count=Count('id')):
+            model.objects.filter(pk=owner_id).update(audiobooks_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_audiobook_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='audiobooks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='audiobooks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_audiobooks_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('type', models.CharField(max_length=100)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:58
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def lowercase_emails(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+
+    duplicates = list(
+        CustomUser.objects.values(email_lower=Lower('email'))
+        .annotate(count=Count('id')).filter(count__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Konta różniące się tylko wielkością liter w adresie email - '
+            'połącz je ręcznie przed migracją: ' + ', '.join(duplicates)
+        )
+
+    for user in CustomUser.objects.exclude(email=Lower('email')).only('email'):
+        user.email = user.email.strip().lower()
+        user.save(update_fields=['email'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0014_stripe_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='customuser',
+            name='users_email_lower_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='users_email_lower_uniq', violation_error_message='Konto z tym adresem email już istnieje.'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:10
+
+from django.db import migrations
+
+from users import search
+
+
+def create_search_tables(apps, schema_editor):
+    # FTS5 na SQLite, tsvector + GIN na PostgreSQL (users/search.py)
+    using = schema_editor.connection.alias
+    search.create_search_tables(using)
+    search.rebuild_search_index(using)
+
+
+def drop_search_tables(apps, schema_editor):
+    search.drop_search_tables(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_email_lower_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
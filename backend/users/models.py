@@ -1,12 +1,24 @@
 from django.db import models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value, F, ExpressionWrapper, Case, When
+from django.db.models.functions import Coalesce, Lower, NullIf, Round
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .audio_metadata import probe_audio
 from .utils import audiobook_cover_path, audiobook_audio_path, validate_audio_file, validate_image_file
 
 class CustomUserManager(BaseUserManager):
 
+    @classmethod
+    def normalize_email(cls, email):
+        # cały adres małymi literami - rejestracja, logowanie i check-email
+        # porównują ten sam ciąg (unikalność pilnuje users_email_lower_uniq)
+        return (email or '').strip().lower()
+
+    def get_by_email(self, email):
+        return self.alias(email_lower=Lower('email')).get(email_lower=self.normalize_email(email))
+
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
@@ -39,19 +51,45 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Jan@X.pl i jan@x.pl to jedno konto; ten sam indeks obsługuje
+            # logowanie i sprawdzanie zajętości adresu (email_check.py)
+            models.UniqueConstraint(
+                Lower('email'), name='users_email_lower_uniq',
+                violation_error_message='Konto z tym adresem email już istnieje.'
+            ),
+        ]
+
 # TO DO ------------------------- !
 # class UserProfile DO ZROBIENIA 
 
-class Author(models.Model):
+class AudiobooksCountMixin:
+    # audiobooks_count utrzymują sygnały Audiobook (signals.py) przez F() w SQL;
+    # naprawa rozbieżności: manage.py repair_audiobook_counts. Zwykły save()
+    # nie zapisuje licznika, żeby nieaktualna instancja go nie nadpisała.
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'audiobooks_count'
+            ]
+        super().save(*args, **kwargs)
+
+
+class Author(AudiobooksCountMixin, models.Model):
     name = models.CharField(max_length=200)
     bio = models.TextField(blank=True)
+    audiobooks_count = models.PositiveIntegerField(default=0, editable=False)
    
     def __str__(self):
         return self.name
 
-class Category(models.Model):
+class Category(AudiobooksCountMixin, models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    audiobooks_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -59,6 +97,60 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+RATING_SCORES = range(1, 6)
+
+
+class AudiobookQuerySet(models.QuerySet):
+
+    def with_rating_stats(self):
+        # liczone z kolumn rating_sum/rating_count - bez złączenia z ocenami
+        average = ExpressionWrapper(
+            F('rating_sum') * 1.0 / NullIf(F('rating_count'), 0),
+            output_field=models.FloatField()
+        )
+        return self.annotate(
+            avg_rating=average,
+            num_ratings=F('rating_count'),
+            # kursor nie obsługuje NULL - audiobooki bez ocen sortują się jak 0
+            sort_rating=Coalesce(average, Value(0.0), output_field=models.FloatField()),
+        )
+
+    def with_user_state(self, user):
+        if user is None or not user.is_authenticated:
+            return self.annotate(
+                in_library=Value(False, output_field=models.BooleanField()),
+                purchased=Value(False, output_field=models.BooleanField()),
+            )
+
+        return self.annotate(
+            in_library=Exists(
+                UserLibrary.objects.filter(user=user, audiobook=OuterRef('pk'))
+            ),
+            purchased=Exists(
+                Purchase.objects.filter(
+                    user=user,
+                    audiobook=OuterRef('pk'),
+                    payment_status='completed'
+                )
+            ),
+        )
+
+    def change_rating_stats(self, score, delta):
+        """Dodaje (delta=1) albo odejmuje (delta=-1) ocenę w agregatach - atomowo, w SQL."""
+        changes = {
+            'rating_sum': F('rating_sum') + score * delta,
+            'rating_count': F('rating_count') + delta,
+        }
+        if score in RATING_SCORES:
+            histogram_field = f'rating_count_{score}'
+            changes[histogram_field] = F(histogram_field) + delta
+        return self.update(**changes)
+
+    def for_listing(self, user):
+        # Wszystko czego potrzebuje AudiobookListSerializer w jednym zapytaniu
+        return self.select_related('author', 'category').with_rating_stats().with_user_state(user)
+
+
 class Audiobook(models.Model):
     title = models.CharField(max_length=300)
     description = models.TextField()
@@ -72,7 +164,8 @@ class Audiobook(models.Model):
         validators=[validate_image_file],
         help_text="Okładka audiobooka (JPG, PNG, max 10MB)"
     )
-    duration_minutes = models.PositiveIntegerField()
+    # suma czasów rozdziałów (update_chapter_offsets) - nie wpisujemy ręcznie
+    duration_minutes = models.PositiveIntegerField(default=0, blank=True)
     publication_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_featured = models.BooleanField(default=False)
@@ -90,16 +183,64 @@ class Audiobook(models.Model):
         verbose_name="Cena",
         help_text="Cena w PLN (tylko dla premium)"
     )
+
+    # suma Chapter.duration_seconds, utrzymywana przez update_chapter_offsets()
+    total_duration_seconds = models.PositiveIntegerField(default=0, editable=False)
+
+    # agregaty ocen aktualizowane wyrażeniami F() przy zapisie/usunięciu Rating
+    # (signals.py); przebudowa: manage.py rebuild_rating_stats
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = AudiobookQuerySet.as_manager()
     
     def __str__(self):
         premium_marker = f" [PREMIUM - {self.price} PLN]" if self.is_premium else " [FREE]"
         return f"{self.title} - {self.author.name}{premium_marker}"
     
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def rating_histogram(self):
+        return {score: getattr(self, f'rating_count_{score}') for score in RATING_SCORES}
+
     @property
     def duration_formatted(self):
         hours = self.duration_minutes // 60
         minutes = self.duration_minutes % 60
         return f"{hours}h {minutes}m"
+
+    def update_chapter_offsets(self):
+        # przelicza początek każdego rozdziału względem początku książki
+        # oraz łączny czas trwania - wywoływane po zmianie rozdziałów
+        offset = 0
+        changed = []
+        for chapter in self.chapters.order_by('chapter_number'):
+            if chapter.start_offset_seconds != offset:
+                chapter.start_offset_seconds = offset
+                changed.append(chapter)
+            offset += chapter.duration_seconds
+
+        if changed:
+            Chapter.objects.bulk_update(changed, ['start_offset_seconds'])
+        # duration_minutes liczymy z rozdziałów, dopóki jakikolwiek ma znany czas
+        duration_minutes = round(offset / 60) if offset else self.duration_minutes
+        if self.total_duration_seconds != offset or self.duration_minutes != duration_minutes:
+            self.total_duration_seconds = offset
+            self.duration_minutes = duration_minutes
+            Audiobook.objects.filter(pk=self.pk).update(
+                total_duration_seconds=offset,
+                duration_minutes=duration_minutes
+            )
     
 
 class Chapter(models.Model):
@@ -111,7 +252,32 @@ class Chapter(models.Model):
         validators=[validate_audio_file],
         help_text="Plik audio rozdziału (MP3, M4A, WAV, max 500MB)"
     )
-    duration_seconds = models.PositiveIntegerField()
+    duration_seconds = models.PositiveIntegerField(
+        default=0,
+        blank=True,
+        help_text="Uzupełniane automatycznie z nagłówków pliku audio"
+    )
+    # parametry pliku odczytane przy wgraniu (audio_metadata.probe_audio)
+    bitrate_kbps = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    codec = models.CharField(max_length=20, blank=True, editable=False)
+    sample_rate = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    file_size = models.PositiveBigIntegerField(default=0, editable=False)
+    # suma duration_seconds poprzednich rozdziałów (Audiobook.update_chapter_offsets)
+    start_offset_seconds = models.PositiveIntegerField(default=0, editable=False)
+
+    # pakowanie do HLS (users/hls.py)
+    hls_status = models.CharField(
+        max_length=10,
+        choices=[
+            ('none', 'Brak'),
+            ('pending', 'W kolejce'),
+            ('ready', 'Gotowe'),
+            ('failed', 'Błąd'),
+        ],
+        default='none',
+        editable=False
+    )
+    hls_source = models.CharField(max_length=255, blank=True, editable=False, help_text="Plik, z którego powstało HLS")
     
     class Meta:
         ordering = ['chapter_number']
@@ -120,12 +286,69 @@ class Chapter(models.Model):
     def __str__(self):
         return f"{self.audiobook.title} - Chapter {self.chapter_number}: {self.title}"
 
+    def save(self, *args, **kwargs):
+        # nowo wgrany plik jeszcze nie trafił do storage - czytamy nagłówki z uploadu
+        if self.audio_file and not self.audio_file._committed:
+            self.apply_audio_metadata()
+        super().save(*args, **kwargs)
+
+    def apply_audio_metadata(self):
+        """Uzupełnia czas trwania i parametry pliku z nagłówków. Zwraca True, gdy się udało."""
+        metadata = probe_audio(self.audio_file)
+        if metadata is None:
+            return False
+
+        self.duration_seconds = metadata.duration_seconds
+        self.bitrate_kbps = metadata.bitrate_kbps
+        self.codec = metadata.codec
+        self.sample_rate = metadata.sample_rate
+        self.file_size = metadata.file_size
+        return True
+
+class UserLibraryQuerySet(models.QuerySet):
+
+    def with_shelf_state(self):
+        """
+        Jedno zapytanie dla półek biblioteki: wpis, karta audiobooka
+        (select_related, średnia ocen z kolumn audiobooka), stan
+        słuchania (progress_state) i procent postępu (progress_value).
+        """
+        progress = ListeningProgress.objects.filter(user=OuterRef('user'), audiobook=OuterRef('audiobook'))
+        return self.select_related('audiobook__author', 'audiobook__category').annotate(
+            progress_completed=Subquery(progress.values('is_completed')[:1]),
+            progress_value=Coalesce(
+                Subquery(progress.with_progress().values('progress_value')[:1]),
+                Value(0.0),
+                output_field=models.FloatField()
+            ),
+            audiobook_purchased=Exists(Purchase.objects.filter(
+                user=OuterRef('user'),
+                audiobook=OuterRef('audiobook'),
+                payment_status='completed'
+            )),
+        ).annotate(
+            progress_state=Case(
+                When(progress_completed__isnull=True, then=Value(UserLibrary.STATE_NOT_STARTED)),
+                When(progress_completed=True, then=Value(UserLibrary.STATE_COMPLETED)),
+                default=Value(UserLibrary.STATE_LISTENING),
+                output_field=models.CharField()
+            )
+        )
+
+
 class UserLibrary(models.Model):
+    # stan słuchania pozycji w bibliotece (UserLibraryQuerySet.with_shelf_state)
+    STATE_NOT_STARTED = 'not_started'
+    STATE_LISTENING = 'listening'
+    STATE_COMPLETED = 'completed'
+    STATES = (STATE_NOT_STARTED, STATE_LISTENING, STATE_COMPLETED)
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='library')  # ← ZMIANA
     audiobook = models.ForeignKey(Audiobook, on_delete=models.CASCADE)
     added_at = models.DateTimeField(auto_now_add=True)
     is_favorite = models.BooleanField(default=False)
+
+    objects = UserLibraryQuerySet.as_manager()
     
     class Meta:
         unique_together = ['user', 'audiobook']
@@ -133,6 +356,26 @@ class UserLibrary(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.audiobook.title}"
 
+class ListeningProgressQuerySet(models.QuerySet):
+
+    def with_progress(self):
+        # ten sam wzór co ListeningProgress.progress_percentage, liczony w SQL
+        listened = F('current_chapter__start_offset_seconds') + F('current_position_seconds')
+        return self.annotate(
+            progress_value=Coalesce(
+                Round(
+                    ExpressionWrapper(
+                        listened * 100.0 / NullIf(F('audiobook__total_duration_seconds'), 0),
+                        output_field=models.FloatField()
+                    ),
+                    2
+                ),
+                Value(0.0),
+                output_field=models.FloatField()
+            )
+        )
+
+
 class ListeningProgress(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  # ← ZMIANA
     audiobook = models.ForeignKey(Audiobook, on_delete=models.CASCADE)
@@ -140,6 +383,8 @@ class ListeningProgress(models.Model):
     current_position_seconds = models.PositiveIntegerField(default=0)  # pozycja w rozdziale
     last_listened = models.DateTimeField(auto_now=True)
     is_completed = models.BooleanField(default=False)
+
+    objects = ListeningProgressQuerySet.as_manager()
     
     class Meta:
         unique_together = ['user', 'audiobook']
@@ -149,12 +394,11 @@ class ListeningProgress(models.Model):
     
     @property
     def progress_percentage(self):
-        total_seconds = sum(chapter.duration_seconds for chapter in self.audiobook.chapters.all())
-        
-        completed_chapters = self.audiobook.chapters.filter(chapter_number__lt=self.current_chapter.chapter_number)
-        completed_seconds = sum(chapter.duration_seconds for chapter in completed_chapters)
-        
-        current_seconds = completed_seconds + self.current_position_seconds
+        if 'progress_value' in self.__dict__:
+            return self.progress_value
+
+        total_seconds = self.audiobook.total_duration_seconds
+        current_seconds = self.current_chapter.start_offset_seconds + self.current_position_seconds
         
         if total_seconds > 0:
             return round((current_seconds / total_seconds) * 100, 2)
@@ -198,4 +442,14 @@ class Purchase(models.Model):
         verbose_name_plural = "Purchases"
     
     def __str__(self):
-        return f"{self.user.email} bought {self.audiobook.title} for {self.price_paid} PLN"
\ No newline at end of file
+        return f"{self.user.email} bought {self.audiobook.title} for {self.price_paid} PLN"
+
+class StripeEvent(models.Model):
+    # przetworzone zdarzenia webhooka Stripe (payments.py) - Stripe ponawia
+    # dostarczenie, więc każde zdarzenie obsługujemy dokładnie raz
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id})"
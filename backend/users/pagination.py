@@ -0,0 +1,179 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _positive_int
+from rest_framework.utils.urls import replace_query_param
+
+
+class OrderedCursorPagination(CursorPagination):
+    """
+    Paginacja kursorowa (keyset) sterowana parametrem ?ordering=.
+
+    Dozwolone pola sortowania są opisane w `ordering_fields` jako
+    {nazwa w API: kolumna/adnotacja w querysecie}. Kursor DRF pamięta tylko
+    wartość pierwszej kolumny, a remisy przewija offsetem (uciętym do
+    `offset_cutoff`), więc przy ponad 1000 równych wartościach stronicowanie
+    się zapętla. Tutaj kursor trzyma parę (wartość, id) i filtruje
+    `col > v OR (col = v AND id > last_id)` - bez offsetu.
+    Przy ?search= domyślnie sortuje po trafności (`rank`), jeśli jest dozwolona.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering_fields = {'created_at': 'created_at'}
+    ordering = '-created_at'
+
+    def get_default_ordering(self, request):
+        if request.query_params.get('search') and 'rank' in self.ordering_fields:
+            return 'rank'
+        return self.ordering
+
+    def get_ordering(self, request, queryset, view):
+        default = self.get_default_ordering(request)
+        requested = request.query_params.get('ordering', default)
+        if requested.lstrip('-') not in self.ordering_fields:
+            requested = default
+        if requested.lstrip('-') == 'rank' and not request.query_params.get('search'):
+            requested = self.ordering
+
+        descending = requested.startswith('-')
+        column = self.ordering_fields[requested.lstrip('-')]
+
+        if descending:
+            return ('-' + column, '-id')
+        return (column, 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        column = self.ordering[0].lstrip('-')
+        descending = self.ordering[0].startswith('-')
+        if reverse:
+            queryset = queryset.order_by(*(
+                field[1:] if field.startswith('-') else '-' + field for field in self.ordering
+            ))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if position is not None:
+            value, last_id = position
+            # (kursor wstecz) XOR (sortowanie malejące) => porównanie "mniejsze"
+            lookup = 'lt' if reverse != descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{column}__{lookup}': value}) | Q(**{column: value, f'id__{lookup}': last_id})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            # pusta strona (np. wszystko za kursorem zniknęło) - wracamy od tego samego miejsca
+            self.next_position = self.previous_position = position
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = None
+            if 'p' in tokens:
+                position = (tokens['p'][0], _positive_int(tokens['i'][0]))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        if cursor.position is not None:
+            tokens['p'], tokens['i'] = cursor.position[0], str(cursor.position[1])
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        column = ordering[0].lstrip('-')
+        if isinstance(instance, dict):
+            return (str(instance[column]), instance['id'])
+        return (str(getattr(instance, column)), instance.pk)
+
+
+class AudiobookCursorPagination(OrderedCursorPagination):
+    # `price` jest NULL dla darmowych audiobooków - kursor sortuje po
+    # adnotacji `sort_price` z AudiobookViewSet.get_queryset
+    ordering_fields = {
+        'title': 'title',
+        'publication_date': 'publication_date',
+        'created_at': 'created_at',
+        'price': 'sort_price',
+        'rating': 'sort_rating',
+        'rank': 'search_rank',
+    }
+    ordering = '-created_at'
+
+
+class AuthorCursorPagination(OrderedCursorPagination):
+    ordering_fields = {'name': 'name', 'rank': 'search_rank'}
+    ordering = 'name'
+
+
+class CategoryCursorPagination(OrderedCursorPagination):
+    ordering_fields = {'name': 'name'}
+    ordering = 'name'
+
+
+class RatingCursorPagination(OrderedCursorPagination):
+    ordering_fields = {'created_at': 'created_at'}
+    ordering = '-created_at'
+
+
+class PurchaseCursorPagination(OrderedCursorPagination):
+    ordering_fields = {'purchased_at': 'purchased_at'}
+    ordering = '-purchased_at'
+
+
+class UserLibraryCursorPagination(OrderedCursorPagination):
+    ordering_fields = {'added_at': 'added_at'}
+    ordering = '-added_at'
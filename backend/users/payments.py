@@ -0,0 +1,141 @@
+# payments.py - Płatności Stripe: asynchroniczny klient i webhook
+#
+# Zakup kończy webhook payment_intent.succeeded (views.stripe_webhook):
+# podpis sprawdzany lokalnie (STRIPE_WEBHOOK_SECRET), każde zdarzenie
+# zapisywane w StripeEvent w tej samej transakcji co Purchase i
+# UserLibrary, więc ponowione dostarczenie niczego nie zmienia.
+# confirm_payment najpierw czyta lokalny Purchase i pyta Stripe tylko,
+# gdy webhook jeszcze nie dotarł.
+#
+# Wywołania API Stripe idą przez StripeClient z HTTPXClient: async,
+# z pulą połączeń i limitami czasu (STRIPE_TIMEOUT_SECONDS,
+# STRIPE_CONNECT_TIMEOUT_SECONDS). Pula httpx jest związana z pętlą
+# zdarzeń, więc klient jest jeden na pętlę - pod ASGI to jeden na worker,
+# pod WSGI (async_to_sync) nowy na każde żądanie. STRIPE_API_BASE
+# przełącza na lokalny zamiennik (stripe-mock) - docs/payments.md.
+import asyncio
+import json
+import logging
+import weakref
+from decimal import Decimal
+
+import httpx
+import stripe
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Audiobook, CustomUser, Purchase, StripeEvent, UserLibrary
+
+logger = logging.getLogger(__name__)
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """StripeClient dla bieżącej pętli zdarzeń."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        timeout = httpx.Timeout(
+            getattr(settings, 'STRIPE_TIMEOUT_SECONDS', 10),
+            connect=getattr(settings, 'STRIPE_CONNECT_TIMEOUT_SECONDS', 3)
+        )
+        api_base = getattr(settings, 'STRIPE_API_BASE', '')
+        client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            http_client=stripe.HTTPXClient(timeout=timeout),
+            base_addresses={'api': api_base} if api_base else None,
+            max_network_retries=getattr(settings, 'STRIPE_MAX_NETWORK_RETRIES', 2),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def create_payment_intent(audiobook, user):
+    return await get_client().v1.payment_intents.create_async(params={
+        'amount': int(audiobook.price * 100),
+        'currency': 'pln',
+        'metadata': {
+            'audiobook_id': str(audiobook.id),
+            'user_id': str(user.id),
+        },
+    })
+
+
+async def retrieve_payment_intent(payment_intent_id):
+    return await get_client().v1.payment_intents.retrieve_async(payment_intent_id)
+
+
+def verify_event(payload, sig_header):
+    """Sprawdza nagłówek Stripe-Signature; zwraca zdarzenie jako zwykły dict."""
+    payload = payload.decode('utf-8')
+    stripe.WebhookSignature.verify_header(
+        payload, sig_header, settings.STRIPE_WEBHOOK_SECRET, stripe.Webhook.DEFAULT_TOLERANCE
+    )
+    return json.loads(payload)
+
+
+def finalize_payment(payment_intent):
+    """Zapisuje opłacony zakup i pozycję w bibliotece; wielokrotne wywołanie niczego nie zmienia."""
+    metadata = payment_intent.get('metadata') or {}
+    if 'user_id' not in metadata or 'audiobook_id' not in metadata:
+        logger.warning(f"PaymentIntent {payment_intent['id']} bez metadanych zakupu")
+        return None
+
+    try:
+        user_id = int(metadata['user_id'])
+        audiobook_id = int(metadata['audiobook_id'])
+    except (TypeError, ValueError):
+        logger.warning(f"PaymentIntent {payment_intent['id']} z nieprawidłowymi metadanymi: {metadata}")
+        return None
+    # klucze obce są sprawdzane dopiero przy commicie - brakujący wiersz
+    # wycofałby też StripeEvent i Stripe ponawiałby zdarzenie bez końca
+    if not (CustomUser.objects.filter(pk=user_id).exists() and Audiobook.objects.filter(pk=audiobook_id).exists()):
+        logger.error(f"PaymentIntent {payment_intent['id']}: brak użytkownika {user_id} lub audiobooka {audiobook_id} - do zwrotu ręcznie")
+        return None
+
+    amount = payment_intent.get('amount_received') or payment_intent['amount']
+    with transaction.atomic():
+        purchase = Purchase.objects.select_for_update().filter(user_id=user_id, audiobook_id=audiobook_id).first()
+        if purchase is None:
+            purchase = Purchase(user_id=user_id, audiobook_id=audiobook_id)
+        elif purchase.payment_status == 'completed':
+            if purchase.payment_id != payment_intent['id']:
+                # druga płatność za ten sam audiobook - do zwrotu ręcznie
+                logger.error(f"PaymentIntent {payment_intent['id']}: zakup {purchase.pk} już opłacony przez {purchase.payment_id}")
+            return purchase
+
+        purchase.price_paid = Decimal(amount) / 100
+        purchase.payment_id = payment_intent['id']
+        purchase.payment_status = 'completed'
+        purchase.save()
+        UserLibrary.objects.get_or_create(user_id=user_id, audiobook_id=audiobook_id)
+    return purchase
+
+
+def fail_payment(payment_intent):
+    return Purchase.objects.filter(payment_id=payment_intent['id'], payment_status='pending').update(payment_status='failed')
+
+
+EVENT_HANDLERS = {
+    'payment_intent.succeeded': finalize_payment,
+    'payment_intent.payment_failed': fail_payment,
+}
+
+
+def handle_event(event):
+    """Obsługuje zweryfikowane zdarzenie (dict); False, gdy było już przetworzone."""
+    with transaction.atomic():
+        _, created = StripeEvent.objects.get_or_create(event_id=event['id'], defaults={'type': event['type']})
+        if not created:
+            return False
+
+        handler = EVENT_HANDLERS.get(event['type'])
+        if handler is not None:
+            try:
+                with transaction.atomic():
+                    handler(event['data']['object'])
+            except IntegrityError:
+                # zdarzenie zostaje zapisane jako obsłużone - ponowienie i tak by nie przeszło
+                logger.exception(f"Stripe event {event['id']} ({event['type']}) failed with IntegrityError")
+    return True
@@ -0,0 +1,217 @@
+# response_cache.py - Cache odpowiedzi katalogu dla niezalogowanych
+#
+# Listy audiobooków, autorów i kategorii są dla każdego anonimowego
+# użytkownika takie same, więc gotowy JSON trzymamy w dwóch warstwach:
+#
+#   1. LRU w pamięci procesu (RESPONSE_CACHE_LOCAL_SIZE wpisów),
+#   2. współdzielony cache Django (RESPONSE_CACHE) - wspólny dla workerów.
+#
+# Klucz to generacja katalogu + host + ścieżka + znormalizowane parametry
+# (category, author, search, free_only, premium_only, ordering, cursor,
+# page_size). Zapis/usunięcie Audiobook, Author, Category, Chapter i Rating
+# (signals.py) ustawia nową generację (znacznik czasu, nie licznik - po
+# wyrzuceniu klucza z cache nie wraca żadna stara), więc wszystkie stare
+# wpisy przestają być czytane naraz. Inne procesy widzą nową generację najpóźniej po
+# RESPONSE_CACHE_GENERATION_CHECK_SECONDS. Odpowiedzi mają ETag i obsługują
+# If-None-Match (304).
+#
+# Generacja musi leżeć we wspólnym cache - przy cache lokalnym dla procesu
+# (shared_cache.py) podbicie w jednym workerze nie dotarłoby do pozostałych,
+# więc cache odpowiedzi jest wtedy wyłączony.
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.functional import cached_property
+from django.utils.http import parse_etags
+
+from .shared_cache import shared_cache
+
+GENERATION_KEY = 'catalog:generation'
+
+CACHED_PARAMS = (
+    'category', 'author', 'search', 'free_only', 'premium_only', 'min_rating', 'ordering', 'cursor', 'page_size'
+)
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    content: bytes
+    content_type: str
+    etag: str
+
+
+class CatalogResponse(HttpResponse):
+    """Gotowy JSON z cache; `data` jak w Response z DRF, liczone dopiero przy odczycie."""
+
+    @cached_property
+    def data(self):
+        return json.loads(self.content)
+
+
+class LocalLRU:
+    """Najmniej ostatnio używane wpisy wypadają pierwsze; bezpieczne dla wątków."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalLRU(getattr(settings, 'RESPONSE_CACHE_LOCAL_SIZE', 256))
+
+# generacja odczytana ze współdzielonego cache i moment odczytu
+_generation = {'value': None, 'checked_at': 0.0}
+
+
+def get_cache():
+    return shared_cache(getattr(settings, 'RESPONSE_CACHE', 'default'))
+
+
+def is_enabled():
+    return getattr(settings, 'RESPONSE_CACHE_ENABLED', True) and get_cache() is not None
+
+
+def get_generation():
+    """Bieżąca generacja katalogu albo None bez współdzielonego cache."""
+    cache = get_cache()
+    if cache is None:
+        return None
+    check_interval = getattr(settings, 'RESPONSE_CACHE_GENERATION_CHECK_SECONDS', 1)
+    now = time.monotonic()
+    if _generation['value'] is None or now - _generation['checked_at'] >= check_interval:
+        _generation['value'] = cache.get_or_set(GENERATION_KEY, time.time_ns(), timeout=None)
+        _generation['checked_at'] = now
+    return _generation['value']
+
+
+def _bump_generation():
+    cache = get_cache()
+    if cache is None:
+        return
+    generation = time.time_ns()
+    cache.set(GENERATION_KEY, generation, timeout=None)
+    _generation['value'] = generation
+    _generation['checked_at'] = time.monotonic()
+
+
+def invalidate():
+    _bump_generation()
+    # po commicie jeszcze raz - żądanie w trakcie transakcji mogło zapisać stary stan
+    transaction.on_commit(_bump_generation)
+
+
+def reset():
+    local_cache.clear()
+    _generation['value'] = None
+
+
+def normalize_params(query_params):
+    """Zwraca pary parametrów w stałej kolejności albo None, gdy żądanie ma parametry spoza klucza."""
+    if set(query_params) - set(CACHED_PARAMS):
+        # np. ?format= albo dowolny parametr doklejany do linków next/previous
+        return None
+
+    params = []
+    for name in CACHED_PARAMS:
+        value = query_params.get(name, '').strip()
+        if name == 'search':
+            value = ' '.join(value.lower().split())
+        if value:
+            params.append((name, value))
+    return params
+
+
+def cache_key(request, generation):
+    params = normalize_params(request.query_params)
+    if params is None:
+        return None
+    raw = '\n'.join([request.get_host(), request.path, urlencode(params), request.accepted_renderer.format])
+    return f'catalog:{generation}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def to_response(request, cached):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and cached.etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        response = CatalogResponse(cached.content, content_type=cached.content_type)
+    response['ETag'] = cached.etag
+    response['Vary'] = 'Accept, Authorization'
+    return response
+
+
+def render(view, request, response):
+    renderer = request.accepted_renderer
+    content = renderer.render(response.data, request.accepted_media_type, view.get_renderer_context())
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    etag = f'"{hashlib.sha1(content).hexdigest()}"'
+    return CachedResponse(content, content_type, etag)
+
+
+def cached_catalog_response(view_method):
+    """Dekorator akcji viewsetu: anonimowe GET-y JSON idą przez cache."""
+
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        if (
+            not is_enabled()
+            or request.method != 'GET'
+            or request.user.is_authenticated
+            or request.accepted_renderer.format != 'json'
+        ):
+            return view_method(view, request, *args, **kwargs)
+
+        key = cache_key(request, get_generation())
+        if key is None:
+            return view_method(view, request, *args, **kwargs)
+
+        cached = local_cache.get(key)
+        if cached is None:
+            cached = get_cache().get(key)
+            if cached is not None:
+                local_cache.set(key, cached)
+        if cached is not None:
+            return to_response(request, cached)
+
+        response = view_method(view, request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+
+        cached = render(view, request, response)
+        get_cache().set(key, cached, getattr(settings, 'RESPONSE_CACHE_TTL_SECONDS', 600))
+        local_cache.set(key, cached)
+        cached_response = to_response(request, cached)
+        if isinstance(cached_response, CatalogResponse):
+            cached_response.data = response.data
+        return cached_response
+
+    return wrapper
@@ -0,0 +1,290 @@
+# search.py - Wyszukiwanie pełnotekstowe audiobooków i autorów
+#
+# Indeks to osobna tabela na każdy model, z wierszem o id audiobooka/autora:
+#   - SQLite: tabela wirtualna FTS5 (ranking bm25, tokenizer unicode61 bez
+#     znaków diakrytycznych),
+#   - PostgreSQL: kolumna tsvector z indeksem GIN (ranking ts_rank, słownik
+#     'simple' - bez stemmingu, jak FTS5).
+# Dokument audiobooka zawiera tytuł, nazwisko autora i opis (wagi jak w
+# AUDIOBOOK_FTS_WEIGHTS), więc "tolkien hobbit" trafia na obu bazach. Słowa
+# są dopasowywane prefiksowo (podpowiedzi w Search.jsx). Tabele tworzy
+# migracja 0016_search_tables; indeks jest aktualizowany sygnałami z
+# users/signals.py, a w całości przebudowuje go komenda
+# `manage.py rebuild_search_index`.
+#
+# Dopasowanie i ranking są częścią zapytania widoku (RawSQL), a nie osobną
+# listą ID: filtry kategorii/premium/oceny działają na wszystkich
+# trafieniach, a paginacja kursorowa przewija je po (search_rank, id) bez
+# limitu. `search_rank` - mniejszy = lepsze trafienie (bm25, a na
+# PostgreSQL ujemny ts_rank).
+#
+# Na innych bazach wyszukiwanie wraca do filtrowania `icontains` po
+# tytule, nazwisku autora i opisie, bez indeksu i bez rankingu
+# (search_rank = 0, kolejność po id) - docs/database.md.
+import re
+from django.db import connections, models
+from django.db.models import Value, Q
+from django.db.models.expressions import RawSQL
+
+AUDIOBOOK_FTS_TABLE = 'users_audiobook_fts'
+AUTHOR_FTS_TABLE = 'users_author_fts'
+
+# wagi kolumn dla bm25 - trafienie w tytule/nazwisku liczy się najbardziej
+AUDIOBOOK_FTS_WEIGHTS = (10.0, 5.0, 1.0)  # title, author_name, description
+AUTHOR_FTS_WEIGHTS = (10.0, 1.0)  # name, bio
+
+# te same kolumny jako etykiety wag tsvector (A najważniejsza)
+AUDIOBOOK_TSVECTOR_WEIGHTS = ('A', 'B', 'D')
+AUTHOR_TSVECTOR_WEIGHTS = ('A', 'D')
+TSVECTOR_CONFIG = 'simple'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_vendor(using='default'):
+    return connections[using].vendor
+
+
+def is_supported(using='default'):
+    return get_vendor(using) in ('sqlite', 'postgresql')
+
+
+def build_match_query(text):
+    # "harry pot" -> "harry"* "pot"*  (wszystkie słowa, każde jako prefiks)
+    tokens = TOKEN_RE.findall(text.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def build_tsquery(text):
+    # "harry pot" -> 'harry':* & 'pot':*  (to samo dla to_tsquery)
+    tokens = TOKEN_RE.findall(text.lower())
+    return ' & '.join(f"'{token}':*" for token in tokens)
+
+
+def tsvector_sql(values, weights):
+    """Wyrażenie SQL dokumentu tsvector z kolumn/placeholderów `values`."""
+    return ' || '.join(
+        f"setweight(to_tsvector('{TSVECTOR_CONFIG}', coalesce({value}, '')), '{weight}')"
+        for value, weight in zip(values, weights)
+    )
+
+
+def create_search_tables(using='default'):
+    """Tworzy tabele indeksu, jeśli ich nie ma. Zwraca True, gdy powstały teraz."""
+    if not is_supported(using):
+        return False
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        existing = set(connection.introspection.table_names(cursor))
+        created = False
+        if get_vendor(using) == 'postgresql':
+            # bez klucza obcego, jak FTS5 - usuwanie obsługują sygnały
+            for table in (AUDIOBOOK_FTS_TABLE, AUTHOR_FTS_TABLE):
+                if table in existing:
+                    continue
+                cursor.execute(f"CREATE TABLE {table} (id bigint PRIMARY KEY, document tsvector NOT NULL)")
+                cursor.execute(f"CREATE INDEX {table}_document ON {table} USING gin (document)")
+                created = True
+            return created
+
+        if AUDIOBOOK_FTS_TABLE not in existing:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {AUDIOBOOK_FTS_TABLE} USING fts5("
+                "title, author_name, description, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            created = True
+        if AUTHOR_FTS_TABLE not in existing:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {AUTHOR_FTS_TABLE} USING fts5("
+                "name, bio, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            created = True
+    return created
+
+
+def drop_search_tables(using='default'):
+    if not is_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {AUDIOBOOK_FTS_TABLE}")
+        cursor.execute(f"DROP TABLE IF EXISTS {AUTHOR_FTS_TABLE}")
+
+
+def rebuild_search_index(using='default'):
+    if not is_supported(using):
+        return
+
+    create_search_tables(using)
+    if get_vendor(using) == 'postgresql':
+        audiobook_document = tsvector_sql(('b.title', 'a.name', 'b.description'), AUDIOBOOK_TSVECTOR_WEIGHTS)
+        author_document = tsvector_sql(('name', 'bio'), AUTHOR_TSVECTOR_WEIGHTS)
+        audiobook_columns, author_columns = '(id, document)', '(id, document)'
+    else:
+        audiobook_document, author_document = 'b.title, a.name, b.description', 'name, bio'
+        audiobook_columns, author_columns = '(rowid, title, author_name, description)', '(rowid, name, bio)'
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {AUDIOBOOK_FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {AUDIOBOOK_FTS_TABLE} {audiobook_columns} "
+            f"SELECT b.id, {audiobook_document} "
+            "FROM users_audiobook b JOIN users_author a ON a.id = b.author_id"
+        )
+        cursor.execute(f"DELETE FROM {AUTHOR_FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {AUTHOR_FTS_TABLE} {author_columns} "
+            f"SELECT id, {author_document} FROM users_author"
+        )
+
+
+def index_audiobook(audiobook, using='default'):
+    if not is_supported(using):
+        return
+
+    values = [audiobook.title, audiobook.author.name, audiobook.description]
+    with connections[using].cursor() as cursor:
+        if get_vendor(using) == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {AUDIOBOOK_FTS_TABLE} (id, document) "
+                f"VALUES (%s, {tsvector_sql(('%s', '%s', '%s'), AUDIOBOOK_TSVECTOR_WEIGHTS)}) "
+                "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document",
+                [audiobook.pk, *values]
+            )
+            return
+
+        cursor.execute(f"DELETE FROM {AUDIOBOOK_FTS_TABLE} WHERE rowid = %s", [audiobook.pk])
+        cursor.execute(
+            f"INSERT INTO {AUDIOBOOK_FTS_TABLE} (rowid, title, author_name, description) "
+            "VALUES (%s, %s, %s, %s)",
+            [audiobook.pk, *values]
+        )
+
+
+def remove_audiobook(audiobook_id, using='default'):
+    if not is_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {AUDIOBOOK_FTS_TABLE} WHERE {_id_column(using)} = %s", [audiobook_id])
+
+
+def index_author(author, using='default'):
+    if not is_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        if get_vendor(using) == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {AUTHOR_FTS_TABLE} (id, document) "
+                f"VALUES (%s, {tsvector_sql(('%s', '%s'), AUTHOR_TSVECTOR_WEIGHTS)}) "
+                "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document",
+                [author.pk, author.name, author.bio]
+            )
+            # nazwisko autora jest też częścią dokumentu każdego jego audiobooka
+            cursor.execute(
+                f"UPDATE {AUDIOBOOK_FTS_TABLE} f "
+                f"SET document = {tsvector_sql(('b.title', '%s', 'b.description'), AUDIOBOOK_TSVECTOR_WEIGHTS)} "
+                "FROM users_audiobook b WHERE b.id = f.id AND b.author_id = %s",
+                [author.name, author.pk]
+            )
+            return
+
+        cursor.execute(f"DELETE FROM {AUTHOR_FTS_TABLE} WHERE rowid = %s", [author.pk])
+        cursor.execute(
+            f"INSERT INTO {AUTHOR_FTS_TABLE} (rowid, name, bio) VALUES (%s, %s, %s)",
+            [author.pk, author.name, author.bio]
+        )
+        # nazwisko autora jest też częścią dokumentu każdego jego audiobooka
+        cursor.execute(
+            f"UPDATE {AUDIOBOOK_FTS_TABLE} SET author_name = %s "
+            "WHERE rowid IN (SELECT id FROM users_audiobook WHERE author_id = %s)",
+            [author.name, author.pk]
+        )
+
+
+def remove_author(author_id, using='default'):
+    if not is_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {AUTHOR_FTS_TABLE} WHERE {_id_column(using)} = %s", [author_id])
+
+
+def _id_column(using):
+    return 'id' if get_vendor(using) == 'postgresql' else 'rowid'
+
+
+def _outer_id(queryset):
+    quote_name = connections[queryset.db].ops.quote_name
+    return f'{quote_name(queryset.model._meta.db_table)}.{quote_name("id")}'
+
+
+def _fts_search(queryset, table, weights, text):
+    match = build_match_query(text)
+    if not match:
+        return queryset.none()
+
+    # rowid w tabeli FTS = id wiersza. bm25 liczymy raz dla wszystkich
+    # trafień w podzapytaniu z LIMIT -1 - bez niego SQLite wciąga je do
+    # podzapytania skorelowanego i powtarza MATCH dla każdego wiersza
+    # (kwadratowo: 4k trafień przy 10k audiobooków to sekundy)
+    weights_sql = ', '.join(str(w) for w in weights)
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT ranked.rank FROM ("
+            f"SELECT rowid AS id, bm25({table}, {weights_sql}) AS rank FROM {table} "
+            f"WHERE {table} MATCH %s LIMIT -1) ranked "
+            f"WHERE ranked.id = {_outer_id(queryset)}",
+            [match],
+            output_field=models.FloatField()
+        )
+    )
+
+
+def _tsvector_search(queryset, table, text):
+    query = build_tsquery(text)
+    if not query:
+        return queryset.none()
+
+    # @@ idzie po indeksie GIN; ts_rank z minusem, żeby rosnąco = najlepsze jak bm25
+    tsquery = f"to_tsquery('{TSVECTOR_CONFIG}', %s)"
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT id FROM {table} WHERE document @@ {tsquery}", [query])
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT -ts_rank(document, {tsquery}) FROM {table} WHERE id = {_outer_id(queryset)}",
+            [query],
+            output_field=models.FloatField()
+        )
+    )
+
+
+def search_audiobooks(queryset, text):
+    if is_supported(queryset.db):
+        if get_vendor(queryset.db) == 'postgresql':
+            return _tsvector_search(queryset, AUDIOBOOK_FTS_TABLE, text)
+        return _fts_search(queryset, AUDIOBOOK_FTS_TABLE, AUDIOBOOK_FTS_WEIGHTS, text)
+
+    return queryset.filter(
+        Q(title__icontains=text) |
+        Q(author__name__icontains=text) |
+        Q(description__icontains=text)
+    ).annotate(search_rank=Value(0, output_field=models.IntegerField()))
+
+
+def search_authors(queryset, text):
+    if is_supported(queryset.db):
+        if get_vendor(queryset.db) == 'postgresql':
+            return _tsvector_search(queryset, AUTHOR_FTS_TABLE, text)
+        return _fts_search(queryset, AUTHOR_FTS_TABLE, AUTHOR_FTS_WEIGHTS, text)
+
+    return queryset.filter(
+        Q(name__icontains=text) |
+        Q(bio__icontains=text)
+    ).annotate(search_rank=Value(0, output_field=models.IntegerField()))
@@ -0,0 +1,258 @@
+# seeding.py - Syntetyczny katalog do testów obciążeniowych i benchmarków
+#
+# Wszystko idzie przez bulk_create w partiach (batch_size), więc sygnały się
+# nie wykonują - dane pochodne liczymy tutaj przed zapisem:
+#   - start_offset_seconds rozdziałów, total_duration_seconds i duration_minutes,
+#   - rating_sum / rating_count / rating_count_1..5 audiobooków,
+#   - audiobooks_count autorów i kategorii,
+#   - indeks wyszukiwania (search.rebuild_search_index) i generacja cache katalogu.
+# Ten sam seed daje te same dane. Wszystkie rozdziały wskazują na jeden mały
+# plik WAV (PLACEHOLDER_AUDIO), więc miliony wierszy nie zajmują miejsca na dysku.
+import io
+import random
+import time
+import wave
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import response_cache, search
+from .models import Audiobook, Author, Category, Chapter, ListeningProgress, Purchase, Rating, UserLibrary, RATING_SCORES
+
+PLACEHOLDER_AUDIO = 'audiobooks/seed/placeholder.wav'
+PLACEHOLDER_SAMPLE_RATE = 8000
+
+TITLE_WORDS = ['dragon', 'night', 'river', 'crown', 'garden', 'winter', 'shadow', 'harbor', 'letter', 'empire']
+
+
+@dataclass
+class SeedOptions:
+    audiobooks: int = 1_000
+    authors: int = 100
+    categories: int = 20
+    users: int = 200
+    chapters_per_audiobook: int = 5
+    ratings_per_audiobook: int = 3
+    library_per_user: int = 10
+    purchases_per_user: int = 2
+    progress_per_user: int = 3
+    premium_ratio: float = 1 / 3
+    batch_size: int = 2_000
+    seed: int = 2024
+    prefix: str = 'seed'
+    password: str = 'seedpass123'
+    write_audio: bool = True
+
+
+@dataclass
+class SeedResult:
+    counts: Counter = field(default_factory=Counter)
+    seconds: float = 0.0
+
+
+def placeholder_audio():
+    """Krótka cisza w WAV (PCM 16 bit, mono) - wystarcza dla streamingu i Range."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(PLACEHOLDER_SAMPLE_RATE)
+        wav.writeframes(b'\x00\x00' * PLACEHOLDER_SAMPLE_RATE)
+    return buffer.getvalue()
+
+
+def ensure_placeholder_audio():
+    if not default_storage.exists(PLACEHOLDER_AUDIO):
+        default_storage.save(PLACEHOLDER_AUDIO, ContentFile(placeholder_audio()))
+    return default_storage.size(PLACEHOLDER_AUDIO)
+
+
+def batches(total, size):
+    for start in range(0, total, size):
+        yield range(start, min(start + size, total))
+
+
+class CatalogSeeder:
+
+    def __init__(self, options, log=None):
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.log = log or (lambda message: None)
+        self.result = SeedResult()
+
+        self.author_ids = []
+        self.category_ids = []
+        self.user_ids = []
+        # audiobook_id -> (cena albo None, id pierwszego rozdziału)
+        self.audiobooks = {}
+        self.premium_ids = []
+        self.audiobooks_per_author = Counter()
+        self.audiobooks_per_category = Counter()
+
+    def create(self, model, objects):
+        created = model.objects.bulk_create(objects, batch_size=self.options.batch_size)
+        self.result.counts[model.__name__] += len(created)
+        return created
+
+    def run(self):
+        started = time.monotonic()
+        self.file_size = ensure_placeholder_audio() if self.options.write_audio else 0
+
+        with transaction.atomic():
+            self.seed_authors_and_categories()
+        self.seed_users()
+        self.seed_audiobooks()
+        self.seed_user_activity()
+
+        with transaction.atomic():
+            self.update_counters()
+        search.rebuild_search_index()
+        response_cache.invalidate()
+
+        self.result.seconds = time.monotonic() - started
+        return self.result
+
+    def seed_authors_and_categories(self):
+        prefix = self.options.prefix
+        self.author_ids = [author.pk for author in self.create(Author, [
+            Author(name=f'{prefix.title()} Author {i}', bio=f'Synthetic author {i}')
+            for i in range(self.options.authors)
+        ])]
+        self.category_ids = [category.pk for category in self.create(Category, [
+            Category(name=f'{prefix.title()} Category {i}', description=f'Synthetic category {i}')
+            for i in range(self.options.categories)
+        ])]
+        self.log(f'Autorzy: {len(self.author_ids)}, kategorie: {len(self.category_ids)}')
+
+    def seed_users(self):
+        # jeden hash dla wszystkich - haszowanie milionów haseł trwałoby godzinami
+        password = make_password(self.options.password)
+        User = get_user_model()
+        for chunk in batches(self.options.users, self.options.batch_size):
+            with transaction.atomic():
+                created = self.create(User, [
+                    User(email=f'{self.options.prefix}{i}@example.com', username=f'{self.options.prefix}{i}', password=password)
+                    for i in chunk
+                ])
+            self.user_ids.extend(user.pk for user in created)
+        self.log(f'Użytkownicy: {len(self.user_ids)}')
+
+    def seed_audiobooks(self):
+        options, rng = self.options, self.rng
+        for chunk in batches(options.audiobooks, options.batch_size):
+            audiobooks, chapter_durations, scores = [], [], []
+            for i in chunk:
+                durations = [rng.randint(300, 3600) for _ in range(options.chapters_per_audiobook)]
+                raters = rng.sample(self.user_ids, min(options.ratings_per_audiobook, len(self.user_ids)))
+                ratings = [(user_id, rng.choice(RATING_SCORES)) for user_id in raters]
+                histogram = Counter(score for _, score in ratings)
+
+                is_premium = rng.random() < options.premium_ratio
+                audiobook = Audiobook(
+                    title=f'{rng.choice(TITLE_WORDS).title()} {rng.choice(TITLE_WORDS)} {i}',
+                    description=f'Synthetic audiobook {i} about {" and ".join(rng.sample(TITLE_WORDS, 3))}',
+                    author_id=rng.choice(self.author_ids),
+                    category_id=rng.choice(self.category_ids),
+                    narrator=f'Narrator {rng.randint(1, 500)}',
+                    publication_date=date(1990, 1, 1) + timedelta(days=rng.randint(0, 12_000)),
+                    is_premium=is_premium,
+                    price=Decimal(rng.choice(['9.99', '19.99', '29.99'])) if is_premium else None,
+                    total_duration_seconds=sum(durations),
+                    duration_minutes=round(sum(durations) / 60),
+                    rating_sum=sum(score for _, score in ratings),
+                    rating_count=len(ratings),
+                    **{f'rating_count_{score}': histogram[score] for score in RATING_SCORES},
+                )
+                audiobooks.append(audiobook)
+                chapter_durations.append(durations)
+                scores.append(ratings)
+
+            with transaction.atomic():
+                audiobooks = self.create(Audiobook, audiobooks)
+                chapters = self.create(Chapter, [
+                    chapter
+                    for audiobook, durations in zip(audiobooks, chapter_durations)
+                    for chapter in self.build_chapters(audiobook, durations)
+                ])
+                self.create(Rating, [
+                    Rating(user_id=user_id, audiobook=audiobook, rating=score)
+                    for audiobook, ratings in zip(audiobooks, scores)
+                    for user_id, score in ratings
+                ])
+
+            first_chapters = {}
+            for chapter in chapters:
+                if chapter.chapter_number == 1:
+                    first_chapters[chapter.audiobook_id] = chapter.pk
+            for audiobook in audiobooks:
+                self.audiobooks[audiobook.pk] = (audiobook.price, first_chapters.get(audiobook.pk))
+                if audiobook.is_premium:
+                    self.premium_ids.append(audiobook.pk)
+                self.audiobooks_per_author[audiobook.author_id] += 1
+                self.audiobooks_per_category[audiobook.category_id] += 1
+            self.log(f'Audiobooki: {len(self.audiobooks)}/{options.audiobooks}')
+
+    def build_chapters(self, audiobook, durations):
+        offset = 0
+        for number, duration in enumerate(durations, start=1):
+            yield Chapter(
+                audiobook=audiobook,
+                title=f'Chapter {number}',
+                chapter_number=number,
+                audio_file=PLACEHOLDER_AUDIO,
+                duration_seconds=duration,
+                start_offset_seconds=offset,
+                codec='wave',
+                sample_rate=PLACEHOLDER_SAMPLE_RATE,
+                file_size=self.file_size,
+            )
+            offset += duration
+
+    def seed_user_activity(self):
+        options, rng = self.options, self.rng
+        audiobook_ids = list(self.audiobooks)
+        for chunk in batches(len(self.user_ids), options.batch_size):
+            library, progress, purchases = [], [], []
+            for index in chunk:
+                user_id = self.user_ids[index]
+                shelf = rng.sample(audiobook_ids, min(options.library_per_user, len(audiobook_ids)))
+                for position, audiobook_id in enumerate(shelf):
+                    library.append(UserLibrary(user_id=user_id, audiobook_id=audiobook_id, is_favorite=position % 4 == 0))
+
+                for audiobook_id in shelf[:options.progress_per_user]:
+                    chapter_id = self.audiobooks[audiobook_id][1]
+                    if chapter_id is None:
+                        continue
+                    progress.append(ListeningProgress(
+                        user_id=user_id, audiobook_id=audiobook_id, current_chapter_id=chapter_id,
+                        current_position_seconds=rng.randint(0, 300), is_completed=rng.random() < 0.2
+                    ))
+
+                bought = rng.sample(self.premium_ids, min(options.purchases_per_user, len(self.premium_ids)))
+                for audiobook_id in bought:
+                    purchases.append(Purchase(
+                        user_id=user_id, audiobook_id=audiobook_id, price_paid=self.audiobooks[audiobook_id][0],
+                        payment_status='completed' if rng.random() < 0.9 else 'pending'
+                    ))
+
+            with transaction.atomic():
+                self.create(UserLibrary, library)
+                self.create(ListeningProgress, progress)
+                self.create(Purchase, purchases)
+        self.log(f'Biblioteki, postępy i zakupy dla {len(self.user_ids)} użytkowników')
+
+    def update_counters(self):
+        for model, counts in ((Author, self.audiobooks_per_author), (Category, self.audiobooks_per_category)):
+            owners = [model(pk=pk, audiobooks_count=count) for pk, count in counts.items()]
+            model.objects.bulk_update(owners, ['audiobooks_count'], batch_size=self.options.batch_size)
+
+
+def seed_catalog(options=None, log=None):
+    return CatalogSeeder(options or SeedOptions(), log=log).run()
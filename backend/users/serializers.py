@@ -1,5 +1,10 @@
 from rest_framework import serializers
+from django.db.models.functions import Lower
+from django.urls import reverse
 from .models import *
+from .heartbeat import progress_buffer
+from .entitlements import get_entitlements
+from .signing import signed_media_path
 
 from django.contrib.auth import get_user_model
 User = get_user_model()
@@ -21,6 +26,13 @@ class RegisterSerializer(serializers.ModelSerializer):
         #extra_krawrgs chroni przed wyswietlaniem hasla w odpowiedziach api
         extra_kwargs = { 'password': {'write_only': True} }
 
+    def validate_email(self, value):
+        # unikalny jest Lower('email') - sam unique na polu nie złapie Jan@X.pl
+        email = User.objects.normalize_email(value)
+        if User.objects.alias(email_lower=Lower('email')).filter(email_lower=email).exists():
+            raise serializers.ValidationError('Konto z tym adresem email już istnieje.')
+        return email
+
     def create(self, validated_data):
          #tworzy nowego użytkownika za pomoca modelu User 
         user = User.objects.create_user(**validated_data)
@@ -42,32 +54,25 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'email', 'first_name', 'last_name', 'username']
 
 class AuthorSerializer(serializers.ModelSerializer):
-    audiobooks_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Author
         fields = ['id', 'name', 'bio', 'audiobooks_count']
-    
-    def get_audiobooks_count(self, obj):
-        return obj.audiobooks.count()
 
 class CategorySerializer(serializers.ModelSerializer):
-    audiobooks_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'audiobooks_count']
-    
-    def get_audiobooks_count(self, obj):
-        return obj.audiobooks.count()
 
 class ChapterSerializer(serializers.ModelSerializer):
     duration_formatted = serializers.SerializerMethodField()
     audio_file = serializers.SerializerMethodField()  # ← Dodaj to
+    stream_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Chapter
-        fields = ['id', 'title', 'chapter_number', 'audio_file', 'duration_seconds', 'duration_formatted']
+        fields = ['id', 'title', 'chapter_number', 'audio_file', 'stream_url', 'duration_seconds', 'duration_formatted']
     
     def get_duration_formatted(self, obj):
         minutes = obj.duration_seconds // 60
@@ -75,14 +80,69 @@ class ChapterSerializer(serializers.ModelSerializer):
         return f"{minutes}:{seconds:02d}"
     
     def get_audio_file(self, obj):
-        if obj.audio_file:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.audio_file.url)
-            return obj.audio_file.url
+        # podpisany link (signing.py) - <audio> pobiera plik bez nagłówka Authorization
+        if not obj.audio_file:
+            return None
+
+        request = self.context.get('request')
+        user = request.user if request else None
+        if user is not None and user.is_authenticated:
+            user_id = user.pk
+        elif obj.audiobook.is_premium:
+            return None
+        else:
+            user_id = 0
+
+        url = signed_media_path(obj.audio_file.name, obj.pk, user_id)
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+    
+    def get_stream_url(self, obj):
+        # endpoint z obsługą Range - przewijanie nie pobiera pliku od początku
+        if not obj.audio_file:
+            return None
+        url = reverse('chapter-stream', kwargs={'pk': obj.pk})
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
+class AudiobookStateMixin:
+    """
+    Czyta wartości policzone przez AudiobookQuerySet.for_listing().
+    Jeśli obiekt nie pochodzi z adnotowanego querysetu, liczy je zapytaniem.
+    """
+
+    def _average_rating(self, obj):
+        avg = obj.avg_rating if hasattr(obj, 'avg_rating') else obj.average_rating
+        if avg is not None:
+            return round(avg, 1)
         return None
 
-class AudiobookListSerializer(serializers.ModelSerializer):
+    def _ratings_count(self, obj):
+        if hasattr(obj, 'num_ratings'):
+            return obj.num_ratings
+        return obj.rating_count
+
+    def _is_in_library(self, obj):
+        if hasattr(obj, 'in_library'):
+            return obj.in_library
+        request = self.context.get('request')
+        if request:
+            return get_entitlements(request).in_library(obj.pk)
+        return False
+
+    def _is_purchased(self, obj):
+        if hasattr(obj, 'purchased'):
+            return obj.purchased
+        request = self.context.get('request')
+        if request:
+            return get_entitlements(request).has_purchased(obj.pk)
+        return False
+
+
+class AudiobookListSerializer(AudiobookStateMixin, serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.name', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
     average_rating = serializers.SerializerMethodField()
@@ -98,26 +158,13 @@ class AudiobookListSerializer(serializers.ModelSerializer):
         ]
     
     def get_average_rating(self, obj):
-        ratings = obj.ratings.all()
-        if ratings:
-            return round(sum(r.rating for r in ratings) / len(ratings), 1)
-        return None
+        return self._average_rating(obj)
     
     def get_is_in_library(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return UserLibrary.objects.filter(user=request.user, audiobook=obj).exists()
-        return False
+        return self._is_in_library(obj)
     
     def get_is_purchased(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Purchase.objects.filter(
-                user=request.user, 
-                audiobook=obj,
-                payment_status='completed'
-            ).exists()
-        return False
+        return self._is_purchased(obj)
 
 
 class PurchaseSerializer(serializers.ModelSerializer):
@@ -134,12 +181,13 @@ class PurchaseSerializer(serializers.ModelSerializer):
         read_only_fields = ['user']
 
 
-class AudiobookDetailSerializer(serializers.ModelSerializer):
+class AudiobookDetailSerializer(AudiobookStateMixin, serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     chapters = ChapterSerializer(many=True, read_only=True)
     average_rating = serializers.SerializerMethodField()
     ratings_count = serializers.SerializerMethodField()
+    rating_histogram = serializers.ReadOnlyField()
     is_in_library = serializers.SerializerMethodField()
     user_progress = serializers.SerializerMethodField()
     
@@ -149,39 +197,29 @@ class AudiobookDetailSerializer(serializers.ModelSerializer):
             'id', 'title', 'description', 'author', 'category', 'narrator',
             'cover_image', 'duration_minutes', 'duration_formatted', 
             'publication_date', 'chapters', 'average_rating', 'ratings_count',
-            'is_in_library', 'user_progress'
+            'rating_histogram', 'is_in_library', 'user_progress'
         ]
     
     def get_average_rating(self, obj):
-        ratings = obj.ratings.all()
-        if ratings:
-            return round(sum(r.rating for r in ratings) / len(ratings), 1)
-        return None
+        return self._average_rating(obj)
     
     def get_ratings_count(self, obj):
-        return obj.ratings.count()
+        return self._ratings_count(obj)
     
     def get_is_in_library(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return UserLibrary.objects.filter(user=request.user, audiobook=obj).exists()
-        return False
+        return self._is_in_library(obj)
     
     def get_is_purchased(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Purchase.objects.filter(
-                user=request.user, 
-                audiobook=obj,
-                payment_status='completed'
-            ).exists()
-        return False
+        return self._is_purchased(obj)
     
     def get_user_progress(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             try:
-                progress = ListeningProgress.objects.get(user=request.user, audiobook=obj)
+                progress = ListeningProgress.objects.select_related('current_chapter').with_progress().get(
+                    user=request.user, audiobook=obj
+                )
+                progress_buffer.merge(progress)
                 return {
                     'current_chapter': progress.current_chapter.chapter_number,
                     'current_position_seconds': progress.current_position_seconds,
@@ -194,10 +232,42 @@ class AudiobookDetailSerializer(serializers.ModelSerializer):
 
 class UserLibrarySerializer(serializers.ModelSerializer):
     audiobook = AudiobookListSerializer(read_only=True)
+    progress_state = serializers.SerializerMethodField()
+    progress_percentage = serializers.SerializerMethodField()
     
     class Meta:
         model = UserLibrary
-        fields = ['id', 'audiobook', 'added_at', 'is_favorite']
+        fields = ['id', 'audiobook', 'added_at', 'is_favorite', 'progress_state', 'progress_percentage']
+
+    def to_representation(self, instance):
+        # adnotacje z UserLibraryQuerySet.with_shelf_state() trafiają na audiobook,
+        # gdzie czyta je AudiobookStateMixin
+        if hasattr(instance, 'audiobook_purchased'):
+            instance.audiobook.purchased = instance.audiobook_purchased
+            instance.audiobook.in_library = True
+        return super().to_representation(instance)
+
+    def _progress(self, obj):
+        if not hasattr(obj, '_progress_cache'):
+            obj._progress_cache = ListeningProgress.objects.filter(
+                user_id=obj.user_id,
+                audiobook_id=obj.audiobook_id
+            ).select_related('audiobook', 'current_chapter').first()
+        return obj._progress_cache
+
+    def get_progress_state(self, obj):
+        if hasattr(obj, 'progress_state'):
+            return obj.progress_state
+        progress = self._progress(obj)
+        if progress is None:
+            return UserLibrary.STATE_NOT_STARTED
+        return UserLibrary.STATE_COMPLETED if progress.is_completed else UserLibrary.STATE_LISTENING
+
+    def get_progress_percentage(self, obj):
+        if hasattr(obj, 'progress_value'):
+            return obj.progress_value
+        progress = self._progress(obj)
+        return progress.progress_percentage if progress else 0
 
 class ListeningProgressSerializer(serializers.ModelSerializer):
     audiobook_title = serializers.CharField(source='audiobook.title', read_only=True)
@@ -213,6 +283,9 @@ class ListeningProgressSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['user']
 
+    def to_representation(self, instance):
+        return super().to_representation(progress_buffer.merge(instance))
+
 class RatingSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
     audiobook_title = serializers.CharField(source='audiobook.title', read_only=True)
@@ -0,0 +1,20 @@
+# shared_cache.py - Cache współdzielony przez workery
+#
+# Tokeny Knox (authentication.py), uprawnienia (entitlements.py) i
+# generacje cache odpowiedzi (response_cache.py, conditional.py) są
+# unieważniane sygnałem w procesie, który zmienił dane. Przy cache lokalnym dla procesu (LocMemCache)
+# pozostałe workery o tym nie wiedzą i obsługują stare wpisy aż do TTL,
+# więc taki cache jest traktowany jak jego brak - chyba że
+# CACHE_ALLOW_PROCESS_LOCAL (jeden proces: runserver, testy).
+# Współdzielony backend wybiera CACHE_BACKEND w auth/settings.py.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def shared_cache(alias):
+    """Cache pod aliasem albo None, gdy jest lokalny dla procesu, a to niedozwolone."""
+    cache = caches[alias]
+    if isinstance(cache, LocMemCache) and not getattr(settings, 'CACHE_ALLOW_PROCESS_LOCAL', False):
+        return None
+    return cache
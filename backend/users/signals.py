@@ -0,0 +1,227 @@
+# signals.py - Utrzymywanie danych pochodnych przy zmianach modeli
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from knox.models import AuthToken
+
+from .models import Audiobook, Author, Category, Chapter, CustomUser, Purchase, Rating, UserLibrary
+from . import authentication, conditional, email_check, entitlements, hls, response_cache, search
+from .heartbeat import progress_buffer
+
+
+@receiver(post_save, sender=Audiobook)
+def index_audiobook(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        search.index_audiobook(instance, using)
+
+
+@receiver(post_delete, sender=Audiobook)
+def unindex_audiobook(sender, instance, using='default', **kwargs):
+    search.remove_audiobook(instance.pk, using)
+
+
+@receiver(post_save, sender=Author)
+def index_author(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        search.index_author(instance, using)
+
+
+@receiver(post_delete, sender=Author)
+def unindex_author(sender, instance, using='default', **kwargs):
+    search.remove_author(instance.pk, using)
+
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+def update_chapter_offsets(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        audiobook = Audiobook.objects.get(pk=instance.audiobook_id)
+    except Audiobook.DoesNotExist:
+        # rozdział usuwany kaskadowo razem z audiobookiem
+        return
+    audiobook.update_chapter_offsets()
+
+
+@receiver(post_save, sender=Chapter)
+def package_chapter_hls(sender, instance, raw=False, **kwargs):
+    if raw or not hls.is_enabled() or not instance.audio_file:
+        return
+    if instance.audio_file.name == instance.hls_source and instance.hls_status == 'ready':
+        return
+
+    instance.hls_status = 'pending'
+    Chapter.objects.filter(pk=instance.pk).update(hls_status='pending')
+    if hls.get_runner() == 'thread':
+        chapter_id = instance.pk
+        transaction.on_commit(lambda: hls.enqueue_chapter(chapter_id))
+
+
+@receiver(post_delete, sender=Chapter)
+def remove_chapter_hls(sender, instance, **kwargs):
+    hls.remove_chapter_hls(instance.pk)
+
+
+@receiver(post_delete, sender=Chapter)
+def forget_buffered_chapter(sender, instance, **kwargs):
+    # pozycja w usuniętym rozdziale nie zapisze się już nigdy
+    progress_buffer.forget_chapter(instance.pk)
+
+
+@receiver(post_delete, sender=Audiobook)
+def forget_buffered_audiobook(sender, instance, **kwargs):
+    progress_buffer.forget_audiobook(instance.pk)
+
+
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_save, sender=UserLibrary)
+@receiver(post_delete, sender=UserLibrary)
+def invalidate_entitlements(sender, instance, **kwargs):
+    entitlements.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Audiobook)
+@receiver(post_delete, sender=Audiobook)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_catalog_cache(sender, raw=False, **kwargs):
+    if raw:
+        return
+    response_cache.invalidate()
+
+
+@receiver(post_save, sender=Audiobook)
+@receiver(post_delete, sender=Audiobook)
+def bump_audiobook_version(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    conditional.bump_audiobook_versions([instance.pk])
+
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def bump_parent_audiobook_version(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    conditional.bump_audiobook_versions([instance.audiobook_id])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+def bump_related_audiobook_versions(sender, instance, raw=False, **kwargs):
+    # szczegóły audiobooka zawierają autora i kategorię
+    if raw:
+        return
+    conditional.bump_audiobook_versions(instance.audiobooks.values_list('pk', flat=True))
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    # stara ocena jest potrzebna, żeby po zmianie poprawić agregaty audiobooka
+    instance._previous_rating = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_rating = Rating.objects.filter(pk=instance.pk).values_list('audiobook_id', 'rating').first()
+
+
+@receiver(post_save, sender=Rating)
+def update_rating_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if previous == (instance.audiobook_id, instance.rating):
+        return
+    if previous is not None:
+        audiobook_id, score = previous
+        Audiobook.objects.filter(pk=audiobook_id).change_rating_stats(score, -1)
+    Audiobook.objects.filter(pk=instance.audiobook_id).change_rating_stats(instance.rating, 1)
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating_stats(sender, instance, **kwargs):
+    # przy kaskadowym usunięciu audiobooka update nie trafi w żaden wiersz
+    Audiobook.objects.filter(pk=instance.audiobook_id).change_rating_stats(instance.rating, -1)
+
+
+@receiver(pre_save, sender=Audiobook)
+def remember_previous_owners(sender, instance, raw=False, **kwargs):
+    # przy zmianie autora/kategorii licznik trzeba przenieść ze starego wiersza
+    instance._previous_owners = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_owners = Audiobook.objects.filter(pk=instance.pk).values_list('author_id', 'category_id').first()
+
+
+@receiver(post_save, sender=Audiobook)
+def update_audiobooks_counts(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_owners', None)
+    if created or previous is None:
+        previous = (None, None)
+    changed = {Author: [], Category: []}
+    for model, old_id, new_id in (
+        (Author, previous[0], instance.author_id),
+        (Category, previous[1], instance.category_id),
+    ):
+        if old_id == new_id:
+            continue
+        if old_id is not None:
+            model.objects.filter(pk=old_id).update(audiobooks_count=F('audiobooks_count') - 1)
+            changed[model].append(old_id)
+        model.objects.filter(pk=new_id).update(audiobooks_count=F('audiobooks_count') + 1)
+        changed[model].append(new_id)
+    bump_owner_audiobook_versions(changed[Author], changed[Category])
+
+
+@receiver(post_delete, sender=Audiobook)
+def decrement_audiobooks_counts(sender, instance, **kwargs):
+    # przy kaskadowym usunięciu autora/kategorii update nie trafi w żaden wiersz
+    Author.objects.filter(pk=instance.author_id).update(audiobooks_count=F('audiobooks_count') - 1)
+    Category.objects.filter(pk=instance.category_id).update(audiobooks_count=F('audiobooks_count') - 1)
+    bump_owner_audiobook_versions([instance.author_id], [instance.category_id])
+
+
+def bump_owner_audiobook_versions(author_ids, category_ids):
+    # audiobooks_count autora i kategorii jest w szczegółach każdego ich audiobooka
+    if not author_ids and not category_ids:
+        return
+    conditional.bump_audiobook_versions(
+        Audiobook.objects.filter(Q(author_id__in=author_ids) | Q(category_id__in=category_ids)).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=AuthToken)
+def invalidate_cached_token(sender, instance, **kwargs):
+    # LogoutView, LogoutAllView i sprzątanie wygasłych tokenów przez Knox
+    authentication.invalidate_token(instance.digest)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user_tokens(sender, instance, raw=False, **kwargs):
+    # dezaktywacja, zmiana hasła lub uprawnień - tokeny muszą przejść przez bazę
+    if raw:
+        return
+    authentication.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_email_check(sender, instance, raw=False, **kwargs):
+    # nowe lub usunięte konto; po zmianie adresu stary wpis wygaśnie po TTL
+    if raw:
+        return
+    email_check.invalidate(instance.email)
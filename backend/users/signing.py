@@ -0,0 +1,97 @@
+# signing.py - Podpisane, wygasające linki do plików audio
+#
+# Element <audio> nie wyśle nagłówka Authorization, więc zamiast tokenu Knox
+# link do rozdziału zawiera podpis HMAC-SHA256:
+#
+#   /stream/<nazwa pliku>?c=<chapter_id>&u=<user_id>&exp=<unix ts>&sig=<hex>
+#   sig = HMAC-SHA256(klucz celu, "<nazwa>\n<chapter_id>\n<user_id>\n<exp>")
+#   klucz celu = SHA256(salt + MEDIA_SIGNING_KEY)   (django.utils.crypto.salted_hmac)
+#
+# Linki /stream/ i tokeny /hls/ mają osobne sole (STREAM_SALT, HLS_SALT),
+# więc podpis jednego rodzaju nigdy nie przejdzie weryfikacji drugiego.
+# MEDIA_SIGNING_KEY jest wymagany - SECRET_KEY z repozytorium jest jawny.
+# Weryfikacja nie dotyka bazy (tylko HMAC i porównanie czasu), więc ten sam
+# podpis może sprawdzać CDN / serwer brzegowy znający klucz. `u=0` oznacza
+# link do darmowego audiobooka wygenerowany dla anonimowego użytkownika.
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+STREAM_SALT = 'users.signing.stream'
+HLS_SALT = 'users.signing.hls'
+
+
+def get_signing_key():
+    key = getattr(settings, 'MEDIA_SIGNING_KEY', '')
+    if not key:
+        raise ImproperlyConfigured('MEDIA_SIGNING_KEY is required to sign media links')
+    return key
+
+
+def get_signing_ttl():
+    return getattr(settings, 'MEDIA_SIGNING_TTL_SECONDS', 6 * 60 * 60)
+
+
+def expiry_for(now=None):
+    # wygaśnięcie zaokrąglone do okna TTL - w obrębie okna link jest ten sam,
+    # więc przeglądarka i CDN mogą go cache'ować; ważny od TTL do 2*TTL
+    ttl = get_signing_ttl()
+    now = int(now if now is not None else time.time())
+    return (now // ttl + 2) * ttl
+
+
+def media_signature(name, chapter_id, user_id, expires, salt=STREAM_SALT):
+    message = f'{name}\n{chapter_id}\n{user_id}\n{expires}'
+    return salted_hmac(salt, message, secret=get_signing_key(), algorithm='sha256').hexdigest()
+
+
+def signed_media_path(name, chapter_id, user_id, expires=None):
+    expires = expires or expiry_for()
+    query = urlencode({
+        'c': chapter_id,
+        'u': user_id,
+        'exp': expires,
+        'sig': media_signature(name, chapter_id, user_id, expires),
+    })
+    return f"{reverse('signed-chapter-audio', kwargs={'name': name})}?{query}"
+
+
+def hls_token(chapter_id, user_id, expires=None):
+    # token jest częścią ścieżki (/hls/<token>/...), bo względne adresy
+    # w playlistach HLS gubią query string
+    expires = expires or expiry_for()
+    signature = media_signature(f'hls/chapter_{chapter_id}', chapter_id, user_id, expires, salt=HLS_SALT)
+    return f'{chapter_id}-{user_id}-{expires}-{signature}'
+
+
+def verify_hls_token(token, now=None):
+    """Zwraca (chapter_id, user_id, expires) dla poprawnego tokenu, inaczej None."""
+    parts = token.split('-')
+    if len(parts) != 4:
+        return None
+    chapter_id, user_id, expires, signature = parts
+    if not verify_media_signature(
+        f'hls/chapter_{chapter_id}', chapter_id, user_id, expires, signature, now=now, salt=HLS_SALT
+    ):
+        return None
+    return int(chapter_id), int(user_id), int(expires)
+
+
+def verify_media_signature(name, chapter_id, user_id, expires, signature, now=None, salt=STREAM_SALT):
+    if not (chapter_id and user_id is not None and expires and signature):
+        return False
+    try:
+        expires_at = int(expires)
+    except (TypeError, ValueError):
+        return False
+
+    now = now if now is not None else time.time()
+    if expires_at < now:
+        return False
+
+    expected = media_signature(name, chapter_id, user_id, expires_at, salt=salt)
+    return constant_time_compare(expected, signature)
@@ -0,0 +1,203 @@
+# streaming.py - Wysyłanie plików audio z obsługą HTTP Range
+#
+# Odtwarzacz przy przewijaniu wysyła `Range: bytes=START-`, więc zamiast
+# całego pliku zwracamy 206 Partial Content z samym fragmentem. Odpowiedź
+# to FileResponse - pod gunicornem trafia do wsgi.file_wrapper, który
+# wysyła bajty przez sendfile() (od bieżącej pozycji pliku, Content-Length
+# bajtów), bez kopiowania przez Pythona.
+#
+# Przy MEDIA_DELIVERY_MODE = 'x-accel-redirect' / 'x-sendfile' Django tylko
+# sprawdza dostęp, a bajty (razem z Range) wysyła serwer przed aplikacją
+# (nginx / Apache mod_xsendfile) - patrz docs/media_delivery.md.
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+DELIVERY_DJANGO = 'django'
+DELIVERY_X_ACCEL_REDIRECT = 'x-accel-redirect'
+DELIVERY_X_SENDFILE = 'x-sendfile'
+DELIVERY_MODES = (DELIVERY_DJANGO, DELIVERY_X_ACCEL_REDIRECT, DELIVERY_X_SENDFILE)
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class RangedFile:
+    """Plik ograniczony do fragmentu [start, start + length)."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_validators(path):
+    stat = os.stat(path)
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    return stat.st_size, etag, int(stat.st_mtime)
+
+
+def parse_range(header, size):
+    """
+    Zwraca (start, end) włącznie dla pojedynczego zakresu, None gdy nagłówek
+    należy zignorować (brak, kilka zakresów, zła składnia) albo False, gdy
+    zakres jest poza plikiem (416).
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # bytes=-500 -> ostatnie 500 bajtów
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def get_delivery_mode():
+    mode = getattr(settings, 'MEDIA_DELIVERY_MODE', DELIVERY_DJANGO)
+    if mode not in DELIVERY_MODES:
+        raise ImproperlyConfigured(
+            f'MEDIA_DELIVERY_MODE must be one of {", ".join(DELIVERY_MODES)}, got {mode!r}'
+        )
+    return mode
+
+
+def accel_redirect_location(name):
+    prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+    return prefix.rstrip('/') + '/' + quote(name.replace(os.sep, '/'))
+
+
+def internal_redirect(name, path, cache_control='private', mode=None):
+    """
+    Odpowiedź bez treści z nagłówkiem dla serwera przed aplikacją:
+    nginx (X-Accel-Redirect, ścieżka względem MEDIA_ACCEL_REDIRECT_PREFIX)
+    albo Apache/lighttpd (X-Sendfile, ścieżka bezwzględna).
+    """
+    mode = mode or get_delivery_mode()
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    response = HttpResponse(content_type=content_type)
+    if mode == DELIVERY_X_ACCEL_REDIRECT:
+        response['X-Accel-Redirect'] = accel_redirect_location(name)
+    elif mode == DELIVERY_X_SENDFILE:
+        response['X-Sendfile'] = path
+    else:
+        raise ImproperlyConfigured(f'internal_redirect() does not support delivery mode {mode!r}')
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def deliver_file(request, name, path, cache_control='private'):
+    mode = get_delivery_mode()
+    if mode == DELIVERY_DJANGO:
+        return serve_file(request, path, cache_control=cache_control)
+    return internal_redirect(name, path, cache_control=cache_control, mode=mode)
+
+
+def serve_file(request, path, cache_control='private'):
+    size, etag, last_modified = file_validators(path)
+
+    validator_headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': cache_control,
+    }
+
+    if not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+        for header, value in validator_headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+    length = end - start + 1
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, status=status)
+    else:
+        response = FileResponse(
+            RangedFile(open(path, 'rb'), start, length),
+            content_type=content_type,
+            status=status
+        )
+
+    response['Content-Length'] = length
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response.block_size = STREAM_BLOCK_SIZE
+    for header, value in validator_headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,10 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class CheckEmailThrottle(SimpleRateThrottle):
+    # limit per adres IP, także dla zalogowanych - check-email/ pozwala
+    # sprawdzać istnienie kont, więc nie może służyć do ich masowego wyliczania
+    scope = 'check_email'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
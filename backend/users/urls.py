@@ -16,10 +16,15 @@ router.register('ratings', RatingViewSet, basename='ratings')
 router.register('purchases', PurchaseViewSet, basename='purchases')
 
 urlpatterns = router.urls + [
+    path('chapters/<int:pk>/stream/', stream_chapter_audio, name='chapter-stream'),
+    path('stream/<path:name>', signed_chapter_audio, name='signed-chapter-audio'),
+    path('hls/<str:token>/<path:name>', hls_media, name='hls-media'),
     path('check-email/', check_email_exists, name='check-email'),
     path('payments/create-intent/', create_payment_intent, name='create-payment-intent'),
     path('payments/confirm/', confirm_payment, name='confirm-payment'),
     path('payments/config/', get_stripe_config, name='stripe-config'),
+    path('payments/webhook/', stripe_webhook, name='stripe-webhook'),
     path('auth/google/', google_auth, name='google_auth'),
+    path('metrics/', request_metrics, name='request-metrics'),
     
 ]
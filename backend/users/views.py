@@ -5,22 +5,52 @@ from .models import *
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model, authenticate
 from knox.models import AuthToken
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, authentication_classes, throttle_classes
+from django.core.files.storage import default_storage
+import time
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+import json
+import os
+import posixpath
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Value, DecimalField
+from django.db.models.functions import Coalesce
+from .pagination import (
+    AudiobookCursorPagination, AuthorCursorPagination, CategoryCursorPagination,
+    RatingCursorPagination, PurchaseCursorPagination, UserLibraryCursorPagination,
+)
+from .search import search_audiobooks, search_authors
+from .heartbeat import FLUSH_ALL, FLUSH_ENTRY, progress_buffer
+from .entitlements import get_entitlements
+from .response_cache import cached_catalog_response
+from .conditional import conditional_response, progress_validator, library_validator, audiobook_validator
+from .streaming import deliver_file, get_delivery_mode
+from .signing import verify_media_signature, verify_hls_token, hls_token
+from .hls import chapter_hls_dir, MASTER_PLAYLIST
+from .metrics import registry as metrics_registry, serializer_data, SerializerMetricsMixin
+from .google_tokens import verify_google_token
+from .throttles import CheckEmailThrottle
+from .authentication import aauthenticate
+from . import payments
+from . import email_check
+from django.core.exceptions import SuspiciousFileOperation
+from django.urls import reverse
 import stripe
 from django.conf import settings
-from google.auth.transport import requests
-from google.oauth2 import id_token
 from google.auth.exceptions import GoogleAuthError
 from knox.models import AuthToken
 import logging
 
 User = get_user_model()
-stripe.api_key = settings.STRIPE_SECRET_KEY
 logger = logging.getLogger(__name__)
 class LoginViewset(viewsets.ViewSet):
     permission_classes = [permissions.AllowAny]
@@ -40,7 +70,7 @@ class LoginViewset(viewsets.ViewSet):
                 #'_, - crate tuple  
                 _, token = AuthToken.objects.create(user)
                 return Response({
-                    "user": UserSerializer(user).data,
+                    "user": serializer_data(UserSerializer(user)),
                     "token": token
 
                 }
@@ -60,7 +90,7 @@ class RegisterViewset(viewsets.ViewSet):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data)
+            return Response(serializer_data(serializer))
         else: 
             return Response(serializer.errors, status=400)
         
@@ -72,60 +102,100 @@ class UserViewset(viewsets.ViewSet):
     def list(self, request):
         queryset = User.objects.all()
         serializer = self.serializer_class(queryset, many=True)
-        return Response(serializer.data)
+        return Response(serializer_data(serializer))
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([CheckEmailThrottle])
 def check_email_exists(request):
-    print(f"Otrzymano request check_email: {request.data}")
     email = request.data.get('email')
-    if not email:
+    if not email or not isinstance(email, str):
         return Response({'error': 'Email is required'}, status=400)
-    
-    user_exists = User.objects.filter(email=email).exists()
-    print(f"Email {email} exists: {user_exists}")
+
+    user_exists, cached = email_check.email_exists(email)
+    email_check.log_check(email, user_exists, cached)
     return Response({'exists': user_exists})
 
 
-class AuthorViewSet(viewsets.ReadOnlyModelViewSet):
+def with_sort_price(queryset):
+    return queryset.annotate(
+        sort_price=Coalesce('price', Value(0), output_field=DecimalField(max_digits=6, decimal_places=2))
+    )
+
+
+def paginated_audiobooks(view, request, queryset):
+    paginator = AudiobookCursorPagination()
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    serializer = AudiobookListSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer_data(serializer))
+
+
+class AuthorViewSet(SerializerMetricsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = AuthorCursorPagination
     
     def get_queryset(self):
         queryset = Author.objects.all()
 
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | 
-                Q(bio__icontains=search)
-            )
+            queryset = search_authors(queryset, search)
         
         return queryset
+
+    @cached_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
+    @cached_catalog_response
     def audiobooks(self, request, pk=None):
         author = self.get_object()
-        audiobooks = author.audiobooks.all()
-        serializer = AudiobookListSerializer(audiobooks, many=True, context={'request': request})
-        return Response(serializer.data)
+        audiobooks = with_sort_price(author.audiobooks.for_listing(request.user))
+        return paginated_audiobooks(self, request, audiobooks)
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(SerializerMetricsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = CategoryCursorPagination
+
+    @cached_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
+    @cached_catalog_response
     def audiobooks(self, request, pk=None):
         category = self.get_object()
-        audiobooks = category.audiobooks.all()
-        serializer = AudiobookListSerializer(audiobooks, many=True, context={'request': request})
-        return Response(serializer.data)
+        audiobooks = with_sort_price(category.audiobooks.for_listing(request.user))
+        return paginated_audiobooks(self, request, audiobooks)
+
+def audiobook_access_error(request, audiobook):
+    # wspólne sprawdzenie dostępu do treści audiobooka premium
+    if not audiobook.is_premium:
+        return None
+
+    if not request.user.is_authenticated:
+        return Response(
+            {"error": "Zaloguj się, aby kupić ten audiobook"}, 
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    if not get_entitlements(request).has_purchased(audiobook.pk):
+        return Response(
+            {"error": f"Kup ten audiobook za {audiobook.price} PLN, aby uzyskać dostęp do rozdziałów"}, 
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return None
 
-class AudiobookViewSet(viewsets.ReadOnlyModelViewSet):
+
+class AudiobookViewSet(SerializerMetricsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Audiobook.objects.select_related('author', 'category').prefetch_related('chapters')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = AudiobookCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -133,7 +203,7 @@ class AudiobookViewSet(viewsets.ReadOnlyModelViewSet):
         return AudiobookListSerializer
     
     def get_queryset(self):
-        queryset = self.queryset
+        queryset = with_sort_price(self.queryset.for_listing(self.request.user))
 
         category = self.request.query_params.get('category')
         if category:
@@ -145,11 +215,7 @@ class AudiobookViewSet(viewsets.ReadOnlyModelViewSet):
 
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(author__name__icontains=search) |
-                Q(description__icontains=search)
-            )
+            queryset = search_audiobooks(queryset, search)
 
         free_only = self.request.query_params.get('free_only')
         if free_only == 'true':
@@ -159,58 +225,80 @@ class AudiobookViewSet(viewsets.ReadOnlyModelViewSet):
         if premium_only == 'true':
             queryset = queryset.filter(is_premium=True)
 
-        ordering = self.request.query_params.get('ordering', '-created_at')
-        if ordering in ['title', '-title', 'publication_date', '-publication_date', 'created_at', '-created_at', 'price', '-price']:
-            queryset = queryset.order_by(ordering)
-        
+        min_rating = self.request.query_params.get('min_rating')
+        if min_rating:
+            try:
+                queryset = queryset.filter(avg_rating__gte=float(min_rating))
+            except ValueError:
+                raise ValidationError({'min_rating': 'Podaj liczbę od 1 do 5'})
+
+        # sortowanie (?ordering=) i stronicowanie obsługuje AudiobookCursorPagination
         return queryset
+
+    @cached_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     def retrieve(self, request, *args, **kwargs):
+        # walidator z wersji audiobooka i stanu użytkownika - 304 bez zapytania o audiobook
+        return conditional_response(
+            request,
+            audiobook_validator(request.user, kwargs['pk']),
+            lambda: self.retrieve_audiobook(request)
+        )
+
+    def retrieve_audiobook(self, request):
         audiobook = self.get_object()
 
         if audiobook.is_premium and request.user.is_authenticated:
-            has_purchased = Purchase.objects.filter(
-                user=request.user, 
-                audiobook=audiobook,
-                payment_status='completed'
-            ).exists()
-            
-            if not has_purchased:
+            if not get_entitlements(request).has_purchased(audiobook.pk):
                 serializer = AudiobookListSerializer(audiobook, context={'request': request})
-                data = serializer.data
+                data = serializer_data(serializer)
                 data['access_denied'] = True
                 data['message'] = f"Ten audiobook kosztuje {audiobook.price} PLN. Kup go, aby uzyskać pełny dostęp."
                 return Response(data)
 
         serializer = self.get_serializer(audiobook)
-        return Response(serializer.data)
+        return Response(serializer_data(serializer))
     
     @action(detail=True, methods=['get'])
     def chapters(self, request, pk=None):
         audiobook = self.get_object()
 
-        if audiobook.is_premium:
-            if not request.user.is_authenticated:
-                return Response(
-                    {"error": "Zaloguj się, aby kupić ten audiobook"}, 
-                    status=status.HTTP_401_UNAUTHORIZED
-                )
-            
-            has_purchased = Purchase.objects.filter(
-                user=request.user, 
-                audiobook=audiobook,
-                payment_status='completed'
-            ).exists()
-            
-            if not has_purchased:
-                return Response(
-                    {"error": f"Kup ten audiobook za {audiobook.price} PLN, aby uzyskać dostęp do rozdziałów"}, 
-                    status=status.HTTP_403_FORBIDDEN
-                )
+        access_error = audiobook_access_error(request, audiobook)
+        if access_error:
+            return access_error
         
         chapters = audiobook.chapters.all()
         serializer = ChapterSerializer(chapters, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response(serializer_data(serializer))
+    
+    @action(detail=True, methods=['get'])
+    def playlists(self, request, pk=None):
+        # playlisty HLS (hls.py) - klient pobiera tylko odtwarzane segmenty
+        # w bitrate dopasowanym do łącza
+        audiobook = self.get_object()
+
+        access_error = audiobook_access_error(request, audiobook)
+        if access_error:
+            return access_error
+        
+        user_id = request.user.pk if request.user.is_authenticated else 0
+        playlists = []
+        for chapter in audiobook.chapters.all():
+            playlist_url = None
+            if chapter.hls_status == 'ready':
+                playlist_url = request.build_absolute_uri(reverse('hls-media', kwargs={
+                    'token': hls_token(chapter.pk, user_id),
+                    'name': MASTER_PLAYLIST,
+                }))
+            playlists.append({
+                'chapter_id': chapter.pk,
+                'chapter_number': chapter.chapter_number,
+                'hls_status': chapter.hls_status,
+                'playlist_url': playlist_url,
+            })
+        return Response(playlists)
     
     @action(detail=True, methods=['post'])
     def purchase(self, request, pk=None):
@@ -259,21 +347,41 @@ class AudiobookViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        purchases = Purchase.objects.filter(
-            user=request.user, 
-            payment_status='completed'
-        ).select_related('audiobook', 'audiobook__author')
+        audiobooks = Audiobook.objects.for_listing(request.user).filter(
+            purchases__user=request.user,
+            purchases__payment_status='completed'
+        ).order_by('-purchases__purchased_at')
         
-        audiobooks = [purchase.audiobook for purchase in purchases]
         serializer = AudiobookListSerializer(audiobooks, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response(serializer_data(serializer))
 
-class UserLibraryViewSet(viewsets.ModelViewSet):
+class UserLibraryViewSet(SerializerMetricsMixin, viewsets.ModelViewSet):
     serializer_class = UserLibrarySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserLibraryCursorPagination
     
     def get_queryset(self):
-        return UserLibrary.objects.filter(user=self.request.user).select_related('audiobook', 'audiobook__author')
+        return UserLibrary.objects.filter(user=self.request.user).with_shelf_state()
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            library_validator(request.user),
+            lambda: super(UserLibraryViewSet, self).list(request, *args, **kwargs)
+        )
+
+    def filter_queryset(self, queryset):
+        # ?state=listening,completed - kilka półek w jednym zapytaniu
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'favorites'):
+            return queryset
+        states = [state for state in self.request.query_params.get('state', '').split(',') if state]
+        invalid = set(states) - set(UserLibrary.STATES)
+        if invalid:
+            raise ValidationError({'state': f'Dozwolone wartości: {", ".join(UserLibrary.STATES)}'})
+        if states:
+            queryset = queryset.filter(progress_state__in=states)
+        return queryset
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -292,7 +400,7 @@ class UserLibraryViewSet(viewsets.ModelViewSet):
         
         if created:
             serializer = self.get_serializer(library_item)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(serializer_data(serializer), status=status.HTTP_201_CREATED)
         else:
             return Response({'message': 'Audiobook already in library'}, status=status.HTTP_200_OK)
     
@@ -308,59 +416,32 @@ class UserLibraryViewSet(viewsets.ModelViewSet):
             return Response({'message': 'Audiobook removed from library'}, status=status.HTTP_204_NO_CONTENT)
         except UserLibrary.DoesNotExist:
             return Response({'error': 'Audiobook not found in library'}, status=status.HTTP_404_NOT_FOUND)
+
+    def shelf_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer_data(serializer))
     
     @action(detail=False, methods=['get'])
     def favorites(self, request):
-        favorites = self.get_queryset().filter(is_favorite=True)
-        serializer = self.get_serializer(favorites, many=True)
-        return Response(serializer.data)
+        return self.shelf_response(self.filter_queryset(self.get_queryset()).filter(is_favorite=True))
     
     @action(detail=False, methods=['get'])
     def listening(self, request):
-        user_library = self.get_queryset()
-        listening_audiobooks = []
-        
-        for item in user_library:
-            try:
-                progress = ListeningProgress.objects.get(
-                    user=request.user, 
-                    audiobook=item.audiobook
-                )
-                if not progress.is_completed:
-                    listening_audiobooks.append(item)
-            except ListeningProgress.DoesNotExist:
-                pass
-                
-        serializer = self.get_serializer(listening_audiobooks, many=True)
-        return Response(serializer.data)
+        return self.shelf_response(self.get_queryset().filter(progress_state=UserLibrary.STATE_LISTENING))
     
     @action(detail=False, methods=['get'])
     def completed(self, request):
-        user_library = self.get_queryset()
-        completed_audiobooks = []
-        
-        for item in user_library:
-            try:
-                progress = ListeningProgress.objects.get(
-                    user=request.user, 
-                    audiobook=item.audiobook
-                )
-                if progress.is_completed:
-                    completed_audiobooks.append(item)
-            except ListeningProgress.DoesNotExist:
-                pass
-                
-        serializer = self.get_serializer(completed_audiobooks, many=True)
-        return Response(serializer.data)
+        return self.shelf_response(self.get_queryset().filter(progress_state=UserLibrary.STATE_COMPLETED))
 
-class ListeningProgressViewSet(viewsets.ModelViewSet):
+class ListeningProgressViewSet(SerializerMetricsMixin, viewsets.ModelViewSet):
     serializer_class = ListeningProgressSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         return ListeningProgress.objects.filter(user=self.request.user).select_related(
             'audiobook', 'current_chapter'
-        )
+        ).with_progress()
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -379,6 +460,7 @@ class ListeningProgressViewSet(viewsets.ModelViewSet):
         audiobook = get_object_or_404(Audiobook, id=audiobook_id)
         chapter = get_object_or_404(Chapter, id=chapter_id, audiobook=audiobook)
         
+        progress_buffer.discard(request.user.id, audiobook.id)
         progress, created = ListeningProgress.objects.update_or_create(
             user=request.user,
             audiobook=audiobook,
@@ -389,20 +471,61 @@ class ListeningProgressViewSet(viewsets.ModelViewSet):
         )
         
         serializer = self.get_serializer(progress)
-        return Response(serializer.data)
+        return Response(serializer_data(serializer))
+    
+    @action(detail=False, methods=['post'])
+    def heartbeat(self, request):
+        # lekka wersja update_progress dla odtwarzacza - pozycja trafia do
+        # bufora w pamięci i jest zapisywana do bazy zbiorczo (heartbeat.py)
+        audiobook_id = request.data.get('audiobook_id')
+        chapter_id = request.data.get('chapter_id')
+        position_seconds = request.data.get('position_seconds', 0)
+        
+        if not audiobook_id or not chapter_id:
+            return Response({
+                'error': 'audiobook_id and chapter_id are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            audiobook_id = int(audiobook_id)
+            chapter_id = int(chapter_id)
+            position_seconds = max(int(position_seconds), 0)
+        except (TypeError, ValueError):
+            return Response({
+                'error': 'audiobook_id, chapter_id and position_seconds must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not progress_buffer.chapter_belongs_to(chapter_id, audiobook_id):
+            return Response({'error': 'Chapter not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        due = progress_buffer.record(request.user.id, audiobook_id, chapter_id, position_seconds)
+        if due == FLUSH_ALL:
+            progress_buffer.flush()
+        elif due == FLUSH_ENTRY:
+            progress_buffer.flush(keys=[(request.user.id, audiobook_id)])
+        
+        return Response({
+            'audiobook_id': audiobook_id,
+            'chapter_id': chapter_id,
+            'position_seconds': position_seconds
+        }, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=False, methods=['get'])
     def currently_listening(self, request):
-        recent = self.get_queryset().filter(is_completed=False).order_by('-last_listened')[:5]
-        serializer = self.get_serializer(recent, many=True)
-        return Response(serializer.data)
+        def build_response():
+            recent = self.get_queryset().filter(is_completed=False).order_by('-last_listened')[:5]
+            serializer = self.get_serializer(recent, many=True)
+            return Response(serializer_data(serializer))
+
+        return conditional_response(request, progress_validator(request.user), build_response)
 
-class RatingViewSet(viewsets.ModelViewSet):
+class RatingViewSet(SerializerMetricsMixin, viewsets.ModelViewSet):
     serializer_class = RatingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RatingCursorPagination
     
     def get_queryset(self):
-        return Rating.objects.filter(user=self.request.user).select_related('audiobook')
+        return Rating.objects.filter(user=self.request.user).select_related('user', 'audiobook')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -413,13 +536,16 @@ class RatingViewSet(viewsets.ModelViewSet):
         if not audiobook_id:
             return Response({'error': 'audiobook_id parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        ratings = Rating.objects.filter(audiobook__id=audiobook_id).select_related('user')
+        ratings = self.paginate_queryset(
+            Rating.objects.filter(audiobook__id=audiobook_id).select_related('user', 'audiobook')
+        )
         serializer = self.get_serializer(ratings, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer_data(serializer))
     
-class PurchaseViewSet(viewsets.ReadOnlyModelViewSet):
+class PurchaseViewSet(SerializerMetricsMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = PurchaseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PurchaseCursorPagination
     
     def get_queryset(self):
         return Purchase.objects.filter(user=self.request.user).select_related(
@@ -428,15 +554,15 @@ class PurchaseViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def completed(self, request):
-        completed_purchases = self.get_queryset().filter(payment_status='completed')
+        completed_purchases = self.paginate_queryset(self.get_queryset().filter(payment_status='completed'))
         serializer = self.get_serializer(completed_purchases, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer_data(serializer))
     
     @action(detail=False, methods=['get'])
     def pending(self, request):
-        pending_purchases = self.get_queryset().filter(payment_status='pending')
+        pending_purchases = self.paginate_queryset(self.get_queryset().filter(payment_status='pending'))
         serializer = self.get_serializer(pending_purchases, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer_data(serializer))
     
     @action(detail=False, methods=['get'])
     def total_spent(self, request):
@@ -450,66 +576,216 @@ class PurchaseViewSet(viewsets.ReadOnlyModelViewSet):
             'currency': 'PLN'
         })
     
+async def token_user(request):
+    # widoki async omijają DRF (nie obsługuje async) - ten sam token Knox co w API
+    try:
+        result = await aauthenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@csrf_exempt
+@require_POST
+async def create_payment_intent(request):
+    user = await token_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Nie podano poprawnego tokenu'}, status=401)
+    data = json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'Nieprawidłowe dane'}, status=400)
+
+    try:
+        audiobook = await Audiobook.objects.aget(pk=int(data.get('audiobook_id')))
+    except (TypeError, ValueError, Audiobook.DoesNotExist):
+        return JsonResponse({'error': 'Nie znaleziono audiobooka'}, status=404)
+    if not audiobook.is_premium or not audiobook.price or audiobook.price <= 0:
+        return JsonResponse({'error': 'Ten audiobook nie jest płatny'}, status=400)
+
+    purchases = Purchase.objects.filter(user=user, audiobook=audiobook)
+    if await purchases.filter(payment_status='completed').aexists():
+        return JsonResponse({'error': 'Już kupiłeś ten audiobook'}, status=400)
+
+    try:
+        payment_intent = await payments.create_payment_intent(audiobook, user)
+    except stripe.StripeError as e:
+        logger.error(f"Stripe create_payment_intent failed: {e}")
+        return JsonResponse({'error': 'Nie udało się połączyć z systemem płatności'}, status=502)
+
+    # oczekujący zakup - webhook albo confirm_payment oznaczy go jako opłacony
+    pending = {'price_paid': audiobook.price, 'payment_id': payment_intent.id, 'payment_status': 'pending'}
+    if not await purchases.exclude(payment_status='completed').aupdate(**pending):
+        await Purchase.objects.aget_or_create(user=user, audiobook=audiobook, defaults=pending)
+
+    return JsonResponse({
+        'client_secret': payment_intent.client_secret,
+        'audiobook': {
+            'id': audiobook.id,
+            'title': audiobook.title,
+            'price': str(audiobook.price)
+        }
+    })
+
+@csrf_exempt
+@require_POST
+async def confirm_payment(request):
+    user = await token_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Nie podano poprawnego tokenu'}, status=401)
+    data = json_body(request)
+    payment_intent_id = data.get('payment_intent_id') if data else None
+    if not isinstance(payment_intent_id, str) or not payment_intent_id:
+        return JsonResponse({'error': 'payment_intent_id jest wymagany'}, status=400)
+
+    purchase = await Purchase.objects.filter(
+        user=user, payment_id=payment_intent_id, payment_status='completed'
+    ).select_related('audiobook').afirst()
+    if purchase is None:
+        # webhook jeszcze nie dotarł - stan płatności prosto ze Stripe
+        try:
+            payment_intent = (await payments.retrieve_payment_intent(payment_intent_id)).to_dict()
+        except stripe.InvalidRequestError:
+            return JsonResponse({'error': 'Płatność nieudana'}, status=400)
+        except stripe.StripeError as e:
+            logger.error(f"Stripe retrieve_payment_intent failed: {e}")
+            return JsonResponse({'error': 'Nie udało się połączyć z systemem płatności'}, status=502)
+
+        metadata = payment_intent.get('metadata') or {}
+        if payment_intent['status'] != 'succeeded' or metadata.get('user_id') != str(user.id):
+            return JsonResponse({'error': 'Płatność nieudana'}, status=400)
+        purchase = await sync_to_async(payments.finalize_payment)(payment_intent)
+        if purchase is None:
+            return JsonResponse({'error': 'Płatność nieudana'}, status=400)
+        purchase = await Purchase.objects.select_related('audiobook').aget(pk=purchase.pk)
+
+    return JsonResponse({'message': f'Zakupiono {purchase.audiobook.title}!'})
+
 @api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def create_payment_intent(request):
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def stripe_webhook(request):
+    # dostęp wynika z podpisu Stripe-Signature; tylko lokalna baza, bez wywołań do Stripe
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        logger.error("STRIPE_WEBHOOK_SECRET is not set - rejecting Stripe webhook")
+        return Response({'error': 'Webhook nie jest skonfigurowany'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
     try:
-        audiobook_id = request.data.get('audiobook_id')
-        audiobook = get_object_or_404(Audiobook, id=audiobook_id)
+        event = payments.verify_event(request.body, request.META.get('HTTP_STRIPE_SIGNATURE'))
+    except (ValueError, stripe.SignatureVerificationError):
+        return Response({'error': 'Nieprawidłowy podpis'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if Purchase.objects.filter(user=request.user, audiobook=audiobook).exists():
-            return Response({'error': 'Już kupiłeś ten audiobook'}, status=400)
-
-        payment_intent = stripe.PaymentIntent.create(
-            amount=int(float(audiobook.price) * 100),
-            currency='pln',
-            metadata={
-                'audiobook_id': str(audiobook.id),
-                'user_id': str(request.user.id)
-            }
+    processed = payments.handle_event(event)
+    return Response({'received': True, 'duplicate': not processed})
+
+class AudioPassthroughRenderer(BaseRenderer):
+    # stream_chapter_audio zwraca gotowy plik - renderer służy tylko temu,
+    # żeby negocjacja treści przyjęła nagłówek Accept elementu <audio>;
+    # odpowiedzi z błędem nadal wychodzą jako JSON
+    media_type = '*/*'
+    format = 'audio'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data, 'application/json', renderer_context)
+
+
+@api_view(['GET', 'HEAD'])
+@permission_classes([permissions.AllowAny])
+@renderer_classes([JSONRenderer, AudioPassthroughRenderer])
+def stream_chapter_audio(request, pk):
+    chapter = get_object_or_404(Chapter.objects.select_related('audiobook'), pk=pk)
+
+    access_error = audiobook_access_error(request, chapter.audiobook)
+    if access_error:
+        return access_error
+
+    if not chapter.audio_file:
+        raise Http404
+
+    try:
+        path = chapter.audio_file.path
+    except NotImplementedError:
+        # storage bez lokalnych ścieżek (np. S3) sam obsługuje Range
+        return HttpResponseRedirect(chapter.audio_file.url)
+
+    if get_delivery_mode() == 'django' and not os.path.exists(path):
+        raise Http404
+
+    cache_control = 'private' if chapter.audiobook.is_premium else 'public, max-age=86400'
+    return deliver_file(request, chapter.audio_file.name, path, cache_control=cache_control)
+
+@api_view(['GET', 'HEAD'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+@renderer_classes([JSONRenderer, AudioPassthroughRenderer])
+def signed_chapter_audio(request, name):
+    # dostęp wynika wyłącznie z podpisu linku (signing.py) - bez tokenu i bez bazy
+    params = request.query_params
+    if not verify_media_signature(name, params.get('c'), params.get('u'), params.get('exp'), params.get('sig')):
+        return Response(
+            {"error": "Link do pliku jest nieprawidłowy lub wygasł"},
+            status=status.HTTP_403_FORBIDDEN
         )
-        
-        return Response({
-            'client_secret': payment_intent.client_secret,
-            'audiobook': {
-                'id': audiobook.id, 
-                'title': audiobook.title,
-                'price': str(audiobook.price)
-            }
-        })
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def confirm_payment(request):
     try:
-        payment_intent_id = request.data.get('payment_intent_id')
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return HttpResponseRedirect(default_storage.url(name))
 
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-        
-        if payment_intent.status == 'succeeded':
-            audiobook_id = payment_intent.metadata['audiobook_id']
-            audiobook = get_object_or_404(Audiobook, id=audiobook_id)
-
-            Purchase.objects.create(
-                user=request.user,
-                audiobook=audiobook,
-                price_paid=audiobook.price,
-                payment_id=payment_intent_id,
-                payment_status='completed'
-            )
+    if get_delivery_mode() == 'django' and not os.path.exists(path):
+        raise Http404
 
-            UserLibrary.objects.get_or_create(
-                user=request.user,
-                audiobook=audiobook
-            )
-            
-            return Response({'message': f'Zakupiono {audiobook.title}!'})
-        
-        return Response({'error': 'Płatność nieudana'}, status=400)
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
+    max_age = max(int(params['exp']) - int(time.time()), 0)
+    visibility = 'public' if params['u'] == '0' else 'private'
+    return deliver_file(request, name, path, cache_control=f'{visibility}, max-age={max_age}')
+
+@api_view(['GET', 'HEAD'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+@renderer_classes([JSONRenderer, AudioPassthroughRenderer])
+def hls_media(request, token, name):
+    # playlisty i segmenty HLS - dostęp z tokenu w ścieżce, bez bazy
+    verified = verify_hls_token(token)
+    if verified is None:
+        return Response(
+            {"error": "Link do pliku jest nieprawidłowy lub wygasł"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    chapter_id, user_id, expires = verified
+
+    # token obejmuje tylko katalog swojego rozdziału
+    chapter_dir = chapter_hls_dir(chapter_id)
+    relative_name = posixpath.normpath(f'{chapter_dir}/{name}')
+    if not relative_name.startswith(chapter_dir + '/'):
+        raise Http404
+    try:
+        path = default_storage.path(relative_name)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    if get_delivery_mode() == 'django' and not os.path.isfile(path):
+        raise Http404
+
+    max_age = max(expires - int(time.time()), 0)
+    visibility = 'public' if user_id == 0 else 'private'
+    return deliver_file(request, relative_name, path, cache_control=f'{visibility}, max-age={max_age}')
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def request_metrics(request):
+    # liczniki RequestMetricsMiddleware w formacie tekstowym Prometheusa
+    return HttpResponse(
+        metrics_registry.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
@@ -531,12 +807,10 @@ def google_auth(request):
         )
     
     try:
-        idinfo = id_token.verify_oauth2_token(
-            token, 
-            requests.Request(), 
+        idinfo = verify_google_token(
+            token,
             settings.GOOGLE_CLIENT_ID,
             clock_skew_in_seconds=60
-            
         )
 
         if idinfo['aud'] != settings.GOOGLE_CLIENT_ID:
@@ -565,7 +839,7 @@ def google_auth(request):
 
         if not user:
             try:
-                user = User.objects.get(email=email)
+                user = User.objects.get_by_email(email)
                 user.google_id = google_id
                 user.profile_picture = profile_picture
                 user.save()
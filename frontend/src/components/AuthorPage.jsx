@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { useParams, useNavigate } from "react-router-dom";
-import AxiosInstance from "./AxiosInstance";
+import AxiosInstance, { fetchAllPages } from "./AxiosInstance";
 import {
   Play,
   User,
@@ -38,15 +38,15 @@ const AuthorPage = () => {
       const authorRes = await AxiosInstance.get(`authors/${id}/`);
       setAuthor(authorRes.data);
 
-      const audiobooksRes = await AxiosInstance.get(
+      const authorAudiobooks = await fetchAllPages(
         `authors/${id}/audiobooks/`
       );
-      setAudiobooks(audiobooksRes.data);
-      setFilteredAudiobooks(audiobooksRes.data);
+      setAudiobooks(authorAudiobooks);
+      setFilteredAudiobooks(authorAudiobooks);
 
       const uniqueCategories = [
         ...new Set(
-          audiobooksRes.data.map((book) => book.category_name).filter(Boolean)
+          authorAudiobooks.map((book) => book.category_name).filter(Boolean)
         ),
       ];
       setCategories(uniqueCategories);
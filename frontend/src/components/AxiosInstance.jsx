@@ -36,4 +36,17 @@ AxiosInstance.interceptors.response.use(
     }
 )
 
+// Listy z API są stronicowane kursorem ({results, next, previous}) -
+// pobiera kolejne strony aż do końca
+export const fetchAllPages = async (url) => {
+    const items = []
+    let next = url
+    while(next){
+        const response = await AxiosInstance.get(next)
+        items.push(...response.data.results)
+        next = response.data.next
+    }
+    return items
+}
+
 export default AxiosInstance;
\ No newline at end of file
@@ -43,11 +43,11 @@ const Home = () => {
         AxiosInstance.get("authors/"),
       ]);
 
-      setAudiobooks(audiobooksRes.data);
-      setAuthors(authorsRes.data);
+      setAudiobooks(audiobooksRes.data.results);
+      setAuthors(authorsRes.data.results);
 
-      if (audiobooksRes.data.length > 0) {
-        selectAudiobook(audiobooksRes.data[0]);
+      if (audiobooksRes.data.results.length > 0) {
+        selectAudiobook(audiobooksRes.data.results[0]);
       }
     } catch (error) {
       console.error("Error fetching data:", error);
@@ -63,7 +63,7 @@ const Search = () => {
 
       // Wyszukaj rozdziały w audiobookach
       const chaptersResults = [];
-      for (const audiobook of audiobooksRes.data) {
+      for (const audiobook of audiobooksRes.data.results) {
         try {
           const chaptersRes = await AxiosInstance.get(
             `audiobooks/${audiobook.id}/chapters/`
@@ -90,8 +90,8 @@ const Search = () => {
       }
 
       const newResults = {
-        audiobooks: audiobooksRes.data,
-        authors: authorsRes.data,
+        audiobooks: audiobooksRes.data.results,
+        authors: authorsRes.data.results,
         chapters: chaptersResults,
       };
 
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import AxiosInstance from "./AxiosInstance";
+import AxiosInstance, { fetchAllPages } from "./AxiosInstance";
 import { useAudioPlayer } from "./context/AudioPlayerContext";
 import {
   Play,
@@ -34,9 +34,9 @@ const YourLibrary = () => {
   const fetchLibrary = async () => {
     try {
       setLoading(true);
-      const response = await AxiosInstance.get("library/");
-      setLibraryItems(response.data);
-      setFilteredItems(response.data);
+      const items = await fetchAllPages("library/");
+      setLibraryItems(items);
+      setFilteredItems(items);
     } catch (error) {
       console.error("Error fetching library:", error);
       setError("Nie udało się pobrać biblioteki");
@@ -71,16 +71,14 @@ const YourLibrary = () => {
       case 0: // Wszystkie
         break;
       case 1: // Obecnie słuchane
-        // Tutaj możesz dodać logikę dla obecnie słuchanych
-        filtered = filtered.filter((item) => {
-          // Przykład: sprawdź czy to aktualnie odtwarzany audiobook
-          return (
-            currentTrack && currentTrack.audiobook_id === item.audiobook.id
-          );
-        });
+        filtered = filtered.filter(
+          (item) =>
+            item.progress_state === "listening" ||
+            (currentTrack && currentTrack.audiobook_id === item.audiobook.id)
+        );
         break;
       case 2: // Ukończone
-        // Logika dla ukończonych - potrzebujesz dodatkowego pola w API
+        filtered = filtered.filter((item) => item.progress_state === "completed");
         break;
       case 3: // Ulubione
         filtered = filtered.filter((item) => item.is_favorite);
@@ -2,6 +2,9 @@ import { rest } from "msw";
 
 const BASE_URL = "http://127.0.0.1:8000";
 
+// listy z API są stronicowane kursorem - jedna strona bez kolejnych
+const paginated = (results) => ({ results, next: null, previous: null });
+
 export const handlers = [
   // Auth endpoints
   rest.post(`${BASE_URL}/login/`, (req, res, ctx) => {
@@ -114,10 +117,10 @@ export const handlers = [
           book.title.toLowerCase().includes(search.toLowerCase()) ||
           book.author_name.toLowerCase().includes(search.toLowerCase())
       );
-      return res(ctx.status(200), ctx.json(filtered));
+      return res(ctx.status(200), ctx.json(paginated(filtered)));
     }
 
-    return res(ctx.status(200), ctx.json(audiobooks));
+    return res(ctx.status(200), ctx.json(paginated(audiobooks)));
   }),
 
   rest.get(`${BASE_URL}/audiobooks/:id/`, (req, res, ctx) => {
@@ -195,10 +198,10 @@ export const handlers = [
       const filtered = authors.filter((author) =>
         author.name.toLowerCase().includes(search.toLowerCase())
       );
-      return res(ctx.status(200), ctx.json(filtered));
+      return res(ctx.status(200), ctx.json(paginated(filtered)));
     }
 
-    return res(ctx.status(200), ctx.json(authors));
+    return res(ctx.status(200), ctx.json(paginated(authors)));
   }),
 
   rest.get(`${BASE_URL}/authors/:id/`, (req, res, ctx) => {
@@ -218,17 +221,19 @@ export const handlers = [
   rest.get(`${BASE_URL}/authors/:id/audiobooks/`, (req, res, ctx) => {
     return res(
       ctx.status(200),
-      ctx.json([
-        {
-          id: 1,
-          title: "Author Book 1",
-          category_name: "Fiction",
-          narrator: "Test Narrator",
-          duration_formatted: "5h 30m",
-          average_rating: 4.5,
-          cover_image: "/test-cover.jpg",
-        },
-      ])
+      ctx.json(
+        paginated([
+          {
+            id: 1,
+            title: "Author Book 1",
+            category_name: "Fiction",
+            narrator: "Test Narrator",
+            duration_formatted: "5h 30m",
+            average_rating: 4.5,
+            cover_image: "/test-cover.jpg",
+          },
+        ])
+      )
     );
   }),
 
@@ -236,24 +241,26 @@ export const handlers = [
   rest.get(`${BASE_URL}/library/`, (req, res, ctx) => {
     return res(
       ctx.status(200),
-      ctx.json([
-        {
-          id: 1,
-          audiobook: {
+      ctx.json(
+        paginated([
+          {
             id: 1,
-            title: "Library Book 1",
-            author: 1,
-            author_name: "Test Author",
-            narrator: "Test Narrator",
-            cover_image: "/test-cover.jpg",
-            category_name: "Fiction",
-            duration_formatted: "5h 30m",
-            average_rating: 4.5,
+            audiobook: {
+              id: 1,
+              title: "Library Book 1",
+              author: 1,
+              author_name: "Test Author",
+              narrator: "Test Narrator",
+              cover_image: "/test-cover.jpg",
+              category_name: "Fiction",
+              duration_formatted: "5h 30m",
+              average_rating: 4.5,
+            },
+            is_favorite: true,
+            added_date: "2024-01-01",
           },
-          is_favorite: true,
-          added_date: "2024-01-01",
-        },
-      ])
+        ])
+      )
     );
   }),
 